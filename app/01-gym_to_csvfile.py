@@ -50,14 +50,13 @@ def main():
 
     # Create simulation environment
     env = fmi_gym(parameter)
-    done = False
     state = env.reset()
 
     print("Start simulation")
     time.sleep(0.5)
 
-    while not done:
-        state, reward, done, info = env.step([])
+    # Simulate the whole episode (open loop, no actions)
+    env.rollout()
 
     print("Simulation complete.")
 
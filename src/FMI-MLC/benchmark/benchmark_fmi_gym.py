@@ -0,0 +1,194 @@
+"""
+FMI-MLC fmi_gym benchmark.
+
+Measures steps per second, reset latency, and peak memory of fmi_gym with the
+mock FMU for different episode lengths, observation counts, and data settings.
+The results are written to a JSON file, and compared to a previous result with
+--compare, e.g.:
+
+    python benchmark_fmi_gym.py --output new.json --compare baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+from functools import partial
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(root, '..'))
+
+from fmi_mlc import fmi_gym, mock_fmu, get_mock_parameter
+
+def get_cases(quick=False):
+    '''
+    Returns the benchmark cases.
+
+    Inputs
+    ------
+    quick (bool): Use a small set of short cases, default False.
+
+    Returns
+    -------
+    cases (list): Cases as dictionaries of days, n_outputs, store_data, and numpy_step.
+    '''
+    days = [7] if quick else [7, 90, 365]
+    outputs = [2, 17] if quick else [2, 17, 100]
+    cases = []
+    for d in days:
+        for n in outputs:
+            for store_data in [False, True]:
+                for numpy_step in [False, True]:
+                    cases.append({'days': d, 'n_outputs': n, 'store_data': store_data,
+                                  'numpy_step': numpy_step})
+    return cases
+
+def run_episode(env, actions):
+    '''
+    Run an episode.
+
+    Inputs
+    ------
+    env (fmi_gym): Environment.
+    actions (np.array): Actions, repeated if shorter than the episode.
+
+    Returns
+    -------
+    steps (int): Number of steps.
+    '''
+    env.reset()
+    done = False
+    steps = 0
+    while not done:
+        _, _, done, _ = env.step(actions[steps % len(actions)])
+        steps += 1
+    return steps
+
+def run_case(case, n_resets=5):
+    '''
+    Run a benchmark case.
+
+    Inputs
+    ------
+    case (dict): Case, see get_cases.
+    n_resets (int): Number of resets to measure the reset latency, default 5.
+
+    Returns
+    -------
+    result (dict): Case with steps, steps_per_s, reset_s, and peak_memory_mb.
+    '''
+    parameter = get_mock_parameter(n_outputs=case['n_outputs'],
+                                   fmu_final_time=case['days']*24*60*60,
+                                   store_data=case['store_data'],
+                                   numpy_step=case['numpy_step'],
+                                   info_data=None)
+    handler = partial(mock_fmu, n_outputs=case['n_outputs'])
+    actions = np.random.RandomState(0).uniform(-1, 1, (1000, 2))
+
+    # Steps per second
+    env = fmi_gym(parameter, pyfmi=handler)
+    env.reset()
+    st = time.perf_counter()
+    steps = run_episode(env, actions)
+    steps_per_s = steps / (time.perf_counter() - st)
+
+    # Reset latency
+    reset_s = []
+    for _ in range(n_resets):
+        st = time.perf_counter()
+        env.reset()
+        reset_s.append(time.perf_counter() - st)
+    env.close()
+
+    # Peak memory (separate run, tracemalloc slows down the steps)
+    tracemalloc.start()
+    env = fmi_gym(parameter, pyfmi=handler)
+    run_episode(env, actions)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    env.close()
+
+    result = dict(case)
+    result.update({'steps': steps, 'steps_per_s': steps_per_s,
+                   'reset_s': float(np.median(reset_s)), 'peak_memory_mb': peak / 1e6})
+    return result
+
+def get_key(result):
+    ''' returns the key of a case '''
+    return (result['days'], result['n_outputs'], result['store_data'], result['numpy_step'])
+
+def compare(results, baseline, threshold=0.2):
+    '''
+    Compare results to a baseline.
+
+    Inputs
+    ------
+    results (list): Results, see run_case.
+    baseline (list): Results of the baseline.
+    threshold (float): Relative change which is reported as regression, default 0.2.
+
+    Returns
+    -------
+    comparison (pd.DataFrame): Ratio of results to baseline, and regression flag.
+    '''
+    baseline = {get_key(r): r for r in baseline}
+    rows = []
+    for r in results:
+        b = baseline.get(get_key(r))
+        if b is None:
+            continue
+        row = dict(zip(['days', 'n_outputs', 'store_data', 'numpy_step'], get_key(r)))
+        row['steps_per_s'] = r['steps_per_s'] / b['steps_per_s']
+        row['reset_s'] = r['reset_s'] / b['reset_s']
+        row['peak_memory_mb'] = r['peak_memory_mb'] / b['peak_memory_mb']
+        row['regression'] = row['steps_per_s'] < 1 - threshold \
+            or row['reset_s'] > 1 + threshold or row['peak_memory_mb'] > 1 + threshold
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark of fmi_gym with a mock FMU.')
+    parser.add_argument('--output', default='benchmark_fmi_gym.json',
+                        help='Path of the JSON result file.')
+    parser.add_argument('--compare', default=None, help='Path of a baseline JSON result file.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative change reported as regression.')
+    parser.add_argument('--quick', action='store_true', help='Run a small set of cases.')
+    args = parser.parse_args(args)
+
+    results = []
+    for case in get_cases(quick=args.quick):
+        result = run_case(case)
+        print('{days:>4} days, {n_outputs:>3} outputs, store_data={store_data!s:<5}, ' \
+              'numpy_step={numpy_step!s:<5}: {steps_per_s:>9.0f} steps/s, ' \
+              '{reset_s:.4f} s/reset, {peak_memory_mb:.1f} MB'.format(**result))
+        results.append(result)
+
+    import fmi_mlc
+    output = {'meta': {'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'fmi_mlc': fmi_mlc.__version__,
+                       'numpy': np.__version__,
+                       'pandas': pd.__version__},
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+        comparison = compare(results, baseline, threshold=args.threshold)
+        print(comparison.to_string(index=False))
+        if comparison['regression'].any():
+            print('WARNING: Performance regression above {:.0%}.'.format(args.threshold))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
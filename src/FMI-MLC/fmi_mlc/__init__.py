@@ -4,5 +4,16 @@ This is the FMI-MLC main module.
 
 from .fmi_gym import *
 from .fmi_gym_parameter import *
+from .fmi_gym_data import *
+from .fmi_gym_vec import *
+from .fmi_gym_cache import *
+from .fmi_gym_schedule import *
+from .fmi_gym_sink import *
+from .fmi_gym_profiler import *
+from .fmi_gym_feed import *
+from .fmi_gym_mock import *
+from .fmi_gym_surrogate import *
+from .fmi_gym_sweep import *
+from .fmi_gym_shard import *
 
 __version__ = "1.0.0"
@@ -4,6 +4,13 @@ FMI-MLC main module.
 
 import os
 import sys
+import copy
+import pickle
+import asyncio
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
 import gym
 import numpy as np
 import pandas as pd
@@ -14,6 +21,38 @@ except:
     root = os.getcwd()
 sys.path.append(root)
 from fmi_gym_parameter import get_default_parameter
+from fmi_gym_data import data_store, episode_store, lazy_info
+from fmi_gym_cache import disk_cache, file_hash, hash_object, normalize, extract_fmu
+from fmi_gym_sink import data_sink
+from fmi_gym_profiler import step_profiler
+from fmi_gym_feed import state_feed
+
+cwd_lock = threading.RLock()
+
+# Times of the episode which are saved with a checkpoint (shifted by "ignore_reset")
+CHECKPOINT_TIMES = ['fmu_start_time', 'fmu_warmup_time', 'fmu_final_time']
+
+@contextmanager
+def working_directory(path):
+    '''
+    Context to change the working directory of the process. All changes are
+    serialized with a process-wide lock, e.g. for fmi_gym instances in threads.
+
+    Inputs
+    ------
+    path (str): Working directory, created if missing. None keeps the current directory.
+    '''
+    if not path:
+        yield
+        return
+    with cwd_lock:
+        cwd = os.getcwd()
+        os.makedirs(path, exist_ok=True)
+        os.chdir(path)
+        try:
+            yield
+        finally:
+            os.chdir(cwd)
 
 class fmi_gym(gym.Env):
     '''Wrapper class for FMI-MLC'''
@@ -34,14 +73,72 @@ class fmi_gym(gym.Env):
         self.parameter.update(parameter)
         self.init = True
 
+        # Resolve paths, since fmu_work_dir changes the working directory of the
+        # process while other instances (threads) may access their files
+        self.fmu_path = os.path.abspath(self.parameter['fmu_path'])
+        for k in ['fmu_work_dir', 'fmu_warmup_cache', 'rollout_cache', 'store_all_data_path',
+                  'checkpoint_path', 'store_sink']:
+            if self.parameter[k]:
+                self.parameter[k] = os.path.abspath(self.parameter[k])
+
         # Parse Configuration
         self.seed_int = self.parameter['seed']
-        self.precision = eval('np.{}'.format(self.parameter['precision']))
-        self.parameter['fmu_observation_names'] = list(set(self.parameter['observation_names']) \
-            - set(self.parameter['external_observations'].keys()))
+        self.precision = np.dtype(self.parameter['precision']).type
+        self.compact = self.parameter['compact_data']
+        self.parameter['fmu_observation_names'] = [n for n in self.parameter['observation_names'] \
+            if n not in self.parameter['external_observations']]
+        self.fmu_output_names = list(dict.fromkeys(self.parameter['fmu_observation_names'] \
+            + self.parameter['hidden_observation_names'] + self.parameter['reward_names'] \
+            + self.parameter['record_names']))
+        self.output_sampling = self.get_output_sampling()
+        self.inputs_map = {v:k for k,v in self.parameter['inputs_map'].items()}
+        self.hidden_input_names = set(self.parameter['hidden_input_names'])
+        self.input_refs = None
+        self.output_refs = None
+        self.snapshot = None
+        self.snapshot_supported = None
+        self.serialize_supported = None
+        self.warmup_key = None
+        if self.parameter['fmu_warmup_cache']:
+            self.warmup_cache = disk_cache(self.parameter['fmu_warmup_cache'],
+                                           max_size=self.parameter['fmu_warmup_cache_size'])
+        else:
+            self.warmup_cache = None
+        if self.parameter['rollout_cache']:
+            self.rollout_cache = disk_cache(self.parameter['rollout_cache'],
+                                            max_size=self.parameter['rollout_cache_size'])
+        else:
+            self.rollout_cache = None
         self.fmu_time = 0
-        self.data = pd.DataFrame()
-        self.data_all = []
+        if self.parameter['profile']:
+            self.profiler = step_profiler(log_interval=self.parameter['profile_log_interval'],
+                                          count_allocations=self.parameter['profile_allocations'])
+        else:
+            self.profiler = None
+        self.profile_start = None
+        self.async_lock = threading.Lock()
+        self.store = data_store()
+        self.data_all = episode_store(max_episodes=self.parameter['store_all_data_max'],
+                                      path=self.parameter['store_all_data_path'])
+        self.episode = 0
+        if self.parameter['store_sink']:
+            self.sink = data_sink(self.parameter['store_sink'],
+                                  fmt=self.parameter['store_sink_format'],
+                                  int_columns=['episode', 'time'] if self.compact \
+                                      else ['episode'])
+            if self.parameter['store_all_data']:
+                print('WARNING: Disabling "store_all_data" as "store_sink" is set.')
+                self.parameter['store_all_data'] = False
+        else:
+            self.sink = None
+        self.feed = None
+        self.checkpoint_next = None
+        self.checkpoint_time = []
+        self.checkpoint_actions = []
+        if self.parameter['checkpoint_path'] and self.sink and self.sink.fmt != 'parquet':
+            print('WARNING: Disabling "checkpoint_path" as it requires a "store_sink" ' \
+                  'of format "parquet".')
+            self.parameter['checkpoint_path'] = None
         self.fmu_loaded = False
         self.fmu = None
 
@@ -78,6 +175,16 @@ class fmi_gym(gym.Env):
         else:
             self.use_fmu = False
 
+        # Use NumPy step (without pd.DataFrame)
+        self.numpy_step = self.parameter['numpy_step']
+        if self.numpy_step and not self.array_processors():
+            print('WARNING: Disabling "numpy_step" as "preprocessor" or ' \
+                  '"postprocessor" requires pd.DataFrame (see #classC for NumPy arrays).')
+            self.numpy_step = False
+        self.row = None
+        self.processor_buffers = {}
+        self.setup_numpy_step()
+
         self.action_space = gym.spaces.Box(low=self.parameter['action_min'],
                                            high=self.parameter['action_max'],
                                            shape=(len(self.parameter['action_names']), ),
@@ -99,7 +206,18 @@ class fmi_gym(gym.Env):
         if self.parameter['reset_on_init']:
             self.state = self.reset()
         else:
-            self.state = np.array([np.nan]*len(self.parameter['observation_names']))
+            self.state = np.array([np.nan]*len(self.parameter['observation_names']),
+                                  dtype=self.precision if self.compact else None)
+
+    @property
+    def data(self):
+        ''' recorded data, see data_store.to_frame '''
+        return self.store.to_frame()
+
+    @data.setter
+    def data(self, data):
+        self.store.clear()
+        self.store.append(data)
 
     def setup_pyfmi(self, pyfmi):
         '''
@@ -109,6 +227,7 @@ class fmi_gym(gym.Env):
         ------
         pyfmi (fun): Hander for fmu evaluation.
         '''
+        self.use_pyfmi = pyfmi is None
         if pyfmi != None:
             self.load_fmu = pyfmi
         else:
@@ -119,6 +238,182 @@ class fmi_gym(gym.Env):
                 print('ERROR: The "pyfmi" package was not found. Please install.')
                 raise e
 
+    @staticmethod
+    def is_array_processor(processor):
+        ''' True if the processor implements the array protocol (#classC) '''
+        return hasattr(processor, 'do_calc_array')
+
+    def array_processors(self):
+        ''' True if the preprocessor and postprocessor (if any) use the array protocol '''
+        return all(self.is_array_processor(p) for p in \
+            [self.preprocessor, self.postprocessor] if p)
+
+    def setup_numpy_step(self):
+        '''
+        Setup the row layout for the NumPy step and rollout. The row holds the
+        actions, preprocessor outputs, FMU outputs, external observations,
+        postprocessor outputs, and the reward; the time is stored separately.
+        The layout is not available with pd.DataFrame processors.
+        '''
+        if not self.array_processors():
+            return
+        pre_names = self.preprocessor.output_names if self.preprocessor else []
+        post_names = self.postprocessor.output_names if self.postprocessor else []
+
+        # Inputs (actions and preprocessor outputs)
+        action_names = self.parameter['action_names']
+        input_columns = list(action_names)
+        input_columns += [n for n in pre_names if n not in input_columns and n != 'reward']
+        self.fmu_input_names = []
+        input_index = []
+        for i, name in enumerate(input_columns):
+            name = self.inputs_map.get(name, name)
+            if name not in self.hidden_input_names:
+                self.fmu_input_names.append(name)
+                input_index.append(i)
+
+        # Row layout
+        output_names = self.fmu_output_names if self.use_fmu else []
+        self.row_columns = list(input_columns)
+        self.row_columns += [n for n in output_names if n not in self.row_columns]
+        self.row_columns += [n for n in self.parameter['external_observations'].keys() \
+            if n not in self.row_columns]
+        self.row_columns += [n for n in post_names if n not in self.row_columns \
+            and n != 'reward']
+        self.row_columns += ['reward']
+        column_index = {c:i for i, c in enumerate(self.row_columns)}
+        self.row = np.full(len(self.row_columns), np.nan)
+        for n, v in self.parameter['external_observations'].items():
+            self.row[column_index[n]] = v
+        self.reward_from_row = 'reward' in pre_names + post_names
+
+        # Processor buffers
+        self.processor_buffers = {}
+        for name in ['preprocessor', 'postprocessor', 'stateprocessor']:
+            processor = getattr(self, name)
+            if self.is_array_processor(processor):
+                self.processor_buffers[name] = self.setup_array_processor( \
+                    processor, column_index, outputs=name != 'stateprocessor')
+
+        # Indices
+        self.row_index = {
+            'action': slice(0, len(action_names)),
+            'input': np.array(input_index, dtype=int),
+            'output': np.array([column_index[n] for n in output_names], dtype=int),
+            'observation': np.array([column_index[n] for n in \
+                self.parameter['observation_names']], dtype=int),
+            'reward': np.array([column_index[n] for n in \
+                self.parameter['reward_names']], dtype=int),
+            }
+
+    def setup_array_processor(self, processor, column_index, outputs=True):
+        '''
+        Setup the buffers of a processor with the array protocol (#classC).
+
+        Inputs
+        ------
+        processor (#classC): Processor with input_names and output_names.
+        column_index (dict): Index of the columns in the row.
+        outputs (bool): The outputs are columns of the row, default True.
+
+        Returns
+        -------
+        buffers (dict): Row indices and preallocated arrays of inputs and outputs.
+        '''
+        missing = [n for n in processor.input_names if n != 'time' and n not in column_index]
+        if missing:
+            print('ERROR: The inputs {} of "{}" are not in the data.'.format(missing,
+                type(processor).__name__))
+            raise KeyError(missing[0])
+        buffers = {
+            'input': np.array([column_index.get(n, 0) for n in processor.input_names],
+                              dtype=int),
+            'time': [i for i, n in enumerate(processor.input_names) if n == 'time'],
+            'inputs': np.empty(len(processor.input_names)),
+            }
+        if outputs:
+            buffers['output'] = np.array([column_index[n] for n in processor.output_names],
+                                         dtype=int)
+            buffers['outputs'] = np.empty(len(processor.output_names))
+        return buffers
+
+    def run_array_processor(self, name, time):
+        '''
+        Evaluate the preprocessor or postprocessor with the array protocol on the row.
+        The outputs are initialized with the values of the row.
+
+        Inputs
+        ------
+        name (str): Name of the processor, 'preprocessor' or 'postprocessor'.
+        time (float): Time at the end of the step, in seconds.
+        '''
+        buffers = self.processor_buffers[name]
+        np.take(self.row, buffers['input'], out=buffers['inputs'])
+        for i in buffers['time']:
+            buffers['inputs'][i] = time
+        np.take(self.row, buffers['output'], out=buffers['outputs'])
+        getattr(self, name).do_calc_array(buffers['inputs'], buffers['outputs'], self.init)
+        self.row[buffers['output']] = buffers['outputs']
+
+    def call_processor(self, processor, data):
+        '''
+        Evaluate a preprocessor or postprocessor with pd.DataFrame. Processors with
+        the array protocol (#classC) are evaluated row by row; missing inputs are NaN.
+
+        Inputs
+        ------
+        processor (#classA or #classC): Processor.
+        data (pd.DataFrame): Data of the step.
+
+        Returns
+        -------
+        data (pd.DataFrame): Processed data.
+        '''
+        if not self.is_array_processor(processor):
+            return processor.do_calc(data, self.init)
+        for n in processor.output_names:
+            if n not in data.columns:
+                data[n] = np.nan
+        inputs = data.reindex(columns=processor.input_names).to_numpy(dtype=np.float64,
+                                                                      copy=True)
+        outputs = data[processor.output_names].to_numpy(dtype=np.float64, copy=True)
+        for k in range(len(data)):
+            processor.do_calc_array(inputs[k], outputs[k], self.init)
+        data[processor.output_names] = outputs
+        return data
+
+    def process_state(self, state, data=None):
+        '''
+        Evaluate the stateprocessor. A stateprocessor with the array protocol (#classC)
+        reads its inputs from the row, or from data if given, and returns its outputs.
+
+        Inputs
+        ------
+        state (np.array): Observations.
+        data (pd.DataFrame): Data of the step, default None (use the row).
+
+        Returns
+        -------
+        state (np.array): Processed state.
+        '''
+        processor = self.stateprocessor
+        if not processor:
+            return state
+        if not self.is_array_processor(processor):
+            return processor.do_calc(state, self.init)
+        if data is None:
+            buffers = self.processor_buffers['stateprocessor']
+            inputs = buffers['inputs']
+            np.take(self.row, buffers['input'], out=inputs)
+            for i in buffers['time']:
+                inputs[i] = self.fmu_time
+        else:
+            inputs = data.reindex(columns=processor.input_names).to_numpy(dtype=np.float64,
+                                                                          copy=True)[0]
+        outputs = np.full(len(processor.output_names), np.nan)
+        processor.do_calc_array(inputs, outputs, self.init)
+        return self.record_values(outputs)
+
     def configure_fmu(self):
         '''
         Load and setup the FMU.
@@ -128,40 +423,205 @@ class fmi_gym(gym.Env):
         ext_param (dict): External parameter outside of this class.
         start_time (float): Start time of the model, in sceonds.
         '''
-        # Load FMU
-        self.fmu = self.load_fmu(self.parameter['fmu_path'],
-                                 log_level=self.parameter['fmu_loglevel'],
-                                 kind=self.parameter['fmu_kind'])
-
-        # Parameterize FMU
-        param = self.parameter['fmu_param']
-        param.update(self.parameter['inputs'])
-        if param != {}:
-            self.fmu.set(list(param.keys()), list(param.values()))
-
-        # Initizlaize FMU
-        self.fmu.setup_experiment(start_time=self.parameter['fmu_start_time'],
-                                  stop_time=self.parameter['fmu_final_time'],
-                                  stop_time_defined=False,
-                                  tolerance=self.parameter['fmu_tolerance'])
-        self.fmu.initialize()
+        fmu_path = self.fmu_path
+        kwargs = {}
+        if self.parameter['fmu_extract_cache'] and self.use_pyfmi:
+            fmu_path = extract_fmu(fmu_path)
+            kwargs['allow_unzipped_fmu'] = True
+        with working_directory(self.parameter['fmu_work_dir']):
+            # Load FMU (unless the instance was reset with reset_fmu)
+            if self.fmu is None:
+                self.fmu = self.load_fmu(fmu_path,
+                                         log_level=self.parameter['fmu_loglevel'],
+                                         kind=self.parameter['fmu_kind'],
+                                         **kwargs)
+
+            # Parameterize FMU
+            param = self.parameter['fmu_param']
+            param.update(self.parameter['inputs'])
+            if param != {}:
+                self.fmu.set(list(param.keys()), list(param.values()))
+
+            # Initizlaize FMU
+            self.fmu.setup_experiment(start_time=self.parameter['fmu_start_time'],
+                                      stop_time=self.parameter['fmu_final_time'],
+                                      stop_time_defined=False,
+                                      tolerance=self.parameter['fmu_tolerance'])
+            self.fmu.initialize()
         self.fmu_loaded = True
 
+        # Resolve value references
+        self.input_refs = None
+        self.output_refs = self.get_value_references(self.fmu_output_names)
+        if self.row is not None:
+            self.input_refs = self.get_value_references(self.fmu_input_names)
+
+    def reset_fmu(self):
+        '''
+        Reset the loaded FMU instance for reuse instead of terminating it,
+        see parameter "fmu_reuse_instance". The instance is initialized again
+        with configure_fmu.
+
+        Returns
+        -------
+        reset (bool): True if the FMU instance was reset.
+        '''
+        if not self.parameter['fmu_reuse_instance'] or not self.fmu_loaded:
+            return False
+        self.free_snapshot()
+        try:
+            with working_directory(self.parameter['fmu_work_dir']):
+                self.fmu.reset()
+        except Exception as e:
+            print('WARNING: The FMU instance cannot be reset ({}). ' \
+                  '"fmu_reuse_instance" is disabled.'.format(e))
+            self.parameter['fmu_reuse_instance'] = False
+            return False
+        self.fmu_loaded = False
+        return True
+
+    def get_value_references(self, names):
+        '''
+        Resolve FMU variable names to value references.
+
+        Inputs
+        ------
+        names (list): Names of the FMU variables.
+
+        Returns
+        -------
+        refs (dict): Names (tuple), value references (np.array), and the last values
+                     set (np.array). None if the handler does not support value references,
+                     not all variables are of type real, or a variable has no reference
+                     (KeyError, e.g. inputs ignored by rc_fmu).
+        '''
+        try:
+            if any(self.fmu.get_variable_data_type(n) != 0 for n in names):
+                return None
+            refs = np.array([self.fmu.get_variable_valueref(n) for n in names], dtype=np.uint32)
+        except (AttributeError, KeyError):
+            return None
+        return {'names': tuple(names),
+                'refs': refs,
+                'values': np.full(len(names), np.nan)}
+
+    def set_inputs(self, names, values):
+        '''
+        Set the FMU inputs. Value references are used if available, and only values
+        changed since the last call are set.
+
+        Inputs
+        ------
+        names (list): Names of the FMU inputs.
+        values (np.array): Values of the FMU inputs.
+        '''
+        if self.input_refs is None or self.input_refs['names'] != tuple(names):
+            self.input_refs = self.get_value_references(names)
+            if self.input_refs is None:
+                self.input_refs = {'names': tuple(names), 'refs': None}
+        refs = self.input_refs['refs']
+        if refs is None:
+            for i in range(len(values)):
+                self.fmu.set(names[i], values[i])
+            return
+        try:
+            values = np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            self.input_refs['refs'] = None
+            self.set_inputs(names, values)
+            return
+        changed = values != self.input_refs['values']
+        if changed.all():
+            self.fmu.set_real(refs, values)
+        elif changed.any():
+            self.fmu.set_real(refs[changed], values[changed])
+        self.input_refs['values'][:] = values
+
+    def get_output_sampling(self):
+        '''
+        Setup the sampling of FMU outputs, see parameter "output_sampling".
+
+        Returns
+        -------
+        sampling (dict): Indices of the outputs fetched on every step ('always'), and
+                         interval and indices of the sampled outputs ('groups'). None
+                         if all outputs are fetched on every step.
+        '''
+        always = set(self.parameter['observation_names'] + self.parameter['reward_names'])
+        groups = {}
+        for name, interval in self.parameter['output_sampling'].items():
+            if name not in self.fmu_output_names:
+                print('WARNING: "{}" of "output_sampling" is not an FMU output.'.format(name))
+            elif name in always:
+                print('WARNING: "{}" of "output_sampling" is an observation or reward ' \
+                      'and fetched on every step.'.format(name))
+            elif interval:
+                groups.setdefault(interval, []).append(self.fmu_output_names.index(name))
+        if not groups:
+            return None
+        sampled = set(i for index in groups.values() for i in index)
+        return {'always': np.array([i for i in range(len(self.fmu_output_names)) \
+                                    if i not in sampled], dtype=int),
+                'groups': [(k, np.array(v, dtype=int)) for k, v in groups.items()]}
+
+    def is_due(self, time, interval):
+        '''
+        Check if outputs are due, see parameter "output_sampling".
+
+        Inputs
+        ------
+        time (float or np.array): Time, in seconds.
+        interval (float): Sampling interval, in seconds.
+
+        Returns
+        -------
+        due (bool or np.array): True if the time is a multiple of the interval.
+        '''
+        r = (np.asarray(time) - self.parameter['fmu_start_time']) % interval
+        return (r < 1e-6) | (interval - r < 1e-6)
+
+    def get_outputs(self, time=None):
+        '''
+        Get the FMU outputs, using value references if available. Sampled outputs
+        which are not due are not fetched, see parameter "output_sampling".
+
+        Inputs
+        ------
+        time (float): Time of the outputs in seconds, default None (all outputs).
+
+        Returns
+        -------
+        res (np.array): Values of the FMU outputs (self.fmu_output_names).
+        '''
+        if self.output_sampling is None or time is None:
+            if self.output_refs is None:
+                return self.fmu.get(self.fmu_output_names)
+            return self.fmu.get_real(self.output_refs['refs'])
+        index = [self.output_sampling['always']]
+        index += [i for interval, i in self.output_sampling['groups'] \
+                  if self.is_due(time, interval)]
+        index = np.concatenate(index)
+        res = np.full(len(self.fmu_output_names), np.nan)
+        if self.output_refs is None:
+            res[index] = self.fmu.get([self.fmu_output_names[i] for i in index])
+        else:
+            res[index] = self.fmu.get_real(self.output_refs['refs'][index])
+        return res
+
     def evaluate_fmu(self, inputs, advance_fmu=True):
         ''' evaluate the fmu '''
         if advance_fmu:
             inputs = inputs.copy()
-            if self.parameter['inputs_map']:
-                cols = {v:k for k,v in self.parameter['inputs_map'].items()}
-                inputs = inputs.rename(columns=cols)
+            if self.inputs_map:
+                inputs = inputs.rename(columns=self.inputs_map)
             del inputs['time']
 
             # Set inputs
-            cols = [c for c in inputs.columns if c not in self.parameter['hidden_input_names']]
-            values = inputs[cols].iloc[0].values
-            for i in range(len(values)):
-                self.fmu.set(cols[i], values[i])
-                
+            cols = [c for c in inputs.columns if c not in self.hidden_input_names]
+            self.set_inputs(cols, inputs[cols].iloc[0].values)
+            if self.profiler:
+                self.profile('set_inputs')
+
             # Compute FMU
             step_size = inputs.index[0] - self.fmu_time
             try:
@@ -172,23 +632,355 @@ class fmi_gym(gym.Env):
                 print('Inputs:\n{}'.format(inputs))
                 print('States:\n{}'.format(self.state))
                 raise e
+            if self.profiler:
+                self.profile('do_step')
 
             # Results
             self.fmu_time = self.fmu.time
-        names = self.parameter['fmu_observation_names'] \
-            + self.parameter['hidden_observation_names'] \
-            + self.parameter['reward_names']
-        res = self.fmu.get(names)
-        res = pd.Series(res, index=names)
+        res = pd.Series(self.get_outputs(self.fmu_time), index=self.fmu_output_names)
 
         return res
 
+    def get_info(self, data):
+        '''
+        Returns the info dictionary of step and reset, see parameter "info_data".
+
+        Inputs
+        ------
+        data (pd.DataFrame or fun): Data of the step, or function returning the data.
+
+        Returns
+        -------
+        info (dict): Info dictionary.
+        '''
+        mode = self.parameter['info_data']
+        if not mode:
+            return {}
+        get_data = data if callable(data) else lambda: data
+        if mode == 'lazy':
+            return lazy_info(data=lambda: get_data().to_json())
+        elif mode == 'json':
+            return {'data': get_data().to_json()}
+        elif mode == 'dict':
+            return {'data': get_data().to_dict()}
+        raise ValueError('The "info_data" mode "{}" is not supported.'.format(mode))
+
+    def get_reset_info(self):
+        ''' returns the info dictionary of reset, with the data recorded up to the reset '''
+        if not self.parameter['info_data']:
+            return {}
+        return self.get_info(self.data)
+
+    def row_frame(self, time, row):
+        '''
+        Returns a row of the NumPy step as pd.DataFrame.
+
+        Inputs
+        ------
+        time (float): Time of the row, in seconds.
+        row (np.array): Row of the NumPy step.
+
+        Returns
+        -------
+        data (pd.DataFrame): Data of the step, indexed by time.
+        '''
+        time = self.record_time(time)
+        data = {'time': [time]}
+        data.update({c:[v] for c, v in zip(self.row_columns, self.record_values(row))})
+        return pd.DataFrame(data, index=[time])
+
+    def record_time(self, time):
+        '''
+        Returns the time as recorded in self.data, see parameter "compact_data".
+
+        Inputs
+        ------
+        time (float or np.array): Time, in seconds.
+
+        Returns
+        -------
+        time (float or np.array): Time, in integer seconds in the compact mode.
+        '''
+        if self.compact:
+            return np.rint(time).astype(np.int64)
+        return time
+
+    def record_values(self, values):
+        '''
+        Returns values as recorded in self.data, see parameter "compact_data".
+
+        Inputs
+        ------
+        values (float or np.array): Values of the NumPy step.
+
+        Returns
+        -------
+        values (float or np.array): Values, of "precision" in the compact mode.
+        '''
+        if self.compact:
+            return np.asarray(values).astype(self.precision)
+        return values
+
+    def compact_frame(self, data):
+        '''
+        Convert data to the compact format, see parameter "compact_data".
+
+        Inputs
+        ------
+        data (pd.DataFrame): Data of a step.
+
+        Returns
+        -------
+        data (pd.DataFrame): Data with numeric columns of "precision" and integer time.
+        '''
+        data = data.copy()
+        for c, v in data.items():
+            if c == 'time':
+                data[c] = self.record_time(v.to_numpy())
+            elif v.dtype.kind in 'iubf' and v.dtype != self.precision:
+                data[c] = v.astype(self.precision)
+        if 'time' in data.columns:
+            data.index = data['time'].values
+        return data
+
+    def evaluate_fmu_numpy(self, inputs, time):
+        '''
+        Evaluate the fmu with NumPy inputs.
+
+        Inputs
+        ------
+        inputs (np.array): Values of the FMU inputs.
+        time (float): Time at the end of the step, in seconds.
+
+        Returns
+        -------
+        res (np.array): Values of the FMU outputs.
+        '''
+        self.set_inputs(self.fmu_input_names, inputs)
+        if self.profiler:
+            self.profile('set_inputs')
+
+        # Compute FMU
+        try:
+            self.fmu.do_step(current_t=self.fmu_time, step_size=time-self.fmu_time)
+        except Exception as e:
+            print('ERROR: Could not evaluate the FMU.')
+            print('See log for more information (set "fmu_loglevel" >= 3).')
+            print('Inputs:\n{}'.format(dict(zip(self.fmu_input_names, inputs))))
+            print('States:\n{}'.format(self.state))
+            raise e
+        if self.profiler:
+            self.profile('do_step')
+
+        # Results
+        self.fmu_time = self.fmu.time
+        res = self.get_outputs(self.fmu_time)
+        if self.profiler:
+            self.profile('get_outputs')
+        return res
+
+    def advance_numpy(self, action, time):
+        '''
+        Advance the FMU and compute the row of the NumPy step.
+
+        Inputs
+        ------
+        action (np.array): Actions of the step.
+        time (float): Time at the end of the step, in seconds.
+
+        Returns
+        -------
+        reward (float): Reward of the step.
+        '''
+        row = self.row
+        index = self.row_index
+        row[index['action']] = action
+
+        # Compute preprocessing (if specified)
+        if self.preprocessor:
+            self.run_array_processor('preprocessor', time)
+            if self.profiler:
+                self.profile('preprocess')
+
+        # Evaluate FMU
+        if self.use_fmu:
+            row[index['output']] = self.evaluate_fmu_numpy(row[index['input']], time)
+        else:
+            self.fmu_time = time
+
+        # Compute postprocessing (if specified)
+        if self.postprocessor:
+            self.run_array_processor('postprocessor', time)
+            if self.profiler:
+                self.profile('postprocess')
+
+        # Compute reward
+        if self.parameter['reward_names']:
+            reward = row[index['reward']].sum()
+        elif self.reward_from_row:
+            reward = row[-1]
+        else:
+            reward = -1
+        row[-1] = reward
+        if self.profiler:
+            self.profile('reward')
+        return reward
+
+    def step_numpy(self, action):
+        ''' do step without pd.DataFrame, see parameter "numpy_step" '''
+        if self.profiler:
+            start = self.profile_start = self.profiler.start()
+        row = self.row
+        index = self.row_index
+        reward = self.record_values(self.advance_numpy(action, self.get_next_time()))
+        if self.checkpoint_next is not None:
+            self.record_action(action)
+
+        # Outputs
+        if self.parameter['info_data']:
+            info = self.get_info(lambda t=self.fmu_time, r=row.copy(): self.row_frame(t, r))
+        else:
+            info = {}
+        self.state = self.process_state(self.record_values(row[index['observation']]))
+        done = self.fmu_time >= self.action_start_time + self.episode_duration
+        self.init = False
+        if self.profiler:
+            self.profile('state')
+        if self.parameter['store_data']:
+            self.store.append_array(self.record_time(self.fmu_time), self.row_columns,
+                                    self.record_values(row), index_name='time')
+        self.store_episode(done)
+        if self.profiler:
+            self.profile('store')
+            self.profile_step(start)
+
+        return self.state, reward, done, info
+
+    def profile(self, phase):
+        '''
+        Record a phase of the step, see parameter "profile".
+
+        Inputs
+        ------
+        phase (str): Name of the phase.
+        '''
+        self.profile_start = self.profiler.stop(phase, self.profile_start)
+
+    def profile_step(self, start):
+        '''
+        Record the wall time of the step, see parameter "profile".
+
+        Inputs
+        ------
+        start (float or tuple): Start of the step, see step_profiler.start.
+        '''
+        self.profiler.stop('step', start)
+        self.profiler.end_step()
+
+    def get_next_time(self, time=None):
+        '''
+        Returns the time at the end of the next step, see parameters "fmu_step_size"
+        and "fmu_step_schedule". With a schedule, steps end at the end of the warmup
+        and the end of the episode.
+
+        Inputs
+        ------
+        time (float): Time at the start of the step in seconds, default None (FMU time).
+
+        Returns
+        -------
+        time (float): Time at the end of the step, in seconds.
+        '''
+        time = self.fmu_time if time is None else time
+        schedule = self.parameter['fmu_step_schedule']
+        if not schedule:
+            return time + self.parameter['fmu_step_size']
+        if time < self.action_start_time:
+            end = self.action_start_time
+        else:
+            end = self.action_start_time + self.episode_duration
+        next_time = time + schedule(time)
+        return min(next_time, end) if time < end else next_time
+
+    def get_time_grid(self, n=None):
+        '''
+        Returns the end times of the next steps, see get_next_time.
+
+        Inputs
+        ------
+        n (int): Number of steps, default None (until the end of the episode).
+
+        Returns
+        -------
+        time (np.array): Time at the end of each step, in seconds.
+        '''
+        end = self.action_start_time + self.episode_duration
+        if not self.parameter['fmu_step_schedule']:
+            step_size = self.parameter['fmu_step_size']
+            if n is None:
+                n = max(int(np.ceil((end - self.fmu_time) / step_size)), 0)
+            return self.fmu_time + step_size * np.arange(1, n + 1)
+        time = []
+        t = self.fmu_time
+        while (t < end) if n is None else (len(time) < n):
+            t = self.get_next_time(t)
+            time.append(t)
+        return np.array(time)
+
     def step(self, action, advance_fmu=True):
-        ''' do step '''
+        '''
+        Do step. With a "fmu_step_schedule" which defines action points, the action
+        is held and the FMU advanced until the next action point; the rewards of
+        these steps are summed.
+        '''
+        if advance_fmu and self.numpy_step:
+            res = self.step_numpy(action)
+        else:
+            res = self.step_pandas(action, advance_fmu=advance_fmu)
+
+        # Hold action until next action point
+        schedule = self.parameter['fmu_step_schedule']
+        if advance_fmu and hasattr(schedule, 'is_action_point'):
+            reward = res[1]
+            while not res[2] and self.fmu_time > self.action_start_time \
+                and not schedule.is_action_point(self.fmu_time):
+                if self.numpy_step:
+                    res = self.step_numpy(action)
+                else:
+                    res = self.step_pandas(action)
+                reward += res[1]
+            res = (res[0], reward, res[2], res[3])
+        if self.parameter['state_feed']:
+            self.publish_state(res[1], count=advance_fmu)
+        if self.checkpoint_next is not None:
+            self.check_checkpoint()
+        return res
+
+    def publish_state(self, reward, count=True):
+        '''
+        Publish the state to the shared memory feed, see parameter "state_feed".
+
+        Inputs
+        ------
+        reward (float): Reward of the step.
+        count (bool): Increment the step counter, default True.
+        '''
+        if self.feed is None:
+            names = self.parameter['observation_names']
+            if len(names) != len(self.state):
+                names = ['state{}'.format(i) for i in range(len(self.state))]
+            self.feed = state_feed(self.parameter['state_feed'], names)
+        self.feed.publish(self.fmu_time, self.state, reward, self.episode, count=count)
+
+    def step_pandas(self, action, advance_fmu=True):
+        ''' do step with pd.DataFrame '''
+        profile = self.profiler and advance_fmu
+        if profile:
+            start = self.profile_start = self.profiler.start()
 
         # Get internal FMU inputs
         if advance_fmu:
-            data = pd.DataFrame({'time': [self.fmu_time+self.parameter['fmu_step_size']]})
+            data = pd.DataFrame({'time': [self.get_next_time()]})
         else:
             data = self.data
 
@@ -196,23 +988,33 @@ class fmi_gym(gym.Env):
         action = pd.DataFrame([action], columns=self.parameter['action_names'])
         data = pd.concat([data, action], axis=1)
         data.index = data['time'].values
+        if profile:
+            self.profile('inputs')
 
         # Compute preprocessing (if specified)
         if self.preprocessor:
-            data = self.preprocessor.do_calc(data, self.init)
+            data = self.call_processor(self.preprocessor, data)
+            if profile:
+                self.profile('preprocess')
 
         # Evaluate FMU
         if self.use_fmu:
             res = self.evaluate_fmu(data, advance_fmu=advance_fmu)
             for k,v in res.items():
                 data[k] = v
+            if profile:
+                self.profile('get_outputs')
         else:
             if advance_fmu:
-                self.fmu_time += self.parameter['fmu_step_size']
+                self.fmu_time = data['time'].values[0]
+        if advance_fmu and self.checkpoint_next is not None:
+            self.record_action(action.values[0])
 
         # Compute postprocessing (if specified)
         if self.postprocessor:
-            data = self.postprocessor.do_calc(data, self.init)
+            data = self.call_processor(self.postprocessor, data)
+            if profile:
+                self.profile('postprocess')
 
         # Compute reward
         if self.parameter['reward_names']:
@@ -221,47 +1023,383 @@ class fmi_gym(gym.Env):
             pass
         else:
             data['reward'] = -1
+        if self.compact:
+            data = self.compact_frame(data)
+        if not advance_fmu:
+            # Start the NumPy step from the outputs of the reset
+            self.set_row_values(data.iloc[0])
+        if profile:
+            self.profile('reward')
 
         # Outputs
         reward = data['reward'].values[0]
-        info = {'data': data.to_json()}
-        self.state = data[self.parameter['observation_names']].values[0]
-        if self.stateprocessor:
-            self.state = self.stateprocessor.do_calc(self.state, self.init)
+        info = self.get_info(data)
+        self.state = self.process_state(data[self.parameter['observation_names']].values[0],
+                                        data=data)
         if self.fmu_time >= self.action_start_time + self.episode_duration:
             done = True
         else:
             done = False
         self.init = False
+        if profile:
+            self.profile('state')
         if self.parameter['store_data']:
-            if self.data.empty or not advance_fmu:
+            if not advance_fmu:
                 self.data = data
             else:
-                self.data = pd.concat([self.data, data])
-            if self.parameter['store_all_data'] and done:
-                self.data_all.append(self.data.copy(deep=True))
+                self.store.append(data)
+        self.store_episode(done)
+        if profile:
+            self.profile('store')
+            self.profile_step(start)
 
         return self.state, reward, done, info
 
+    def rollout(self, actions=None, time=None, native=False):
+        '''
+        Simulate a schedule of actions (open loop) from the current state, e.g. after reset.
+        The steps are computed in a loop over NumPy arrays, or with the simulate method of
+        the FMU handler (native). Recorded data is stored as in step.
+
+        Inputs
+        ------
+        actions (np.array): Actions with one row per step, default None (all zero).
+        time (np.array): Time at the end of each step, in seconds. The default (None) uses
+                         steps of "fmu_step_size" for each row of actions or, if actions is
+                         None, until the end of the episode.
+        native (bool): Simulate with the simulate method of the FMU handler (PyFMI), default
+                       False. Requires a uniform time grid, otherwise the loop is used.
+
+        Returns
+        -------
+        time (np.array): Time at the end of each step, in seconds.
+        observations (np.array): Observations, with one row per step.
+        rewards (np.array): Rewards, of each step.
+        '''
+        n_act = len(self.parameter['action_names'])
+        if time is None:
+            time = self.get_time_grid(None if actions is None else len(actions))
+        time = np.asarray(time)
+        n = len(time)
+        if actions is None:
+            actions = np.zeros((n, n_act))
+        actions = np.asarray(actions, dtype=np.float64).reshape(n, n_act)
+
+        # Cached episode (see parameter "rollout_cache")
+        key = self.get_rollout_key(time, actions)
+        if key:
+            res = self.load_rollout_cache(key)
+            if res is not None:
+                return res
+            rows = len(self.store)
+        res = self.rollout_steps(time, actions, native=native)
+        if key:
+            self.save_rollout_cache(key, res, rows)
+        return res
+
+    def rollout_steps(self, time, actions, native=False):
+        '''
+        Simulate a schedule of actions, see rollout.
+
+        Inputs
+        ------
+        time (np.array): Time at the end of each step, in seconds.
+        actions (np.array): Actions, with one row per step.
+        native (bool): Simulate with the simulate method of the FMU handler, default False.
+
+        Returns
+        -------
+        res (tuple): Time, observations, and rewards.
+        '''
+        n = len(time)
+
+        # pd.DataFrame processors
+        if self.row is None:
+            grid = self.get_time_grid(n)
+            if len(grid) != n or not np.allclose(time, grid):
+                raise ValueError('The rollout with "preprocessor" or "postprocessor" ' \
+                                 'requires the steps of "fmu_step_size" or ' \
+                                 '"fmu_step_schedule".')
+            observations = np.empty((n, len(self.state)), dtype=self.state.dtype)
+            rewards = np.empty(n, dtype=self.precision if self.compact else np.float64)
+            for k in range(n):
+                observations[k], rewards[k], _, _ = self.step_pandas(actions[k])
+                if self.parameter['state_feed']:
+                    self.publish_state(rewards[k])
+                if self.checkpoint_next is not None:
+                    self.check_checkpoint()
+            return time, observations, rewards
+
+        # Simulate
+        if native:
+            res = self.rollout_native(time, actions)
+            if res is not None:
+                if self.parameter['state_feed']:
+                    self.publish_state(res[2][-1])
+                if self.checkpoint_next is not None:
+                    self.checkpoint_time += list(time)
+                    self.checkpoint_actions += list(actions)
+                    self.check_checkpoint()
+                return res
+        observations = None
+        rewards = np.empty(n, dtype=self.precision if self.compact else np.float64)
+        index = self.row_index
+        store_data = self.parameter['store_data']
+        for k in range(n):
+            if self.profiler:
+                start = self.profile_start = self.profiler.start()
+            rewards[k] = self.advance_numpy(actions[k], time[k])
+            if self.checkpoint_next is not None:
+                self.record_action(actions[k])
+            state = self.process_state(self.record_values(self.row[index['observation']]))
+            self.init = False
+            if observations is None:
+                observations = np.empty((n, ) + np.shape(state), dtype=np.asarray(state).dtype)
+            observations[k] = state
+            if self.parameter['state_feed']:
+                self.state = state
+                self.publish_state(rewards[k])
+            if self.profiler:
+                self.profile('state')
+            if store_data:
+                self.store.append_array(self.record_time(self.fmu_time), self.row_columns,
+                                        self.record_values(self.row), index_name='time')
+                if self.sink:
+                    self.write_sink()
+            if self.profiler:
+                self.profile('store')
+                self.profile_step(start)
+            if self.checkpoint_next is not None:
+                self.check_checkpoint()
+        if n:
+            self.state = state
+        self.store_episode(self.fmu_time >= self.action_start_time + self.episode_duration)
+        if observations is None:
+            observations = np.empty((0, len(index['observation'])),
+                                    dtype=self.record_values(self.row).dtype)
+        return time, observations, rewards
+
+    def get_rollout_key(self, time, actions):
+        '''
+        Returns the key of a rollout in the episode cache, see parameter "rollout_cache".
+        The key is the hash of the FMU, the parameter, the state of the processors, the
+        start time, and the actions. Only rollouts of complete episodes, from reset to
+        the end of the episode, are cached. Episodes that continue the FMU of the previous episode (parameter
+        "ignore_reset") are not cached, since a restored rollout does not advance the FMU.
+
+        Inputs
+        ------
+        time (np.array): Time at the end of each step, in seconds.
+        actions (np.array): Actions, with one row per step.
+
+        Returns
+        -------
+        key (str): Key of the rollout, None if the rollout is not cached.
+        '''
+        if not self.rollout_cache or self.sink or len(time) == 0 \
+            or self.parameter['ignore_reset']:
+            return None
+        if self.fmu_time != self.action_start_time \
+            or time[-1] < self.action_start_time + self.episode_duration:
+            return None
+        schedule = hashlib.sha256(np.asarray(time, dtype=np.float64).tobytes() \
+                                  + actions.tobytes()).hexdigest()
+        try:
+            processors = normalize([self.preprocessor, self.postprocessor,
+                                    self.stateprocessor])
+            return hash_object(self.get_fmu_key() + [self.get_config_key(), processors,
+                                                     self.fmu_time, schedule])
+        except ValueError as e:
+            print('WARNING: "rollout_cache" is disabled ({}).'.format(e))
+            self.rollout_cache = None
+            return None
+
+    def load_rollout_cache(self, key):
+        '''
+        Restore a rollout from the episode cache, see parameter "rollout_cache". The
+        recorded data and state are restored without evaluating the FMU, which is
+        therefore not advanced; the episode is done.
+
+        Inputs
+        ------
+        key (str): Key of the rollout, see get_rollout_key.
+
+        Returns
+        -------
+        res (tuple): Time, observations, and rewards. None if not cached.
+        '''
+        entry = self.rollout_cache.get(key)
+        if entry is None:
+            return None
+        if entry['data'] is not None:
+            self.store.append(entry['data'])
+        if self.row is not None:
+            self.row[:] = entry['row']
+        self.state = entry['state']
+        self.fmu_time = entry['time'][-1]
+        self.init = False
+        self.store_episode(True)
+        if self.parameter['state_feed']:
+            self.publish_state(entry['rewards'][-1])
+        return entry['time'], entry['observations'], entry['rewards']
+
+    def save_rollout_cache(self, key, res, rows):
+        '''
+        Save a rollout to the episode cache, see parameter "rollout_cache".
+
+        Inputs
+        ------
+        key (str): Key of the rollout, see get_rollout_key.
+        res (tuple): Time, observations, and rewards of the rollout.
+        rows (int): Number of recorded rows before the rollout.
+        '''
+        data = self.store.to_frame().iloc[rows:] if self.parameter['store_data'] else None
+        entry = {'time': res[0], 'observations': res[1], 'rewards': res[2],
+                 'state': self.state, 'row': None if self.row is None else self.row.copy(),
+                 'data': data}
+        try:
+            self.rollout_cache.put(key, entry)
+        except Exception as e:
+            print('WARNING: Could not write "rollout_cache" ({}).'.format(e))
+
+    def rollout_native(self, time, actions):
+        '''
+        Simulate a schedule of actions with the simulate method of the FMU handler,
+        see rollout.
+
+        Inputs
+        ------
+        time (np.array): Time at the end of each step, in seconds.
+        actions (np.array): Actions, with one row per step.
+
+        Returns
+        -------
+        res (tuple): Time, observations, and rewards. None if not supported.
+        '''
+        n = len(time)
+        steps = np.diff(np.r_[self.fmu_time, time])
+        if not self.use_fmu or not hasattr(self.fmu, 'simulate') or n == 0:
+            print('WARNING: The FMU handler does not support a native rollout.')
+            return None
+        if not np.allclose(steps, steps[0]):
+            print('WARNING: The native rollout requires a uniform time grid.')
+            return None
+        if self.preprocessor or self.postprocessor \
+            or self.is_array_processor(self.stateprocessor):
+            print('WARNING: The native rollout does not support processors with the ' \
+                  'array protocol.')
+            return None
+
+        # Simulate (inputs of a step are set at its start time)
+        options = self.fmu.simulate_options()
+        options['initialize'] = False
+        options['ncp'] = n
+        options['result_handling'] = 'memory'
+        options['filter'] = self.fmu_output_names
+        index = self.row_index
+        inputs = ()
+        if self.fmu_input_names:
+            t_in = np.r_[self.fmu_time, time]
+            u = actions[:, index['input']]
+            inputs = (self.fmu_input_names, np.column_stack([t_in, np.vstack([u, u[-1:]])]))
+        try:
+            res = self.fmu.simulate(start_time=self.fmu_time, final_time=time[-1],
+                                    input=inputs, options=options)
+        except Exception as e:
+            print('ERROR: Could not simulate the FMU.')
+            print('See log for more information (set "fmu_loglevel" >= 3).')
+            raise e
+        if self.input_refs and self.input_refs['refs'] is not None:
+            self.input_refs['values'][:] = np.nan
+        self.fmu_time = time[-1]
+
+        # Parse results
+        rows = np.tile(self.row, (n, 1))
+        rows[:, index['action']] = actions
+        for i, name in zip(index['output'], self.fmu_output_names):
+            rows[:, i] = np.asarray(res[name])[-n:]
+        if self.output_sampling is not None:
+            for interval, i in self.output_sampling['groups']:
+                rows[np.ix_(~self.is_due(time, interval), index['output'][i])] = np.nan
+        if self.parameter['reward_names']:
+            rows[:, -1] = rows[:, index['reward']].sum(axis=1)
+        else:
+            rows[:, -1] = -1
+        self.row[:] = rows[-1]
+        rows = self.record_values(rows)
+        observations = rows[:, index['observation']]
+        if self.stateprocessor:
+            observations = np.array([self.stateprocessor.do_calc(o, self.init) \
+                for o in observations])
+        self.init = False
+        self.state = observations[-1]
+        if self.parameter['store_data']:
+            self.store.append_array(self.record_time(time), self.row_columns, rows,
+                                    index_name='time')
+        self.store_episode(self.fmu_time >= self.action_start_time + self.episode_duration)
+        return time, observations, rows[:, -1].copy()
+
+    def store_episode(self, done):
+        '''
+        Store the episode data in self.data_all, see parameter "store_all_data",
+        or write it to the sink, see parameter "store_sink".
+
+        Inputs
+        ------
+        done (bool): True if the episode is done.
+        '''
+        if self.sink:
+            self.write_sink(done)
+        if done and self.parameter['store_data'] and self.parameter['store_all_data']:
+            self.data_all.append(self.data.copy(deep=True))
+
+    def write_sink(self, done=False):
+        '''
+        Write the recorded data to the sink, see parameter "store_sink". The rows are
+        written in chunks of "store_sink_chunk" and removed from self.data. Data of the
+        reset and warmup is kept until the first step.
+
+        Inputs
+        ------
+        done (bool): Write all rows, default False.
+        '''
+        if not self.sink or not self.parameter['store_data'] or self.store.empty:
+            return
+        if self.fmu_time <= self.action_start_time:
+            return
+        if done or len(self.store) >= self.parameter['store_sink_chunk']:
+            self.sink.write(self.store.to_frame().assign(episode=self.episode))
+            self.store.keep_last(0)
+
     def reset(self):
         ''' reset environment '''
 
-        if self.parameter['ignore_reset'] and self.fmu_loaded:
+        ignore_reset = self.parameter['ignore_reset'] and self.fmu_loaded
+        if self.sink and hasattr(self, 'action_start_time'):
+            self.write_sink(done=True)
+        self.episode += 1
+        if ignore_reset:
             # Ignore the reset command and continue with loaded FMU/states
             self.parameter['fmu_start_time'] += self.episode_duration
             self.parameter['fmu_final_time'] += self.episode_duration
             if self.parameter['fmu_warmup_time']:
                 print('WARNING: Disabling "fmu_warmup_time" when "ignore_reset" is set.')
                 self.parameter['fmu_warmup_time'] = None
-        else:
-            self.close()
-            self.fmu_loaded = False            
 
-        self.data = pd.DataFrame({'time': [0]}, index=[0])
+        data = pd.DataFrame({'time': [0]}, index=[0])
         self.init = True
         if self.resetprocessor:
-            self.data, self.parameter = \
-                self.resetprocessor.do_calc(self.data, self.parameter, self.init)
+            data, self.parameter = \
+                self.resetprocessor.do_calc(data, self.parameter, self.init)
+
+        if not ignore_reset:
+            # Restore FMU snapshot (if available)
+            if self.load_snapshot():
+                self.setup_checkpoint()
+                return self.state, self.get_reset_info()
+            if not self.reset_fmu():
+                self.close_fmu()
+                self.fmu_loaded = False
 
         # Load FMU
         self.fmu_time = self.parameter['fmu_start_time']
@@ -269,34 +1407,626 @@ class fmi_gym(gym.Env):
             if self.parameter['fmu_warmup_time'] else self.parameter['fmu_start_time']
         if not self.fmu_loaded and self.parameter['init_fmu'] and self.use_fmu:
             self.configure_fmu()
-        self.data['time'] = self.fmu_time
+        data['time'] = self.fmu_time
+        self.data = data
+        if self.parameter['store_data']:
+            rows = int(np.ceil((self.parameter['fmu_final_time'] - self.fmu_time) \
+                / self.parameter['fmu_step_size'])) + 1
+            if self.sink:
+                rows = min(rows, self.parameter['store_sink_chunk'] + 1)
+            self.store.reserve(rows)
         action = np.array([0] * len(self.parameter['action_names']))
-        self.state, _, _, info = self.step(action, advance_fmu=False)
+        if not self.load_warmup_cache():
+            self.state, _, _, info = self.step(action, advance_fmu=False)
+
+            # Warmup
+            if self.parameter['fmu_warmup_time']:
+                while self.fmu_time < self.action_start_time:
+                    self.state, _, _, info = self.step(action)
+                if not self.parameter['store_warmup']:
+                    self.store.keep_last()
+            self.save_warmup_cache()
 
-        # Warmup
-        if self.parameter['fmu_warmup_time']:
-            while self.fmu_time < self.action_start_time:
-                self.state, _, _, info = self.step(action)
-            if not self.parameter['store_warmup']:
-                self.data = self.data.iloc[-1:]
+        # Save FMU snapshot
+        if not ignore_reset:
+            self.save_snapshot()
+        self.setup_checkpoint()
 
         # Standardize info keys to match step
-        info = {
-            'data': self.data.to_json()
-        }
+        info = self.get_reset_info()
 
         return self.state, info
 
+    def setup_checkpoint(self):
+        ''' setup the checkpoints of the episode, see parameter "checkpoint_path" '''
+        self.checkpoint_time = []
+        self.checkpoint_actions = []
+        self.checkpoint_log = None
+        if self.parameter['checkpoint_path']:
+            self.checkpoint_next = self.action_start_time \
+                + self.parameter['checkpoint_interval']
+        else:
+            self.checkpoint_next = None
+
+    def record_action(self, action):
+        '''
+        Record the action of a step to replay the episode, see parameter "checkpoint_path".
+
+        Inputs
+        ------
+        action (np.array): Action of the step which ended at the FMU time.
+        '''
+        self.checkpoint_time.append(self.fmu_time)
+        self.checkpoint_actions.append(np.array(action, dtype=np.float64))
+
+    def check_checkpoint(self):
+        ''' save a checkpoint if due, see parameter "checkpoint_interval" '''
+        if self.fmu_time >= self.checkpoint_next:
+            self.save_checkpoint()
+            interval = self.parameter['checkpoint_interval']
+            while self.checkpoint_next <= self.fmu_time:
+                self.checkpoint_next += interval
+
+    def get_checkpoint_key(self):
+        '''
+        Returns the key identifying the configuration of a checkpoint. The times of
+        the episode are restored from the checkpoint and therefore not included.
+        '''
+        return hash_object([self.get_fmu_key(strict=False)[0],
+                            self.get_config_key(strict=False, ignore=CHECKPOINT_TIMES)])
+
+    def write_checkpoint_log(self, path):
+        '''
+        Append the actions and recorded rows since the last checkpoint to the log of
+        the checkpoint (path + '.log'), see save_checkpoint. A log of another path, or
+        of a previous episode, is started again from the beginning of the episode.
+
+        Inputs
+        ------
+        path (str): Path of the checkpoint.
+
+        Returns
+        -------
+        size (int): Size of the log in bytes.
+        '''
+        log = self.checkpoint_log
+        if log is None or log['path'] != path + '.log':
+            log = {'path': path + '.log', 'size': 0, 'steps': 0, 'rows': 0}
+        data = None
+        if self.parameter['store_data'] and not self.sink:
+            data = self.store.to_frame(start=log['rows'])
+        entry = {'time': np.array(self.checkpoint_time[log['steps']:]),
+                 'actions': np.array(self.checkpoint_actions[log['steps']:]).reshape( \
+                     -1, len(self.parameter['action_names'])),
+                 'data': data}
+        with open(log['path'], 'r+b' if log['size'] else 'wb') as f:
+            # Remove entries of a save which did not complete
+            f.seek(log['size'])
+            f.truncate()
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+            log['size'] = f.tell()
+        log['steps'] = len(self.checkpoint_time)
+        log['rows'] = len(self.store)
+        self.checkpoint_log = log
+        return log['size']
+
+    def read_checkpoint_log(self, path, size):
+        '''
+        Read the log of a checkpoint, see write_checkpoint_log.
+
+        Inputs
+        ------
+        path (str): Path of the checkpoint.
+        size (int): Size of the log at the checkpoint in bytes.
+
+        Returns
+        -------
+        time (np.array): Time at the end of each step, in seconds.
+        actions (np.array): Actions, with one row per step.
+        data (list): Recorded rows (pd.DataFrame) of each entry, without None entries.
+        '''
+        time, actions, data = [], [], []
+        try:
+            with open(path + '.log', 'rb') as f:
+                while f.tell() < size:
+                    entry = pickle.load(f)
+                    time.append(entry['time'])
+                    actions.append(entry['actions'])
+                    if entry['data'] is not None:
+                        data.append(entry['data'])
+                complete = f.tell() == size
+        except (OSError, EOFError, pickle.UnpicklingError):
+            complete = False
+        if not complete or not time:
+            print('ERROR: The log of the checkpoint "{}" is incomplete.'.format(path))
+            raise ValueError('Cannot resume from checkpoint.')
+        return np.concatenate(time), np.concatenate(actions), data
+
+    def save_checkpoint(self, path=None):
+        '''
+        Save a checkpoint of the running episode, see parameter "checkpoint_path". The
+        checkpoint holds the serialized FMU state (if supported), the processors, and
+        the offset of "store_sink". The actions of the episode and the recorded data
+        not written to "store_sink" are appended to the log of the checkpoint
+        (path + '.log'), so that each checkpoint only writes the steps since the last
+        one. The checkpoint file is written atomically after the log.
+
+        Inputs
+        ------
+        path (str): Path of the checkpoint, default None ("checkpoint_path").
+        '''
+        path = path if path else self.parameter['checkpoint_path']
+        if self.sink:
+            self.write_sink(done=True)
+        fmu_state = None
+        if self.use_fmu and self.fmu_loaded and self.check_serialize_support():
+            state = self.fmu.get_fmu_state()
+            fmu_state = self.fmu.serialize_fmu_state(state)
+            try:
+                self.fmu.free_fmu_state(state)
+            except AttributeError:
+                pass
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        logged = self.parameter['store_data'] and not self.sink
+        checkpoint = self.get_reset_state(store=not logged)
+        checkpoint.update({
+            'key': self.get_checkpoint_key(),
+            'episode': self.episode,
+            'fmu_state': fmu_state,
+            'log': self.write_checkpoint_log(path),
+            'sink': (self.sink.parts, self.sink.rows) if self.sink else None,
+            'times': {k: self.parameter[k] for k in CHECKPOINT_TIMES}})
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def resume(self, path=None):
+        '''
+        Continue the episode of a checkpoint, see parameter "checkpoint_path". The
+        environment is reset and the FMU state is restored from the checkpoint if
+        it was serialized; otherwise the recorded actions of the episode are replayed.
+        Rows written to "store_sink" after the checkpoint are removed.
+
+        Inputs
+        ------
+        path (str): Path of the checkpoint, default None ("checkpoint_path").
+
+        Returns
+        -------
+        state (np.array): State at the checkpoint.
+        info (dict): Info dictionary, see reset.
+        '''
+        path = path if path else self.parameter['checkpoint_path']
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        if checkpoint['key'] != self.get_checkpoint_key():
+            print('ERROR: The checkpoint "{}" does not match the configuration.'.format(path))
+            raise ValueError('Cannot resume from checkpoint.')
+        time, actions, data = self.read_checkpoint_log(path, checkpoint['log'])
+        self.parameter.update(checkpoint['times'])
+
+        # Restore sink offset
+        if self.sink:
+            parts, rows = checkpoint['sink'] if checkpoint['sink'] else (0, 0)
+            for name in os.listdir(self.sink.path):
+                if name.startswith('part-') and int(name[5:11]) >= parts:
+                    os.remove(os.path.join(self.sink.path, name))
+            self.sink.parts, self.sink.rows = parts, rows
+
+        # Reset
+        self.episode = checkpoint['episode'] - 1
+        sink = self.sink
+        self.sink = None
+        try:
+            self.reset()
+            if checkpoint['fmu_state'] is not None and self.use_fmu \
+                and self.check_serialize_support():
+                fmu_state = self.fmu.deserialize_fmu_state(checkpoint['fmu_state'])
+                self.fmu.set_fmu_state(fmu_state)
+                try:
+                    self.fmu.free_fmu_state(fmu_state)
+                except AttributeError:
+                    pass
+            elif len(time):
+                print('WARNING: Replaying {} steps to resume from the checkpoint.'.format( \
+                    len(time)))
+                checkpoint_next, self.checkpoint_next = self.checkpoint_next, None
+                self.rollout_steps(time, actions)
+                self.checkpoint_next = checkpoint_next
+        finally:
+            self.sink = sink
+
+        # Restore fmi_gym
+        self.set_reset_state(checkpoint)
+        if checkpoint['store'] is None:
+            self.store.clear()
+            for frame in data:
+                self.store.append(frame)
+        self.checkpoint_time = list(time)
+        self.checkpoint_actions = list(actions)
+        self.checkpoint_log = {'path': path + '.log', 'size': checkpoint['log'],
+                               'steps': len(time), 'rows': len(self.store)}
+        if self.checkpoint_next is not None:
+            interval = self.parameter['checkpoint_interval']
+            while self.checkpoint_next <= self.fmu_time:
+                self.checkpoint_next += interval
+        return self.state, self.get_reset_info()
+
+    def get_config_key(self, strict=True, ignore=[]):
+        '''
+        Returns the hash of the parameter, with functions and objects (e.g. processors
+        and schedules) normalized, see normalize. Parameters which only select where
+        and how results are written or logged are not included.
+
+        Inputs
+        ------
+        strict (bool): Raise ValueError for parameters which cannot be identified across
+                       processes, e.g. lambdas, default True. Otherwise they are keyed by
+                       their identity within the process.
+        ignore (list): Additional parameters which are not included, default [].
+
+        Returns
+        -------
+        key (str): Hash of the configuration.
+        '''
+        ignore = list(ignore) + ['store_all_data', 'store_all_data_max', 'store_all_data_path',
+                  'store_sink', 'store_sink_format', 'store_sink_chunk', 'info_data',
+                  'profile', 'profile_log_interval', 'profile_allocations',
+                  'checkpoint_path', 'checkpoint_interval', 'state_feed', 'fmu_loglevel',
+                  'fmu_work_dir', 'fmu_snapshot', 'fmu_warmup_cache', 'fmu_warmup_cache_size',
+                  'rollout_cache', 'rollout_cache_size', 'fmu_extract_cache',
+                  'fmu_reuse_instance']
+        return hash_object(normalize({k: v for k, v in self.parameter.items() \
+                                      if k not in ignore}, strict=strict))
+
+    def get_snapshot_key(self):
+        ''' returns the key identifying the configuration of a snapshot '''
+        return self.get_config_key(strict=False)
+
+    def check_snapshot_support(self):
+        '''
+        Check if the FMU supports to get and set its state, see parameter "fmu_snapshot".
+
+        Returns
+        -------
+        supported (bool): True if snapshots are supported.
+        '''
+        if self.snapshot_supported is None:
+            try:
+                flags = self.fmu.get_capability_flags()
+                supported = bool(flags.get('canGetAndSetFMUstate', False))
+            except AttributeError:
+                supported = hasattr(self.fmu, 'get_fmu_state') \
+                    and hasattr(self.fmu, 'set_fmu_state')
+            if not supported:
+                print('WARNING: The FMU does not support to get and set its state ' \
+                      '(canGetAndSetFMUstate). "fmu_snapshot" is disabled and the FMU ' \
+                      'is reloaded and warmed up on every reset.')
+            self.snapshot_supported = supported
+        return self.snapshot_supported
+
+    def save_snapshot(self):
+        '''
+        Save the state of the FMU, processors, and data after reset and warmup,
+        see parameter "fmu_snapshot".
+        '''
+        if not self.parameter['fmu_snapshot'] or not self.use_fmu or not self.fmu_loaded:
+            return
+        if self.snapshot or not self.check_snapshot_support():
+            return
+        try:
+            processors = copy.deepcopy([self.preprocessor, self.postprocessor,
+                                        self.stateprocessor])
+        except Exception as e:
+            print('WARNING: Processors cannot be copied for "fmu_snapshot" ({}).'.format(e))
+            self.snapshot_supported = False
+            return
+        self.snapshot = self.get_reset_state()
+        self.snapshot['key'] = self.get_snapshot_key()
+        self.snapshot['fmu_state'] = self.fmu.get_fmu_state()
+        self.snapshot['processors'] = processors
+
+    def get_reset_state(self, store=True):
+        '''
+        Returns the state of fmi_gym after reset (without FMU state).
+
+        Inputs
+        ------
+        store (bool): Include a copy of the recorded data, default True.
+
+        Returns
+        -------
+        reset_state (dict): State of fmi_gym.
+        '''
+        return {'fmu_time': self.fmu_time,
+                'state': copy.deepcopy(self.state),
+                'store': copy.deepcopy(self.store) if store else None,
+                'row': self.get_row_values(),
+                'processors': [self.preprocessor, self.postprocessor, self.stateprocessor]}
+
+    def get_row_values(self):
+        '''
+        Returns the row of the NumPy step keyed by column, e.g. to restore it in
+        another process.
+
+        Returns
+        -------
+        values (dict): Values of the row by column name, None without row.
+        '''
+        if self.row is None:
+            return None
+        return dict(zip(self.row_columns, self.row))
+
+    def set_row_values(self, values):
+        '''
+        Restore the row of the NumPy step, see get_row_values.
+
+        Inputs
+        ------
+        values (dict or pd.Series): Values of the row by column name.
+        '''
+        if self.row is None or values is None:
+            return
+        for i, c in enumerate(self.row_columns):
+            if c in values:
+                self.row[i] = values[c]
+
+    def set_reset_state(self, reset_state):
+        '''
+        Restore the state of fmi_gym after reset (without FMU state). The processors
+        are only restored if the state holds them.
+
+        Inputs
+        ------
+        reset_state (dict): State of fmi_gym, see get_reset_state.
+        '''
+        if self.input_refs and self.input_refs['refs'] is not None:
+            self.input_refs['values'][:] = np.nan
+        self.fmu_time = reset_state['fmu_time']
+        self.action_start_time = self.parameter['fmu_warmup_time'] \
+            if self.parameter['fmu_warmup_time'] else self.parameter['fmu_start_time']
+        self.state = copy.deepcopy(reset_state['state'])
+        if reset_state['store'] is not None:
+            self.store = copy.deepcopy(reset_state['store'])
+        if 'processors' in reset_state:
+            self.preprocessor, self.postprocessor, self.stateprocessor = \
+                copy.deepcopy(reset_state['processors'])
+        self.set_row_values(reset_state.get('row'))
+        self.init = False
+
+    def load_snapshot(self):
+        '''
+        Restore the FMU, processors, and data from the snapshot, see parameter
+        "fmu_snapshot".
+
+        Returns
+        -------
+        loaded (bool): True if the snapshot was restored.
+        '''
+        if not self.snapshot or not self.fmu_loaded:
+            return False
+        if self.snapshot['key'] != self.get_snapshot_key():
+            self.free_snapshot()
+            return False
+        self.fmu.set_fmu_state(self.snapshot['fmu_state'])
+        self.set_reset_state(self.snapshot)
+        return True
+
+    def check_serialize_support(self):
+        '''
+        Check if the FMU supports to serialize its state, see parameters "fmu_warmup_cache"
+        and "checkpoint_path".
+
+        Returns
+        -------
+        supported (bool): True if serialization is supported.
+        '''
+        if self.serialize_supported is None:
+            try:
+                flags = self.fmu.get_capability_flags()
+                supported = bool(flags.get('canGetAndSetFMUstate', False)) \
+                    and bool(flags.get('canSerializeFMUstate', False))
+            except AttributeError:
+                supported = all(hasattr(self.fmu, k) for k in \
+                    ['get_fmu_state', 'set_fmu_state', 'serialize_fmu_state',
+                     'deserialize_fmu_state'])
+            if not supported:
+                print('WARNING: The FMU does not support to serialize its state ' \
+                      '(canSerializeFMUstate). "fmu_warmup_cache" is disabled and ' \
+                      'checkpoints are resumed by replaying the actions.')
+            self.serialize_supported = supported
+        return self.serialize_supported
+
+    def get_fmu_key(self, strict=True):
+        '''
+        Returns the identification of the FMU for cache keys.
+
+        Inputs
+        ------
+        strict (bool): Raise ValueError if a custom FMU handler cannot be identified
+                       across processes, default True, see normalize.
+
+        Returns
+        -------
+        key (list): Hash of the FMU file (or its path if it is not a file), and the
+                    representation of a custom FMU handler.
+        '''
+        path = self.fmu_path
+        fmu = file_hash(path) if self.use_fmu and os.path.isfile(path) \
+            else self.parameter['fmu_path']
+        return [fmu, None if self.use_pyfmi else normalize(self.load_fmu, strict=strict)]
+
+    def get_warmup_key(self):
+        '''
+        Returns the key of the warmup cache, the hash of the FMU, the parameter, and
+        the state of the processors before the warmup.
+
+        Returns
+        -------
+        key (str): Key of the warmup cache, None if the configuration cannot be keyed.
+        '''
+        try:
+            processors = normalize([self.preprocessor, self.postprocessor,
+                                    self.stateprocessor])
+            return hash_object(self.get_fmu_key() + [self.get_config_key(), processors])
+        except ValueError as e:
+            print('WARNING: "fmu_warmup_cache" is not used ({}).'.format(e))
+            return None
+
+    def load_warmup_cache(self):
+        '''
+        Restore the FMU and data after warmup from the disk cache, see parameter
+        "fmu_warmup_cache". The processors are not restored.
+
+        Returns
+        -------
+        loaded (bool): True if the cache was restored.
+        '''
+        if not self.warmup_cache or not self.use_fmu or not self.fmu_loaded:
+            return False
+        if not self.check_serialize_support():
+            return False
+        # The key is computed before the warmup, which may change the processors
+        self.warmup_key = self.get_warmup_key()
+        if self.warmup_key is None:
+            return False
+        reset_state = self.warmup_cache.get(self.warmup_key)
+        if reset_state is None:
+            return False
+        fmu_state = self.fmu.deserialize_fmu_state(reset_state['fmu_state'])
+        self.fmu.set_fmu_state(fmu_state)
+        try:
+            self.fmu.free_fmu_state(fmu_state)
+        except AttributeError:
+            pass
+        self.set_reset_state(reset_state)
+        return True
+
+    def save_warmup_cache(self):
+        ''' save the FMU and data after warmup to the disk cache '''
+        if not self.warmup_cache or not self.use_fmu or not self.fmu_loaded:
+            return
+        if not self.warmup_key or not self.check_serialize_support():
+            return
+        fmu_state = self.fmu.get_fmu_state()
+        reset_state = self.get_reset_state()
+        del reset_state['processors']
+        reset_state['fmu_state'] = self.fmu.serialize_fmu_state(fmu_state)
+        try:
+            self.fmu.free_fmu_state(fmu_state)
+        except AttributeError:
+            pass
+        try:
+            self.warmup_cache.put(self.warmup_key, reset_state)
+        except Exception as e:
+            print('WARNING: Could not write "fmu_warmup_cache" ({}).'.format(e))
+
+    def free_snapshot(self):
+        ''' release the snapshot '''
+        if self.snapshot:
+            try:
+                self.fmu.free_fmu_state(self.snapshot['fmu_state'])
+            except Exception:
+                pass
+        self.snapshot = None
+
+    async def astep(self, action, timeout=None, executor=None):
+        '''
+        Do step in an executor without blocking the asyncio event loop, see step.
+        Several environments can step concurrently, e.g. with asyncio.gather.
+
+        Inputs
+        ------
+        action (np.array): Actions of the step.
+        timeout (float): Timeout in seconds, default None. Raises asyncio.TimeoutError.
+        executor (concurrent.futures.Executor): Executor, default None (default executor
+                                                of the event loop).
+
+        Returns
+        -------
+        res (tuple): State, reward, done, and info, see step.
+        '''
+        return await self.run_async(self.step, action, timeout=timeout, executor=executor)
+
+    async def areset(self, timeout=None, executor=None):
+        '''
+        Reset the environment in an executor without blocking the asyncio event loop,
+        see reset and astep.
+
+        Inputs
+        ------
+        timeout (float): Timeout in seconds, default None. Raises asyncio.TimeoutError.
+        executor (concurrent.futures.Executor): Executor, default None (default executor
+                                                of the event loop).
+
+        Returns
+        -------
+        res (tuple): State and info, see reset.
+        '''
+        return await self.run_async(self.reset, timeout=timeout, executor=executor)
+
+    async def run_async(self, fun, *args, timeout=None, executor=None):
+        '''
+        Run a method in an executor. Calls of one environment are serialized. A call
+        which is cancelled or times out before it started is skipped; a call which
+        already started completes in the background and the next call waits for it.
+
+        Inputs
+        ------
+        fun (fun): Method of the environment.
+        args: Arguments of fun.
+        timeout (float): Timeout in seconds, default None.
+        executor (concurrent.futures.Executor): Executor, default None.
+
+        Returns
+        -------
+        res (object): Return value of fun.
+        '''
+        cancelled = threading.Event()
+        def call():
+            with self.async_lock:
+                if cancelled.is_set():
+                    return None
+                return fun(*args)
+        future = asyncio.get_running_loop().run_in_executor(executor, call)
+        try:
+            if timeout is None:
+                return await future
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            cancelled.set()
+            raise
 
     def render(self):
         ''' render environment '''
         return False
 
     def close(self):
+        ''' unload fmu, close the sink, and remove the state feed '''
+        self.close_fmu()
+        if self.sink:
+            self.write_sink(done=True)
+            self.sink.close()
+        if self.feed:
+            self.feed.close()
+            self.feed = None
+
+    def close_fmu(self):
         ''' unload fmu here '''
+        self.free_snapshot()
         try:
             if self.fmu_loaded:
-                self.fmu.terminate()
+                with working_directory(self.parameter['fmu_work_dir']):
+                    self.fmu.terminate()
         except Exception as e:
             print(e)
         self.fmu = None
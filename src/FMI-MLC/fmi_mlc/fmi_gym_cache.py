@@ -0,0 +1,289 @@
+"""
+FMI-MLC disk cache.
+"""
+
+import os
+import types
+import atexit
+import pickle
+import shutil
+import hashlib
+import zipfile
+import tempfile
+import functools
+import threading
+import numpy as np
+import pandas as pd
+
+file_hashes = {}
+extracted_fmus = {}
+extract_lock = threading.Lock()
+
+def file_hash(path):
+    '''
+    Returns the SHA-256 hash of a file. Hashes are cached per process and
+    recomputed when the modification time or size of the file changes.
+
+    Inputs
+    ------
+    path (str): Path to the file.
+
+    Returns
+    -------
+    digest (str): Hex digest of the file content.
+    '''
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in file_hashes:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        file_hashes[key] = h.hexdigest()
+    return file_hashes[key]
+
+def hash_object(obj):
+    '''
+    Returns the SHA-256 hash of the representation of an object.
+
+    Inputs
+    ------
+    obj (object): Object with deterministic repr, e.g. nested lists and dicts.
+
+    Returns
+    -------
+    digest (str): Hex digest.
+    '''
+    return hashlib.sha256(repr(obj).encode('utf8')).hexdigest()
+
+def get_qualname(obj):
+    ''' returns the qualified name of a function or class '''
+    return '{}.{}'.format(getattr(obj, '__module__', ''),
+                          getattr(obj, '__qualname__', type(obj).__qualname__))
+
+def normalize(obj, strict=True, seen=None):
+    '''
+    Returns a deterministic representation of an object for hashing. Functions and
+    classes are represented by their qualified name, partial functions by function
+    and arguments, arrays and data frames by their values, and other objects (e.g.
+    controller or processor instances) by their class and attributes, or the digest
+    of their pickle if they have no attributes.
+
+    Inputs
+    ------
+    obj (object): Object, e.g. parameter of fmi_gym.
+    strict (bool): Raise ValueError for objects which cannot be identified across
+                   processes, e.g. lambdas, closures, and objects which cannot be
+                   pickled, default True. Otherwise they are represented by their
+                   identity, which is only valid within the process.
+    seen (set): Ids of the enclosing objects to stop at reference cycles, default None.
+
+    Returns
+    -------
+    obj (object): Nested lists, tuples, and primitive values.
+    '''
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes)):
+        return obj
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            return ['array', normalize(obj.tolist(), strict, seen)]
+        # Hash the buffer, e.g. of annual input data, instead of converting each value
+        return ['array', str(obj.dtype), obj.shape,
+                hashlib.sha256(np.ascontiguousarray(obj).tobytes()).hexdigest()]
+    if isinstance(obj, (type, types.ModuleType)):
+        return get_qualname(obj) if isinstance(obj, type) else obj.__name__
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return ['cycle']
+    seen = seen | {id(obj)}
+    if isinstance(obj, dict):
+        return [(str(k), normalize(v, strict, seen)) \
+                for k, v in sorted(obj.items(), key=lambda x: str(x[0]))]
+    if isinstance(obj, (list, tuple)):
+        return [normalize(v, strict, seen) for v in obj]
+    if isinstance(obj, (set, frozenset)):
+        return ['set'] + sorted([normalize(v, strict, seen) for v in obj], key=repr)
+    if isinstance(obj, (pd.Series, pd.DataFrame)):
+        frame = obj.to_frame() if isinstance(obj, pd.Series) else obj
+        return ['pandas', normalize(list(frame.columns), strict, seen),
+                normalize(frame.index.to_numpy(), strict, seen),
+                [normalize(frame.iloc[:, i].to_numpy(), strict, seen) \
+                 for i in range(frame.shape[1])]]
+    if isinstance(obj, functools.partial):
+        return ['partial', normalize(obj.func, strict, seen),
+                normalize(obj.args, strict, seen), normalize(obj.keywords, strict, seen)]
+    if isinstance(obj, types.MethodType):
+        return ['method', normalize(obj.__func__, strict, seen),
+                normalize(obj.__self__, strict, seen)]
+    if isinstance(obj, (types.FunctionType, types.BuiltinFunctionType)):
+        # Lambdas and nested functions share their name, closures their code
+        if '<' not in obj.__qualname__ and not getattr(obj, '__closure__', None):
+            return get_qualname(obj)
+        if strict:
+            raise ValueError('The function "{}" cannot be identified across processes, ' \
+                             'use a module level function or class.'.format(get_qualname(obj)))
+        return ['id', get_qualname(obj), id(obj)]
+    if hasattr(obj, '__dict__'):
+        return [get_qualname(type(obj)), normalize(vars(obj), strict, seen)]
+    try:
+        return [get_qualname(type(obj)), hashlib.sha256(pickle.dumps(obj)).hexdigest()]
+    except Exception:
+        if strict:
+            raise ValueError('The object "{}" cannot be identified across processes, ' \
+                             'it cannot be pickled.'.format(get_qualname(type(obj))))
+        return ['id', get_qualname(type(obj)), id(obj)]
+
+def extract_fmu(path):
+    '''
+    Extract an FMU archive once per process. The extracted directories are
+    keyed by path and content hash, and removed when the process exits.
+
+    Inputs
+    ------
+    path (str): Path to the .fmu file.
+
+    Returns
+    -------
+    directory (str): Directory of the extracted FMU.
+    '''
+    path = os.path.realpath(path)
+    key = (path, file_hash(path))
+    with extract_lock:
+        directory = extracted_fmus.get(key)
+        if directory is None or not os.path.isdir(directory):
+            directory = tempfile.mkdtemp(prefix='fmi_gym_fmu_')
+            with zipfile.ZipFile(path) as f:
+                f.extractall(directory)
+            extracted_fmus[key] = directory
+    return directory
+
+def remove_extracted_fmus():
+    ''' remove all directories of extract_fmu '''
+    with extract_lock:
+        for directory in extracted_fmus.values():
+            shutil.rmtree(directory, ignore_errors=True)
+        extracted_fmus.clear()
+
+atexit.register(remove_extracted_fmus)
+
+class disk_cache(object):
+    '''Size-bounded pickle cache on disk with least recently used eviction.'''
+
+    def __init__(self, path, max_size=1e9, suffix='.pkl'):
+        '''
+        Setup the cache.
+
+        Inputs
+        ------
+        path (str): Directory of the cache, created if missing.
+        max_size (float): Maximum size of the cache in bytes, default 1e9.
+        suffix (str): File extension of entries, default '.pkl'.
+        '''
+        self.path = path
+        self.max_size = max_size
+        self.suffix = suffix
+        os.makedirs(self.path, exist_ok=True)
+
+    def get_path(self, key):
+        ''' path of the entry '''
+        return os.path.join(self.path, key + self.suffix)
+
+    def __contains__(self, key):
+        return os.path.exists(self.get_path(key))
+
+    def get(self, key, default=None):
+        '''
+        Returns a cached object, and marks it as recently used.
+
+        Inputs
+        ------
+        key (str): Key of the entry (valid file name).
+        default (object): Returned if the entry does not exist, default None.
+
+        Returns
+        -------
+        obj (object): Cached object.
+        '''
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                obj = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            print('WARNING: Removing corrupt cache entry "{}" ({}).'.format(path, e))
+            self.remove(key)
+            return default
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return obj
+
+    def put(self, key, obj):
+        '''
+        Store an object. The entry is written atomically and least recently used
+        entries are evicted when the cache exceeds max_size.
+
+        Inputs
+        ------
+        key (str): Key of the entry (valid file name).
+        obj (object): Picklable object.
+        '''
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.get_path(key))
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict(keep=key)
+
+    def remove(self, key):
+        ''' remove an entry '''
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        '''
+        Returns the entries of the cache.
+
+        Returns
+        -------
+        entries (list): Tuples of (last use, size, key), oldest first.
+        '''
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-len(self.suffix)]))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        '''
+        Remove least recently used entries until the cache is within max_size.
+
+        Inputs
+        ------
+        keep (str): Key which is never evicted, default None.
+        '''
+        entries = self.entries()
+        size = sum(e[1] for e in entries)
+        for _, entry_size, key in entries:
+            if size <= self.max_size:
+                break
+            if key == keep:
+                continue
+            self.remove(key)
+            size -= entry_size
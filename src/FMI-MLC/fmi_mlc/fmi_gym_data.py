@@ -0,0 +1,415 @@
+"""
+FMI-MLC data storage.
+"""
+
+import os
+import shutil
+import pickle
+import weakref
+import tempfile
+import numpy as np
+import pandas as pd
+
+def promote_dtype(dtype_a, dtype_b):
+    '''
+    Returns the dtype which can hold values of both inputs.
+
+    Inputs
+    ------
+    dtype_a (np.dtype): First dtype.
+    dtype_b (np.dtype): Second dtype.
+
+    Returns
+    -------
+    dtype (np.dtype): Common dtype, object when no numeric promotion exists.
+    '''
+    if dtype_a == dtype_b:
+        return dtype_a
+    try:
+        dtype = np.promote_types(dtype_a, dtype_b)
+    except TypeError:
+        return np.dtype(object)
+    if dtype.kind in 'SU':
+        return np.dtype(object)
+    return dtype
+
+class data_store(object):
+    '''Growable, preallocated column store for data recorded by fmi_gym.'''
+
+    def __init__(self, capacity=1024):
+        '''
+        Setup the column store. Each column is kept as a separate NumPy array
+        which is preallocated and doubled in size when full, so that appending
+        a row is amortized O(1). The data is only converted to a pd.DataFrame
+        when requested with to_frame().
+
+        Inputs
+        ------
+        capacity (int): Number of rows to preallocate, default 1024.
+        '''
+        self.capacity = max(int(capacity), 1)
+        self.clear()
+
+    def __len__(self):
+        return self.size
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['frame'] = None
+        return state
+
+    @property
+    def empty(self):
+        ''' True if no rows are stored '''
+        return self.size == 0
+
+    def clear(self):
+        ''' remove all rows and columns '''
+        self.columns = []
+        self.arrays = {}
+        self.index = None
+        self.size = 0
+        self.frame = None
+
+    def reserve(self, rows):
+        '''
+        Preallocate memory for a number of rows.
+
+        Inputs
+        ------
+        rows (int): Total number of rows the store must hold.
+        '''
+        if rows <= self.capacity:
+            return
+        while self.capacity < rows:
+            self.capacity *= 2
+        for c in self.columns:
+            self.arrays[c] = self._resize(self.arrays[c])
+        if self.index is not None:
+            self.index = self._resize(self.index)
+
+    def _resize(self, arr):
+        ''' copy array into new memory with current capacity '''
+        new = np.empty(self.capacity, dtype=arr.dtype)
+        new[:self.size] = arr[:self.size]
+        return new
+
+    def _fill_missing(self, arr, rows):
+        ''' set missing values for rows (slice) '''
+        if arr.dtype.kind in 'mM':
+            arr[rows] = np.datetime64('NaT') if arr.dtype.kind == 'M' else np.timedelta64('NaT')
+            return arr
+        if arr.dtype.kind not in 'fcO':
+            arr = arr.astype(np.float64)
+        arr[rows] = np.nan
+        return arr
+
+    def _put(self, arr, values, rows):
+        ''' write values to the next rows of arr (which is allocated if None) '''
+        if arr is None:
+            arr = np.empty(self.capacity, dtype=values.dtype)
+            if self.size:
+                arr = self._fill_missing(arr, slice(0, self.size))
+        else:
+            dtype = promote_dtype(arr.dtype, values.dtype)
+            if dtype != arr.dtype:
+                arr = arr.astype(dtype)
+        arr[self.size:self.size+rows] = values
+        return arr
+
+    def _append(self, index, items, rows):
+        ''' append rows given by index and (column, values) items '''
+        if rows == 0:
+            return
+        self.reserve(self.size + rows)
+        self.index = self._put(self.index, index, rows)
+        written = 0
+        for c, values in items:
+            if c not in self.arrays:
+                self.columns.append(c)
+                self.arrays[c] = None
+            self.arrays[c] = self._put(self.arrays[c], values, rows)
+            written += 1
+        if written < len(self.columns):
+            written = set(c for c, _ in items)
+            for c in self.columns:
+                if c not in written:
+                    self.arrays[c] = self._fill_missing(self.arrays[c],
+                                                        slice(self.size, self.size+rows))
+        self.size += rows
+        self.frame = None
+
+    def append(self, data):
+        '''
+        Append rows to the store. Columns not yet in the store are added and
+        filled with missing values for previous rows, and columns of the store
+        missing in data are filled with missing values.
+
+        Inputs
+        ------
+        data (pd.DataFrame): Rows to append.
+        '''
+        items = [(c, v.to_numpy()) for c, v in data.items()]
+        self._append(data.index.to_numpy(), items, len(data))
+
+    def append_array(self, index, columns, values, index_name=None):
+        '''
+        Append rows given as NumPy array, see append().
+
+        Inputs
+        ------
+        index (float or np.array): Index of the rows.
+        columns (list): Column labels of values.
+        values (np.array): One row (1D) or multiple rows (2D) of data.
+        index_name (str): Also store the index in this column, default None.
+        '''
+        index = np.atleast_1d(index)
+        values = np.atleast_2d(values)
+        items = list(zip(columns, values.T))
+        if index_name is not None:
+            items.insert(0, (index_name, index))
+        self._append(index, items, len(index))
+
+    def keep_last(self, rows=1):
+        '''
+        Remove all but the last rows.
+
+        Inputs
+        ------
+        rows (int): Number of rows to keep, default 1.
+        '''
+        rows = min(rows, self.size)
+        start = self.size - rows
+        for c in self.columns:
+            self.arrays[c][:rows] = self.arrays[c][start:self.size].copy()
+        if self.index is not None:
+            self.index[:rows] = self.index[start:self.size].copy()
+        self.size = rows
+        self.frame = None
+
+    def to_frame(self, start=0):
+        '''
+        Returns the stored data. The frame is cached until the store is modified,
+        changes to the returned frame are therefore not written back to the store.
+
+        Inputs
+        ------
+        start (int): First row, default 0. Frames of later rows are not cached.
+
+        Returns
+        -------
+        data (pd.DataFrame): Stored data.
+        '''
+        if start:
+            if self.index is None:
+                return pd.DataFrame()
+            data = {c: self.arrays[c][start:self.size].copy() for c in self.columns}
+            return pd.DataFrame(data, columns=self.columns,
+                                index=self.index[start:self.size].copy())
+        if self.frame is None:
+            if self.index is None:
+                self.frame = pd.DataFrame()
+            else:
+                data = {c: self.arrays[c][:self.size].copy() for c in self.columns}
+                self.frame = pd.DataFrame(data, columns=self.columns,
+                                          index=self.index[:self.size].copy())
+        return self.frame
+
+class episode_store(object):
+    '''Bounded list of episode data which spills old episodes to disk.'''
+
+    def __init__(self, max_episodes=None, path=None):
+        '''
+        Setup the episode store. The last max_episodes episodes are kept in memory
+        (ring buffer) and older episodes are written to disk, with one .npy file per
+        column. Spilled episodes are loaded from memory-mapped files when accessed,
+        so that iterating over the store only holds one episode in memory.
+
+        Inputs
+        ------
+        max_episodes (int): Number of episodes kept in memory, default None (all).
+        path (str): Directory for spilled episodes, default None. None uses a temporary
+                    directory which is removed with the store.
+        '''
+        self.max_episodes = max_episodes
+        self.path = path
+        self.memory = []
+        self.spilled = []
+        self.finalizer = None
+
+    def __len__(self):
+        return len(self.spilled) + len(self.memory)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self[k] for k in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('episode index out of range')
+        if key < len(self.spilled):
+            return self.load(self.spilled[key])
+        return self.memory[key - len(self.spilled)]
+
+    def __repr__(self):
+        return 'episode_store({} episodes, {} in memory)'.format(len(self), len(self.memory))
+
+    def append(self, data):
+        '''
+        Append the data of an episode, and spill the oldest episode in memory to
+        disk if more than max_episodes are in memory.
+
+        Inputs
+        ------
+        data (pd.DataFrame): Data of the episode.
+        '''
+        self.memory.append(data)
+        if self.max_episodes is not None:
+            while len(self.memory) > self.max_episodes:
+                self.spilled.append(self.spill(self.memory.pop(0), len(self.spilled)))
+
+    def get_path(self):
+        ''' returns the directory for spilled episodes '''
+        if self.path is None:
+            self.path = tempfile.mkdtemp(prefix='fmi_gym_episodes_')
+            self.finalizer = weakref.finalize(self, shutil.rmtree, self.path, True)
+        os.makedirs(self.path, exist_ok=True)
+        return self.path
+
+    def spill(self, data, number):
+        '''
+        Write the data of an episode to disk.
+
+        Inputs
+        ------
+        data (pd.DataFrame): Data of the episode.
+        number (int): Number of the episode.
+
+        Returns
+        -------
+        path (str): Directory of the episode.
+        '''
+        path = os.path.join(self.get_path(), 'episode_{:06d}'.format(number))
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'index.npy'), data.index.to_numpy(), allow_pickle=True)
+        for i, (_, values) in enumerate(data.items()):
+            np.save(os.path.join(path, 'c{}.npy'.format(i)), values.to_numpy(),
+                    allow_pickle=True)
+        with open(os.path.join(path, 'columns.pkl'), 'wb') as f:
+            pickle.dump(list(data.columns), f)
+        return path
+
+    def load(self, path):
+        '''
+        Load the data of a spilled episode. Numeric columns are memory-mapped.
+
+        Inputs
+        ------
+        path (str): Directory of the episode.
+
+        Returns
+        -------
+        data (pd.DataFrame): Data of the episode.
+        '''
+        def load_array(name):
+            try:
+                return np.load(os.path.join(path, name), mmap_mode='r')
+            except ValueError:
+                # Object arrays cannot be memory-mapped
+                return np.load(os.path.join(path, name), allow_pickle=True)
+        with open(os.path.join(path, 'columns.pkl'), 'rb') as f:
+            columns = pickle.load(f)
+        data = {c: load_array('c{}.npy'.format(i)) for i, c in enumerate(columns)}
+        return pd.DataFrame(data, columns=columns, index=load_array('index.npy'))
+
+    def clear(self):
+        ''' remove all episodes '''
+        for path in self.spilled:
+            shutil.rmtree(path, ignore_errors=True)
+        self.memory = []
+        self.spilled = []
+
+class lazy_info(dict):
+    '''Info dictionary which computes callable entries on first access.'''
+
+    def __init__(self, **kwargs):
+        '''
+        Setup the info dictionary.
+
+        Inputs
+        ------
+        kwargs (callable): Entries of the dictionary, computed when first read.
+        '''
+        super(lazy_info, self).__init__()
+        self.lazy = {}
+        for k, v in kwargs.items():
+            dict.__setitem__(self, k, None)
+            self.lazy[k] = v
+
+    def resolve(self, key=None):
+        '''
+        Compute lazy entries.
+
+        Inputs
+        ------
+        key (str): Entry to compute, default None. None computes all entries.
+        '''
+        keys = list(self.lazy.keys()) if key is None else [key]
+        for k in keys:
+            if k in self.lazy:
+                dict.__setitem__(self, k, self.lazy.pop(k)())
+
+    def __getitem__(self, key):
+        self.resolve(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self.lazy.pop(key, None)
+        dict.__setitem__(self, key, value)
+
+    def __repr__(self):
+        self.resolve()
+        return dict.__repr__(self)
+
+    def get(self, key, default=None):
+        self.resolve(key)
+        return dict.get(self, key, default)
+
+    def pop(self, key, *default):
+        self.resolve(key)
+        return dict.pop(self, key, *default)
+
+    def __iter__(self):
+        # A custom __iter__ disables the fast path of dict(info) and {**info}, which
+        # would copy the unresolved entries, they use keys() and __getitem__ instead
+        return dict.__iter__(self)
+
+    def items(self):
+        self.resolve()
+        return dict.items(self)
+
+    def values(self):
+        self.resolve()
+        return dict.values(self)
+
+    def copy(self):
+        self.resolve()
+        return dict(self)
+
+    def __eq__(self, other):
+        self.resolve()
+        if isinstance(other, lazy_info):
+            other.resolve()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __reduce__(self):
+        # Pickle as plain dict, e.g. for multiprocessing queues, since unpickling calls
+        # __setitem__ before __init__ and functions of the entries cannot be pickled
+        return (dict, (self.copy(), ))
@@ -0,0 +1,159 @@
+"""
+FMI-MLC shared-memory state feed.
+"""
+
+import json
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+# Header: seq, episode, step, n_values, names_size (int64) and time, reward (float64)
+HEADER_INTS = 5
+HEADER_FLOATS = 2
+HEADER_SIZE = 8 * (HEADER_INTS + HEADER_FLOATS)
+
+class state_feed(object):
+    '''Publisher of the latest fmi_gym state to a named shared memory segment.'''
+
+    def __init__(self, name, names):
+        '''
+        Create the shared memory segment. The segment holds a header with sequence
+        number, episode, step counter, time, and reward, followed by the state vector
+        and the names of the state as JSON. Updates follow a seqlock protocol: the
+        sequence number is odd while the segment is written, and readers retry until
+        they read the same even sequence number before and after copying the state,
+        see state_reader.
+
+        Inputs
+        ------
+        name (str): Name of the shared memory segment.
+        names (list): Names of the state vector.
+        '''
+        self.name = name
+        self.names = list(names)
+        encoded = json.dumps(self.names).encode('utf8')
+        size = HEADER_SIZE + 8 * len(self.names) + len(encoded)
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            print('WARNING: Replacing the existing shared memory segment "{}".'.format(name))
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        buf = self.shm.buf
+        self.ints = np.ndarray((HEADER_INTS, ), dtype=np.int64, buffer=buf)
+        self.floats = np.ndarray((HEADER_FLOATS, ), dtype=np.float64, buffer=buf,
+                                 offset=8*HEADER_INTS)
+        self.values = np.ndarray((len(self.names), ), dtype=np.float64, buffer=buf,
+                                 offset=HEADER_SIZE)
+        self.ints[:] = [0, 0, 0, len(self.names), len(encoded)]
+        self.floats[:] = np.nan
+        self.values[:] = np.nan
+        start = HEADER_SIZE + 8 * len(self.names)
+        buf[start:start+len(encoded)] = encoded
+        self.step = 0
+
+    def publish(self, time, state, reward=np.nan, episode=0, count=True):
+        '''
+        Publish the state.
+
+        Inputs
+        ------
+        time (float): Time of the state, in seconds.
+        state (np.array): State vector.
+        reward (float): Reward of the step, default np.nan.
+        episode (int): Episode number, default 0.
+        count (bool): Increment the step counter, default True (False e.g. on reset).
+        '''
+        if count:
+            self.step += 1
+        ints = self.ints
+        ints[0] += 1
+        self.values[:] = state
+        self.floats[0] = time
+        self.floats[1] = reward
+        ints[1] = episode
+        ints[2] = self.step
+        ints[0] += 1
+
+    def close(self):
+        ''' close and remove the shared memory segment '''
+        if self.shm is None:
+            return
+        self.ints = self.floats = self.values = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        self.shm = None
+
+class state_reader(object):
+    '''Reader of a state_feed from another process.'''
+
+    def __init__(self, name):
+        '''
+        Attach to the shared memory segment of a state_feed. The segment remains
+        owned by the publisher.
+
+        Inputs
+        ------
+        name (str): Name of the shared memory segment.
+        '''
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 registers the segment with the resource tracker of this
+            # process, which would remove it when the reader exits
+            self.shm = shared_memory.SharedMemory(name=name)
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+            except Exception:
+                pass
+        buf = self.shm.buf
+        self.ints = np.ndarray((HEADER_INTS, ), dtype=np.int64, buffer=buf)
+        self.floats = np.ndarray((HEADER_FLOATS, ), dtype=np.float64, buffer=buf,
+                                 offset=8*HEADER_INTS)
+        n = int(self.ints[3])
+        self.values = np.ndarray((n, ), dtype=np.float64, buffer=buf, offset=HEADER_SIZE)
+        start = HEADER_SIZE + 8 * n
+        self.names = json.loads(bytes(buf[start:start+int(self.ints[4])]).decode('utf8'))
+        self.state = np.empty(n)
+
+    def read(self, timeout=1):
+        '''
+        Read a consistent copy of the latest state.
+
+        Inputs
+        ------
+        timeout (float): Maximum time to wait for a consistent copy in seconds, default 1.
+
+        Returns
+        -------
+        res (dict): Episode, step counter, time, reward, and state (np.array).
+        '''
+        ints = self.ints
+        end = None
+        while True:
+            seq = int(ints[0])
+            if seq % 2 == 0:
+                np.copyto(self.state, self.values)
+                res = {'episode': int(ints[1]), 'step': int(ints[2]),
+                       'time': float(self.floats[0]), 'reward': float(self.floats[1])}
+                if int(ints[0]) == seq:
+                    res['state'] = self.state.copy()
+                    return res
+            if end is None:
+                end = time.perf_counter() + timeout
+            elif time.perf_counter() > end:
+                raise TimeoutError('No consistent state of the feed within the timeout.')
+
+    def close(self):
+        ''' detach from the shared memory segment '''
+        if self.shm is None:
+            return
+        self.ints = self.floats = self.values = None
+        self.shm.close()
+        self.shm = None
@@ -0,0 +1,139 @@
+"""
+FMI-MLC mock FMU.
+"""
+
+import time
+import pickle
+import numpy as np
+
+def get_mock_parameter(n_inputs=2, n_outputs=2, **kwargs):
+    '''
+    Returns fmi_gym parameters for the mock_fmu.
+
+    Inputs
+    ------
+    n_inputs (int): Number of inputs (actions), default 2.
+    n_outputs (int): Number of outputs (observations), default 2.
+    kwargs: Additional parameters of fmi_gym.
+
+    Returns
+    -------
+    parameter (dict): Parameters of fmi_gym.
+    '''
+    parameter = {
+        'fmu_path': 'mock.fmu',
+        'action_names': ['u{}'.format(i) for i in range(n_inputs)],
+        'action_min': -1,
+        'action_max': 1,
+        'observation_names': ['y{}'.format(i) for i in range(n_outputs)],
+        'reward_names': ['r'],
+        'fmu_final_time': 24*60*60,
+        }
+    parameter.update(kwargs)
+    return parameter
+
+class mock_fmu(object):
+    '''Configurable FMU handler with linear dynamics, e.g. for tests and benchmarks.'''
+
+    def __init__(self, path, log_level=0, kind='cs', n_inputs=2, n_outputs=2,
+                 step_cost=0, seed=0, **kwargs):
+        '''
+        Setup the mock FMU. The outputs y0..yN follow first order dynamics driven by
+        the inputs u0..uM and a daily disturbance, and the output r is the negative
+        deviation of the outputs from 21. The handler supports names and value
+        references, and getting, setting, and serializing its state. Use
+        functools.partial to configure the handler for fmi_gym, e.g.
+        fmi_gym(parameter, pyfmi=partial(mock_fmu, n_outputs=17)).
+
+        Inputs
+        ------
+        path (str): Path to the FMU (ignored).
+        log_level (int): Log level (ignored).
+        kind (str): Kind of FMU (ignored).
+        n_inputs (int): Number of inputs, default 2.
+        n_outputs (int): Number of outputs, default 2.
+        step_cost (float): Wall time of each do_step in seconds, default 0.
+        seed (int): Seed of the model coefficients, default 0.
+        '''
+        self.n_inputs = n_inputs
+        self.n_outputs = n_outputs
+        self.step_cost = step_cost
+        rng = np.random.RandomState(seed)
+        self.a = rng.uniform(0.5, 0.9, n_outputs)
+        self.b = rng.uniform(-1, 1, (n_outputs, n_inputs))
+        self.names = ['u{}'.format(i) for i in range(n_inputs)] \
+            + ['y{}'.format(i) for i in range(n_outputs)] + ['r']
+        self.refs = {n: i for i, n in enumerate(self.names)}
+        self.reset()
+
+    def reset(self):
+        ''' reset the model '''
+        self.values = np.zeros(len(self.names))
+        self.values[self.n_inputs:-1] = 20
+        self.time = 0
+
+    def get_variable_valueref(self, name):
+        return self.refs[name]
+
+    def get_variable_data_type(self, name):
+        return 0
+
+    def set(self, names, values):
+        if isinstance(names, str):
+            names, values = [names], [values]
+        for n, v in zip(names, values):
+            if n in self.refs:
+                self.values[self.refs[n]] = v
+
+    def get(self, names):
+        if isinstance(names, str):
+            names = [names]
+        return self.values[[self.refs[n] for n in names]]
+
+    def set_real(self, refs, values):
+        self.values[refs] = values
+
+    def get_real(self, refs):
+        return self.values[refs]
+
+    def setup_experiment(self, start_time=0, **kwargs):
+        self.time = start_time
+
+    def initialize(self):
+        pass
+
+    def do_step(self, current_t, step_size):
+        if self.step_cost:
+            end = time.perf_counter() + self.step_cost
+            while time.perf_counter() < end:
+                pass
+        u = self.values[:self.n_inputs]
+        y = self.values[self.n_inputs:-1]
+        a = self.a ** (step_size / 3600)
+        disturbance = np.sin(2 * np.pi * current_t / (24*60*60))
+        y[:] = a * y + (1 - a) * (20 + self.b.dot(u) + disturbance)
+        self.values[-1] = -np.abs(y - 21).sum()
+        self.time = current_t + step_size
+        return 0
+
+    def terminate(self):
+        pass
+
+    def get_capability_flags(self):
+        return {'canGetAndSetFMUstate': True, 'canSerializeFMUstate': True}
+
+    def get_fmu_state(self):
+        return (self.values.copy(), self.time)
+
+    def set_fmu_state(self, state):
+        self.values = state[0].copy()
+        self.time = state[1]
+
+    def free_fmu_state(self, state):
+        pass
+
+    def serialize_fmu_state(self, state):
+        return pickle.dumps(state)
+
+    def deserialize_fmu_state(self, state):
+        return pickle.loads(state)
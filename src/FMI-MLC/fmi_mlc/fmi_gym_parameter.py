@@ -9,21 +9,68 @@ def get_default_parameter():
     fmi_gym parameter:
         precision (str): Precision of data exchange, default 'float32'.
         seed (int): Seed for np.random, default None.
-        preprocessor (#classA): Custom Python function to pre-process data
-                                before FMU, default None.
-        postprocessor (#classA): Custom Python function to post-process data
-                                 after FMU, default None.
+        preprocessor (#classA or #classC): Custom Python function to pre-process data
+                                           before FMU, default None.
+        postprocessor (#classA or #classC): Custom Python function to post-process data
+                                            after FMU, default None.
         reset_on_init (bool): Reset environment when initializing, default False.
         store_data (bool): Store inputs, FMU outputs, and reward in self.data, default False.
         store_all_data (bool): Store all episode data in self.data_all.
                                The flag "store_data" must be set to True. Default False.
+        store_all_data_max (int): Number of episodes of "store_all_data" kept in memory,
+                                  default None (all). Older episodes are written to disk
+                                  and memory-mapped when read from self.data_all.
+        store_all_data_path (str): Directory for episodes of "store_all_data" written to
+                                   disk, default None (temporary directory).
         init_fmu (bool): Initialize FMU when fmi_gym resets, default True.
-        stateprocessor (#classA): Custom Python function to midify state object, default None.
+        stateprocessor (#classA or #classC): Custom Python function to midify state object,
+                                             default None.
         resetprocessor (#classB): Custom Python function executed on fmi_gym reset, default None.
         ignore_reset (bool): Ignore the reset command (keep fmu/states), default False.
         store_warmup (bool): Store the data collected during warmup, default False.
+        numpy_step (bool): Exchange data as NumPy arrays instead of pd.DataFrame during
+                           step, default False. This mode cannot be combined with
+                           "preprocessor" or "postprocessor" of #classA, and external
+                           observations are set to their default values.
+        info_data (str): Format of info['data'] returned by step and reset, with None: not
+                         returned, 'dict': pd.DataFrame.to_dict(), 'json':
+                         pd.DataFrame.to_json(), and 'lazy': JSON of the data of the step
+                         or reset, computed when info['data'] is first read. Lazy info
+                         pickles as dict. Default 'lazy'.
+        store_sink (str): Stream the data of "store_data" in chunks to a Parquet directory
+                          or Arrow IPC stream, default None. The files can be read while the
+                          simulation is running and self.data only holds the rows not yet
+                          written. The flag "store_data" must be set to True and
+                          "store_all_data" is disabled. Requires the "pyarrow" package.
+        store_sink_format (str): Format of "store_sink", 'parquet' or 'arrow', default None
+                                 ('arrow' for paths ending with '.arrow', '.arrows', or
+                                 '.ipc', otherwise 'parquet').
+        store_sink_chunk (int): Number of rows written per chunk to "store_sink", default 10000.
+        compact_data (bool): Record data, states, and observations of rollouts with the dtype
+                             of "precision" and the time in integer seconds, default False.
+        profile (bool): Record the wall time of the phases of each step in self.profiler,
+                        default False. See self.profiler.summary() for statistics.
+        profile_log_interval (int): Print a summary line of "profile" every
+                                    profile_log_interval steps, default None.
+        profile_allocations (bool): Count the allocated memory blocks of each phase of
+                                    "profile", default False.
+        checkpoint_path (str): Path of a checkpoint file of the running episode, default None
+                               (disabled). Checkpoints hold the serialized FMU state (if
+                               supported) and the processors. The actions and the data not
+                               yet written to "store_sink" (of format 'parquet') are appended
+                               to the log checkpoint_path + '.log' at each checkpoint.
+                               Continue with fmi_gym.resume(), which replays the actions of
+                               the episode if the FMU state cannot be serialized.
+        checkpoint_interval (float): Simulated time between checkpoints in seconds, default
+                                     7*24*60*60.
+        state_feed (str): Name of a shared memory segment where the latest state, reward,
+                          time, and step counter are published after each step, default
+                          None. Other local processes read the feed with state_reader.
     fmu parameter:
         fmu_step_size (int): Step size of the FMU in seconds, default 60*60.
+        fmu_step_schedule (fun): Variable step size, default None (use "fmu_step_size"). A
+                                 function of the FMU time returning the step size in seconds,
+                                 e.g. step_schedule with calendar rules and action points.
         fmu_path (str): Path to the .fmu file, default ''.
         fmu_start_time (float): Start time of the FMU in seconds, default 0.
         fmu_warmup_time (float): The warmup time of the FMU in seconds, default None.
@@ -37,6 +84,42 @@ def get_default_parameter():
         fmu_kind (str): Type of FMU where currently only co-simulation is supported, default 'cs'.
         fmu_tolerance (float): Internal tolerance of the FMU solver, default 1e-6.
         fmu_param (dict): Parameters of the FMU to be set on initialize, default {}.
+        fmu_snapshot (bool): Save the FMU state after the first reset (and warmup) and restore
+                             it on subsequent resets instead of reloading the FMU, default
+                             False. Requires FMI 2.0 canGetAndSetFMUstate and a matching
+                             configuration, otherwise the FMU is reloaded.
+        fmu_warmup_cache (str): Directory of a disk cache with the serialized FMU state and
+                                data after reset (and warmup), default None (disabled). Entries
+                                are keyed by the FMU file, the parameter, and the state of the
+                                processors before the warmup, and restored instead of the
+                                warmup. The processors are not restored, so their state must
+                                not depend on the warmup. Lambdas and closures in the
+                                parameter disable the cache. Requires FMI 2.0
+                                canSerializeFMUstate.
+        fmu_warmup_cache_size (float): Maximum size of the warmup cache in bytes, least
+                                       recently used entries are evicted, default 1e9.
+        rollout_cache (str): Directory of a disk cache with the results of rollouts, default
+                             None (disabled). Rollouts of complete episodes are keyed by the
+                             FMU file, the parameter, the state of the processors, the start
+                             time, and the actions, and restored instead of the simulation.
+                             The FMU must be deterministic. Not used with "ignore_reset",
+                             and disabled by lambdas and closures in the parameter.
+        rollout_cache_size (float): Maximum size of the rollout cache in bytes, least
+                                    recently used entries are evicted, default 1e9.
+        fmu_extract_cache (bool): Extract the FMU archive only once per process and load the
+                                  extracted FMU (PyFMI handler only), default False. FMUs
+                                  with global state must not be instantiated concurrently.
+        fmu_reuse_instance (bool): Reset the FMU instance (FMI reset) on fmi_gym reset instead
+                                   of terminating and loading the FMU, default False.
+        fmu_work_dir (str): Working directory of the process while the FMU is loaded,
+                            initialized, and terminated, default None (current directory).
+                            Isolates the run directories of multiple FMU instances. The
+                            working directory of the whole process is changed (serialized
+                            by a lock), so it cannot be used together with threaded envs
+                            (fmi_gym_vec_thread, astep) whose FMUs or code access files by
+                            relative paths while another instance loads its FMU; use
+                            fmi_gym_vec instead. The paths of fmi_gym are resolved at
+                            initialization.
     data exchange parameter:
         inputs (dict): Static inputs of the FMU to be set on do_step, default {}.
         inputs_map (dict): Renaming of fmi_gym inputs to FMU inputs, default {}.
@@ -52,6 +135,20 @@ def get_default_parameter():
         external_observations (dict): Observations which are calculated outside of FMU
                                       and default values, default {}.
         reward_names (list): Lables of fmi_gym rewards, default [].
+        record_names (list): List of FMU outputs which are only recorded in the data,
+                             default [].
+        output_sampling (dict): Sampling interval in seconds of FMU outputs, default {}.
+                                Outputs are fetched and recorded when the time since
+                                "fmu_start_time" is a multiple of their interval, and are
+                                NaN in the data otherwise. Only applies to
+                                "hidden_observation_names" and "record_names";
+                                observations and rewards are fetched on every step.
+                                The data keeps one row per step with all columns, so the
+                                sampling saves FMU calls but not memory of "store_data";
+                                "store_sink" of format 'parquet' encodes the NaN runs
+                                compactly. Select the samples of an output with
+                                data[name].dropna(), since data.dropna() also drops the
+                                rows of other outputs.
 
     The #classA must be defined as:
 
@@ -67,6 +164,16 @@ def get_default_parameter():
     # Evaluate (data: pd.DataFrame, init: bool)
     data, fmi_gym_parameter = x.do_calc(data, fmi_gym_parameter, init)
 
+    The #classC (array protocol, without pd.DataFrame) must be defined as:
+
+    # Initialize (fmi_gym_parameter: dict)
+    x = yourclass(fmi_gym_parameter)
+    # Names of the columns read and written (list), set in __init__. The inputs can
+    # include 'time'. The outputs of a stateprocessor are the state.
+    x.input_names, x.output_names
+    # Evaluate (inputs: np.array, outputs: np.array, init: bool), write outputs in place
+    x.do_calc_array(inputs, outputs, init)
+
     Returns
     -------
     parameter (dict): Dictionary of parameters.
@@ -81,14 +188,29 @@ def get_default_parameter():
     parameter['reset_on_init'] = False
     parameter['store_data'] = False
     parameter['store_all_data'] = False
+    parameter['store_all_data_max'] = None
+    parameter['store_all_data_path'] = None
     parameter['init_fmu'] = True
     parameter['stateprocessor'] = None
     parameter['resetprocessor'] = None
     parameter['ignore_reset'] = False
     parameter['store_warmup'] = False
+    parameter['numpy_step'] = False
+    parameter['info_data'] = 'lazy'
+    parameter['store_sink'] = None
+    parameter['store_sink_format'] = None
+    parameter['store_sink_chunk'] = 10000
+    parameter['compact_data'] = False
+    parameter['profile'] = False
+    parameter['profile_log_interval'] = None
+    parameter['profile_allocations'] = False
+    parameter['checkpoint_path'] = None
+    parameter['checkpoint_interval'] = 7*24*60*60
+    parameter['state_feed'] = None
 
     # fmu parameter
     parameter['fmu_step_size'] = 60*60
+    parameter['fmu_step_schedule'] = None
     parameter['fmu_path'] = ''
     parameter['fmu_start_time'] = 0
     parameter['fmu_warmup_time'] = None
@@ -98,6 +220,14 @@ def get_default_parameter():
     parameter['fmu_kind'] = 'cs'
     parameter['fmu_tolerance'] = 1e-6
     parameter['fmu_param'] = {}
+    parameter['fmu_work_dir'] = None
+    parameter['fmu_snapshot'] = False
+    parameter['fmu_warmup_cache'] = None
+    parameter['fmu_warmup_cache_size'] = 1e9
+    parameter['rollout_cache'] = None
+    parameter['rollout_cache_size'] = 1e9
+    parameter['fmu_extract_cache'] = False
+    parameter['fmu_reuse_instance'] = False
 
     # data exchange parameter
     parameter['inputs'] = {}
@@ -112,4 +242,6 @@ def get_default_parameter():
     parameter['hidden_observation_names'] = []
     parameter['external_observations'] = {}
     parameter['reward_names'] = []
+    parameter['record_names'] = []
+    parameter['output_sampling'] = {}
     return parameter
@@ -0,0 +1,147 @@
+"""
+FMI-MLC step profiler.
+"""
+
+import sys
+import random
+from time import perf_counter
+from array import array
+import numpy as np
+import pandas as pd
+
+class step_profiler(object):
+    '''Per-phase wall time and allocation counters of fmi_gym steps.'''
+
+    def __init__(self, log_interval=None, count_allocations=False, log=print,
+                 max_samples=10000):
+        '''
+        Setup the profiler. Phases are measured with:
+
+            t = profiler.start()
+            ... # phase a
+            t = profiler.stop('a', t)
+            ... # phase b
+            t = profiler.stop('b', t)
+            profiler.end_step()
+
+        Inputs
+        ------
+        log_interval (int): Log a summary line every log_interval steps, default None.
+        count_allocations (bool): Count the net number of allocated memory blocks
+                                  (sys.getallocatedblocks) of each phase, default False.
+        log (fun): Function to log the summary line, default print.
+        max_samples (int): Number of wall times kept per phase for the percentiles,
+                           default 10000. Longer runs keep a uniform random sample
+                           (reservoir sampling), so that the memory is bounded; count,
+                           mean, min, max, and total are exact.
+        '''
+        self.log_interval = log_interval
+        self.count_allocations = count_allocations
+        self.log = log
+        self.max_samples = max(int(max_samples), 1)
+        self.clear()
+
+    def clear(self):
+        ''' remove all measurements '''
+        self.times = {}
+        self.allocations = {}
+        self.steps = 0
+        self.random = random.Random(0)
+
+    def start(self):
+        '''
+        Returns the start of a phase.
+
+        Returns
+        -------
+        start (float or tuple): Start time, and number of allocated blocks if counted.
+        '''
+        if self.count_allocations:
+            return (perf_counter(), sys.getallocatedblocks())
+        return perf_counter()
+
+    def stop(self, phase, start):
+        '''
+        Record a phase.
+
+        Inputs
+        ------
+        phase (str): Name of the phase.
+        start (float or tuple): Start of the phase, see start().
+
+        Returns
+        -------
+        start (float or tuple): Start of the next phase.
+        '''
+        now = self.start()
+        stats = self.times.get(phase)
+        if stats is None:
+            stats = self.times[phase] = {'count': 0, 'total': 0.0, 'min': np.inf,
+                                         'max': 0.0, 'samples': array('d')}
+            self.allocations[phase] = 0
+        if self.count_allocations:
+            t = now[0] - start[0]
+            self.allocations[phase] += now[1] - start[1]
+        else:
+            t = now - start
+        stats['count'] += 1
+        stats['total'] += t
+        if t < stats['min']:
+            stats['min'] = t
+        if t > stats['max']:
+            stats['max'] = t
+        samples = stats['samples']
+        if len(samples) < self.max_samples:
+            samples.append(t)
+        else:
+            i = self.random.randrange(stats['count'])
+            if i < self.max_samples:
+                samples[i] = t
+        return now
+
+    def end_step(self):
+        ''' count a step and log the summary line (if due) '''
+        self.steps += 1
+        if self.log_interval and self.steps % self.log_interval == 0:
+            self.log(self.summary_line())
+
+    def summary(self):
+        '''
+        Returns the summary statistics of the phases.
+
+        Returns
+        -------
+        summary (pd.DataFrame): Number of calls (count), mean, median (p50), 99th
+                                percentile (p99), minimum, maximum, and total wall time in
+                                seconds of each phase, and the net allocated blocks per call
+                                (allocations) if counted. The percentiles are estimated
+                                from at most max_samples wall times.
+        '''
+        rows = {}
+        for phase, stats in self.times.items():
+            samples = np.frombuffer(stats['samples'], dtype=np.float64)
+            rows[phase] = {'count': stats['count'], 'mean': stats['total'] / stats['count'],
+                           'p50': np.percentile(samples, 50),
+                           'p99': np.percentile(samples, 99),
+                           'min': stats['min'], 'max': stats['max'], 'total': stats['total']}
+            if self.count_allocations:
+                rows[phase]['allocations'] = self.allocations[phase] / stats['count']
+        columns = ['count', 'mean', 'p50', 'p99', 'min', 'max', 'total']
+        if self.count_allocations:
+            columns.append('allocations')
+        return pd.DataFrame.from_dict(rows, orient='index', columns=columns)
+
+    def summary_line(self):
+        '''
+        Returns a one-line summary, with the wall time per step and of each phase.
+
+        Returns
+        -------
+        line (str): Summary line.
+        '''
+        totals = {p: stats['total'] for p, stats in self.times.items()}
+        step = totals.get('step', sum(totals.values()))
+        phases = ', '.join('{} {:.1f}%'.format(p, 100 * t / step if step else 0) \
+            for p, t in sorted(totals.items(), key=lambda x: -x[1]) if p != 'step')
+        return 'INFO: fmi_gym profile of {} steps: {:.3f} ms/step ({}).'.format( \
+            self.steps, 1e3 * step / max(self.steps, 1), phases)
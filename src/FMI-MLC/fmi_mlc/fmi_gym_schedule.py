@@ -0,0 +1,107 @@
+"""
+FMI-MLC step schedules.
+"""
+
+import numpy as np
+
+class step_schedule(object):
+    '''Communication step size of fmi_gym by calendar rules.'''
+
+    def __init__(self, rules, default_step_size=60*60, start_date='2001-01-01'):
+        '''
+        Setup the schedule. Each rule is a dictionary with the keys:
+
+            step_size (float): Step size in seconds, required.
+            hours (tuple): Start and end hour of the day, default all. The end is
+                           exclusive and may be smaller than the start, e.g. (19, 7).
+            weekdays (list): Days of the week with 0: Monday and 6: Sunday, default all.
+            months (list): Months of the year with 1: January, default all.
+            action (bool): The actions can change at steps of this rule, default True.
+                           fmi_gym holds the last action until the next action point.
+
+        The first matching rule applies. Steps are shortened so that they end at the
+        next hour where another rule applies.
+
+        Inputs
+        ------
+        rules (list): Rules of the schedule.
+        default_step_size (float): Step size if no rule applies, in seconds, default 60*60.
+        start_date (str): Date of the FMU time 0, default '2001-01-01' (a Monday).
+        '''
+        self.rules = rules
+        self.default_step_size = default_step_size
+        self.start_date = np.datetime64(start_date, 's')
+        self.default_rule = {'step_size': default_step_size}
+
+    def __repr__(self):
+        return 'step_schedule({!r}, default_step_size={!r}, start_date={!r})'.format( \
+            self.rules, self.default_step_size, str(self.start_date))
+
+    def get_rule(self, time):
+        '''
+        Returns the rule applying at a time.
+
+        Inputs
+        ------
+        time (float): FMU time, in seconds.
+
+        Returns
+        -------
+        rule (dict): Matching rule.
+        '''
+        date = self.start_date + np.timedelta64(int(time), 's')
+        hour = (time % (24*60*60)) / (60*60)
+        day = date.astype('datetime64[D]').astype(np.int64)
+        weekday = (day + 3) % 7 # 1970-01-01 was a Thursday
+        month = date.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        for rule in self.rules:
+            if 'hours' in rule:
+                start, end = rule['hours']
+                if start <= end and not start <= hour < end:
+                    continue
+                if start > end and end <= hour < start:
+                    continue
+            if 'weekdays' in rule and weekday not in rule['weekdays']:
+                continue
+            if 'months' in rule and month not in rule['months']:
+                continue
+            return rule
+        return self.default_rule
+
+    def __call__(self, time):
+        '''
+        Returns the step size at a time.
+
+        Inputs
+        ------
+        time (float): FMU time, in seconds.
+
+        Returns
+        -------
+        step_size (float): Step size, in seconds.
+        '''
+        rule = self.get_rule(time)
+        step_size = rule['step_size']
+
+        # End step at the next hour with a different rule
+        hour = 60*60
+        boundary = (np.floor(time / hour) + 1) * hour
+        while boundary < time + step_size:
+            if self.get_rule(boundary) is not rule:
+                return boundary - time
+            boundary += hour
+        return step_size
+
+    def is_action_point(self, time):
+        '''
+        Returns True if the actions can change at a time.
+
+        Inputs
+        ------
+        time (float): FMU time, in seconds.
+
+        Returns
+        -------
+        action (bool): Actions can change.
+        '''
+        return self.get_rule(time).get('action', True)
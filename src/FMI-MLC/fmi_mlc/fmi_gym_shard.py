@@ -0,0 +1,138 @@
+"""
+FMI-MLC time-sharded simulations.
+"""
+
+import os
+import sys
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+try:
+    root = os.path.dirname(os.path.realpath(__file__))
+except:
+    root = os.getcwd()
+sys.path.append(root)
+from fmi_gym_parameter import get_default_parameter
+from fmi_gym_sweep import merge_parameter, get_max_workers, run_scenario
+
+def get_shards(start_time, final_time, n_shards, overlap, step_size):
+    '''
+    Returns the segments of a sharded simulation. The segment boundaries (seams)
+    are aligned to the step size.
+
+    Inputs
+    ------
+    start_time (float): Start time in seconds.
+    final_time (float): Final time in seconds.
+    n_shards (int): Number of segments.
+    overlap (float): Warmup overlap before each seam in seconds, rounded up to the
+                     step size.
+    step_size (float): Step size in seconds.
+
+    Returns
+    -------
+    shards (list): Segments as tuples of simulation start time (seam minus overlap,
+                   but not before start_time), seam, and final time.
+    '''
+    steps = int(np.ceil((final_time - start_time) / step_size))
+    n_shards = max(min(n_shards, steps), 1)
+    overlap = int(np.ceil(overlap / step_size)) * step_size
+    bounds = [start_time + int(round(i * steps / n_shards)) * step_size \
+              for i in range(n_shards)] + [final_time]
+    return [(max(bounds[i] - overlap, start_time), bounds[i], bounds[i+1]) \
+            for i in range(n_shards)]
+
+def get_seam_report(prev, data, seam):
+    '''
+    Returns the discrepancy of two segments at a seam.
+
+    Inputs
+    ------
+    prev (pd.DataFrame): Data of the segment before the seam.
+    data (pd.DataFrame): Data of the segment after the seam, including the overlap.
+    seam (float): Time of the seam in seconds.
+
+    Returns
+    -------
+    discrepancy (pd.Series): Absolute difference of each numeric signal at the seam.
+    '''
+    columns = [c for c in prev.columns if c != 'time' and c in data.columns \
+               and pd.api.types.is_numeric_dtype(prev[c])]
+    i = prev.index.get_indexer([seam], method='nearest')[0]
+    j = data.index.get_indexer([seam], method='nearest')[0]
+    a = prev[columns].iloc[i].to_numpy(dtype=np.float64)
+    b = data[columns].iloc[j].to_numpy(dtype=np.float64)
+    return pd.Series(np.abs(a - b), index=columns)
+
+def run_sharded(parameter, n_shards=None, overlap=7*24*60*60, controller=None, pyfmi=None,
+                max_workers=None, memory_per_run=1e9, start_method=None):
+    '''
+    Run a long simulation (e.g. annual) in parallel segments. The time from
+    "fmu_start_time" to "fmu_final_time" is split into n_shards segments, and each
+    segment is simulated in its own process as an episode (see run_scenario) that
+    starts overlap seconds before its seam, so that the state of the FMU (e.g. the
+    thermal mass) converges. The segments are then stitched into one trajectory,
+    where each segment contributes the data after its seam.
+
+    The overlap is simulated with the same controller (or zero actions) as the
+    segment itself, and "fmu_warmup_time" only applies to the first segment.
+
+    Inputs
+    ------
+    parameter (dict): Parameter of fmi_gym.
+    n_shards (int): Number of segments, default None (number of workers).
+    overlap (float): Warmup overlap in seconds, default 7*24*60*60.
+    controller (fun): Controller, action = controller(observation, info), default None.
+    pyfmi (class): FMU handler of fmi_gym, default None (PyFMI).
+    max_workers (int): Maximum number of parallel segments, default None (cpu count).
+    memory_per_run (float): Memory of a segment in bytes, used to limit the number of
+                            parallel segments by the available memory, default 1e9.
+    start_method (str): Start method of multiprocessing, default None (platform default).
+
+    Returns
+    -------
+    data (pd.DataFrame): Stitched data, indexed by time.
+    seams (pd.DataFrame): Absolute difference of each signal at each seam between the
+                          segment before the seam and the overlap of the segment after
+                          it, indexed by the time of the seam.
+    '''
+    p = get_default_parameter()
+    p.update(parameter)
+    if p['fmu_episode_duration'] or p['fmu_step_schedule']:
+        print('ERROR: Sharded runs require a fixed "fmu_step_size", without ' \
+              '"fmu_episode_duration" and "fmu_step_schedule".')
+        raise ValueError('Unsupported parameter for sharded runs.')
+    workers = get_max_workers(memory_per_run)
+    if max_workers:
+        workers = min(workers, max_workers)
+    start_time = p['fmu_warmup_time'] if p['fmu_warmup_time'] else p['fmu_start_time']
+    shards = get_shards(start_time, p['fmu_final_time'], n_shards if n_shards else workers,
+                        overlap, p['fmu_step_size'])
+
+    parameters = []
+    for i, (start, seam, final) in enumerate(shards):
+        if i == 0:
+            update = {'fmu_final_time': final}
+        else:
+            update = {'fmu_start_time': start, 'fmu_warmup_time': None,
+                      'fmu_final_time': final}
+        parameters.append(merge_parameter(parameter, update))
+
+    with ProcessPoolExecutor(max_workers=max(min(workers, len(shards)), 1),
+                             mp_context=mp.get_context(start_method)) as executor:
+        futures = [executor.submit(run_scenario, x, controller, pyfmi) for x in parameters]
+        segments = [f.result() for f in futures]
+
+    # Stitch
+    parts = [segments[0]]
+    seams = {}
+    for i in range(1, len(shards)):
+        seam = shards[i][1]
+        seams[seam] = get_seam_report(segments[i-1], segments[i], seam)
+        parts.append(segments[i][segments[i].index > seam + p['fmu_step_size'] / 2])
+    data = pd.concat(parts)
+    seams = pd.DataFrame.from_dict(seams, orient='index')
+    seams.index.name = 'seam'
+    return data, seams
@@ -0,0 +1,115 @@
+"""
+FMI-MLC streaming data sink.
+"""
+
+import os
+import tempfile
+import numpy as np
+
+class data_sink(object):
+    '''Streaming writer of data recorded by fmi_gym to Parquet or Arrow IPC files.'''
+
+    def __init__(self, path, fmt=None, int_columns=['episode']):
+        '''
+        Setup the sink. Data is written in chunks with write() and can be read
+        while the simulation is running:
+
+            parquet: path is a directory of part files, e.g. pd.read_parquet(path).
+            arrow: path is an Arrow IPC stream, e.g. pyarrow.ipc.open_stream(path).
+
+        Integer and boolean columns, except int_columns, are written as float64 so
+        that all chunks share one schema.
+
+        Inputs
+        ------
+        path (str): Path of the directory (parquet) or file (arrow).
+        fmt (str): Format, 'parquet' or 'arrow', default None. None uses 'arrow' for
+                   paths ending with '.arrow', '.arrows', or '.ipc', otherwise 'parquet'.
+        int_columns (list): Integer columns which keep their type, default ['episode'].
+        '''
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except Exception as e:
+            print('ERROR: The "store_sink" requires the "pyarrow" package.')
+            raise e
+        self.pa = pyarrow
+        if fmt is None:
+            fmt = 'arrow' if path.endswith(('.arrow', '.arrows', '.ipc')) else 'parquet'
+        if fmt not in ['parquet', 'arrow']:
+            raise ValueError('The format of the sink must be "parquet" or "arrow".')
+        self.path = os.path.abspath(path)
+        self.fmt = fmt
+        self.int_columns = int_columns
+        self.schema = None
+        self.writer = None
+        self.parts = 0
+        self.rows = 0
+        if self.fmt == 'parquet':
+            os.makedirs(self.path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    def to_table(self, data):
+        ''' convert pd.DataFrame to pyarrow.Table with a consistent schema '''
+        columns = {}
+        for c, v in data.items():
+            v = v.to_numpy()
+            if v.dtype.kind in 'iub' and c not in self.int_columns:
+                v = v.astype(np.float64)
+            columns[str(c)] = v
+        table = self.pa.table(columns)
+        if self.schema is None:
+            self.schema = table.schema
+            return table
+        if table.schema.equals(self.schema):
+            return table
+        missing = set(table.column_names) - set(self.schema.names)
+        if missing:
+            print('ERROR: Columns {} are not in the schema of the sink.'.format(sorted(missing)))
+            raise ValueError('Cannot add columns to "store_sink".')
+        arrays = []
+        for field in self.schema:
+            if field.name in table.column_names:
+                arrays.append(table[field.name].cast(field.type))
+            else:
+                arrays.append(self.pa.nulls(len(table), type=field.type))
+        return self.pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def write(self, data):
+        '''
+        Write a chunk of data.
+
+        Inputs
+        ------
+        data (pd.DataFrame): Rows to write.
+        '''
+        if len(data) == 0:
+            return
+        table = self.to_table(data)
+        if self.fmt == 'parquet':
+            # Write to temporary (hidden) file and rename, so that readers never
+            # see incomplete parts
+            name = 'part-{:06d}.parquet'.format(self.parts)
+            fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.', suffix='.tmp')
+            os.close(fd)
+            try:
+                self.pa.parquet.write_table(table, tmp)
+                os.replace(tmp, os.path.join(self.path, name))
+            except Exception:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        else:
+            if self.writer is None:
+                self.writer = self.pa.ipc.new_stream(self.path, self.schema)
+            self.writer.write_table(table)
+        self.parts += 1
+        self.rows += len(data)
+
+    def close(self):
+        ''' close the sink '''
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
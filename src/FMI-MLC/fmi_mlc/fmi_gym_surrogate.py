@@ -0,0 +1,371 @@
+"""
+FMI-MLC reduced-order surrogate models.
+"""
+
+import pickle
+import numpy as np
+import pandas as pd
+
+class rc_model(object):
+    '''Reduced-order resistance-capacitance (RC) zone model calibrated from trajectories.'''
+
+    def __init__(self, state_names=None, driver_names=['T_out', 'DNI'], input_names=[],
+                 harmonics=2, start_date=None):
+        '''
+        Setup the model. Each zone temperature x is a first order RC (1R1C) model,
+        discretized with the step size dt of the calibration data:
+
+            x[k+1] = a x[k] + b d[k],  with a = exp(-dt / (R C))
+
+        The drivers d are the ambient temperature and solar radiation (driver_names),
+        the inputs (input_names), and internal gains which follow daily harmonics
+        on weekdays and weekends, and a constant. All other signals of the calibration
+        data (e.g. weather and meters) are replayed from the recorded trajectory.
+
+        Inputs
+        ------
+        state_names (list): Zone temperatures, default None (columns starting with 'T_'
+                            except the drivers).
+        driver_names (list): Exogenous drivers of the zones, default ['T_out', 'DNI'].
+        input_names (list): Controlled inputs of the zones (columns of the calibration
+                            data), default [].
+        harmonics (int): Number of daily harmonics of the internal gains, default 2.
+        start_date (str): Date of the time 0, default None (first 'timestamp' of the
+                          calibration data, or '2001-01-01').
+        '''
+        self.state_names = state_names
+        self.driver_names = list(driver_names)
+        self.input_names = list(input_names)
+        self.harmonics = harmonics
+        self.start_date = start_date
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        '''
+        Calibrate a model from recorded data, e.g. simulation_results.csv.
+
+        Inputs
+        ------
+        path (str): Path to the CSV file with a 'time' column in seconds.
+        kwargs: Arguments of rc_model.
+
+        Returns
+        -------
+        model (rc_model): Calibrated model.
+        '''
+        model = cls(**kwargs)
+        model.fit(pd.read_csv(path))
+        return model
+
+    def save(self, path):
+        ''' save the model to a pickle file '''
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+    @staticmethod
+    def load(path):
+        ''' load a model from a pickle file '''
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def get_gains(self, time):
+        '''
+        Returns the regressors of the internal gains.
+
+        Inputs
+        ------
+        time (float or np.array): Time, in seconds.
+
+        Returns
+        -------
+        gains (np.array): Daily harmonics on weekdays and weekends, and a constant.
+        '''
+        time = np.atleast_1d(np.asarray(time, dtype=np.float64))
+        angle = 2 * np.pi * (time % (24*60*60)) / (24*60*60)
+        day = self.start_day + np.floor(time / (24*60*60)).astype(np.int64)
+        weekday = ((day + 3) % 7 < 5).astype(np.float64) # 1970-01-01 was a Thursday
+        gains = [weekday]
+        for h in range(1, self.harmonics + 1):
+            for f in [np.sin(h * angle), np.cos(h * angle)]:
+                gains += [f * weekday, f * (1 - weekday)]
+        gains.append(np.ones_like(time))
+        return np.column_stack(gains)
+
+    def fit(self, data):
+        '''
+        Calibrate the model with least squares of the one-step prediction.
+
+        Inputs
+        ------
+        data (pd.DataFrame): Recorded data with a 'time' column in seconds (or index)
+                             on a uniform grid.
+        '''
+        data = data.copy()
+        if 'time' not in data.columns:
+            data['time'] = data.index.values
+        if self.start_date is None:
+            self.start_date = str((pd.Timestamp(data['timestamp'].iloc[0]) \
+                - pd.Timedelta(seconds=float(data['time'].iloc[0]))).date()) \
+                if 'timestamp' in data.columns else '2001-01-01'
+        self.start_day = np.datetime64(self.start_date, 'D').astype(np.int64)
+        if self.state_names is None:
+            self.state_names = [c for c in data.columns if str(c).startswith('T_') \
+                and c not in self.driver_names]
+        time = data['time'].to_numpy(dtype=np.float64)
+        steps = np.diff(time)
+        if len(steps) == 0 or not np.allclose(steps, steps[0]):
+            raise ValueError('The calibration data must be on a uniform time grid.')
+        self.dt = steps[0]
+        self.time = time
+
+        # Replayed signals
+        exclude = set(self.state_names + self.input_names + ['time', 'timestamp', 'reward'])
+        self.replay_names = [c for c in data.columns if c not in exclude \
+            and pd.api.types.is_numeric_dtype(data[c])]
+        self.replay = data[self.replay_names].to_numpy(dtype=np.float64)
+        self.driver_index = [self.replay_names.index(n) for n in self.driver_names]
+
+        # Regressors
+        drivers = data[self.driver_names + self.input_names].to_numpy(dtype=np.float64)
+        self.scale = np.maximum(np.abs(drivers).max(axis=0), 1)
+        d = np.column_stack([drivers / self.scale, self.get_gains(time)])
+        x = data[self.state_names].to_numpy(dtype=np.float64)
+
+        # Least squares for each zone
+        self.a = np.empty(len(self.state_names))
+        self.b = np.empty((len(self.state_names), d.shape[1]))
+        for i in range(len(self.state_names)):
+            X = np.column_stack([x[:-1, i], d[:-1]])
+            theta = np.linalg.lstsq(X, x[1:, i], rcond=None)[0]
+            self.a[i], self.b[i] = theta[0], theta[1:]
+        if np.any(np.abs(self.a) >= 1):
+            print('WARNING: The RC model is unstable for {}.'.format( \
+                [n for n, a in zip(self.state_names, self.a) if abs(a) >= 1]))
+        self.x0 = x
+
+    @property
+    def time_constants(self):
+        ''' time constant R C of each zone, in seconds '''
+        return pd.Series(-self.dt / np.log(np.clip(self.a, 1e-12, 1 - 1e-12)),
+                         index=self.state_names)
+
+    def get_replay(self, time):
+        '''
+        Returns the replayed signals at a time, interpolated linearly and repeated
+        periodically after the end of the calibration data.
+
+        Inputs
+        ------
+        time (float): Time, in seconds.
+
+        Returns
+        -------
+        values (np.array): Values of the replayed signals (replay_names).
+        '''
+        return self.interpolate(self.replay, time)
+
+    def get_states(self, time):
+        ''' returns the recorded zone temperatures at a time, see get_replay '''
+        return self.interpolate(self.x0, time)
+
+    def interpolate(self, values, time):
+        ''' linear interpolation of recorded values at a time, see get_replay '''
+        period = self.time[-1] - self.time[0] + self.dt
+        pos = ((time - self.time[0]) % period) / self.dt
+        k = int(pos)
+        frac = pos - k
+        if k + 1 >= len(values):
+            return values[k].copy()
+        return values[k] + frac * (values[k+1] - values[k])
+
+    def get_drivers(self, time, inputs=None):
+        '''
+        Returns the drivers of the zones at a time.
+
+        Inputs
+        ------
+        time (float): Time, in seconds.
+        inputs (np.array): Values of the inputs (input_names), default None (no inputs).
+
+        Returns
+        -------
+        d (np.array): Drivers of the zones.
+        '''
+        replay = self.get_replay(time)
+        drivers = replay[self.driver_index]
+        if self.input_names:
+            drivers = np.concatenate([drivers, inputs])
+        return np.concatenate([drivers / self.scale, self.get_gains(time)[0]])
+
+    def step(self, x, time, step_size, inputs=None):
+        '''
+        Advance the zone temperatures. Step sizes other than the step size of the
+        calibration data use the exact discretization of the first order model
+        with drivers held constant over the step.
+
+        Inputs
+        ------
+        x (np.array): Zone temperatures.
+        time (float): Time at the start of the step, in seconds.
+        step_size (float): Step size, in seconds.
+        inputs (np.array): Values of the inputs (input_names), default None.
+
+        Returns
+        -------
+        x (np.array): Zone temperatures at the end of the step.
+        '''
+        d = self.get_drivers(time, inputs)
+        if step_size == self.dt:
+            return self.a * x + self.b.dot(d)
+        a = self.a ** (step_size / self.dt)
+        return a * x + (1 - a) / (1 - self.a) * self.b.dot(d)
+
+    def simulate(self, data):
+        '''
+        Simulate the zone temperatures (free run) for the time and inputs of data,
+        e.g. to validate the model.
+
+        Inputs
+        ------
+        data (pd.DataFrame): Data with a 'time' column in seconds (or index), the
+                             inputs, and optionally the initial zone temperatures.
+
+        Returns
+        -------
+        states (pd.DataFrame): Simulated zone temperatures, indexed by time.
+        '''
+        time = data['time'].to_numpy(dtype=np.float64) if 'time' in data.columns \
+            else data.index.to_numpy(dtype=np.float64)
+        if all(n in data.columns for n in self.state_names):
+            x = data[self.state_names].iloc[0].to_numpy(dtype=np.float64)
+        else:
+            x = self.get_states(time[0])
+        inputs = data[self.input_names].to_numpy(dtype=np.float64) if self.input_names \
+            else [None] * len(time)
+        states = np.empty((len(time), len(x)))
+        states[0] = x
+        for k in range(len(time) - 1):
+            x = self.step(x, time[k], time[k+1] - time[k], inputs[k])
+            states[k+1] = x
+        return pd.DataFrame(states, index=time, columns=self.state_names)
+
+class rc_fmu(object):
+    '''FMU handler which evaluates an rc_model, for fmi_gym(parameter, pyfmi=rc_fmu).'''
+
+    def __init__(self, path, log_level=0, kind='cs', model=None, **kwargs):
+        '''
+        Setup the surrogate FMU. The outputs are the zone temperatures and the
+        replayed signals of the model; inputs which are not inputs of the model
+        are accepted and ignored.
+
+        Inputs
+        ------
+        path (str): Path to the model, see rc_model.save. Ignored if model is given.
+        log_level (int): Log level (ignored).
+        kind (str): Kind of FMU (ignored).
+        model (rc_model): Calibrated model, default None (load from path).
+        '''
+        self.model = model if model is not None else rc_model.load(path)
+        m = self.model
+        self.names = m.state_names + m.replay_names + m.input_names
+        self.refs = {n: i for i, n in enumerate(self.names)}
+        self.n_states = len(m.state_names)
+        self.n_replay = len(m.replay_names)
+        self.reset()
+
+    def reset(self):
+        ''' reset the model '''
+        self.values = np.zeros(len(self.names))
+        self.setup_experiment(start_time=self.model.time[0])
+
+    def update(self):
+        ''' update the replayed signals at the current time '''
+        n = self.n_states
+        self.values[n:n+self.n_replay] = self.model.get_replay(self.time)
+
+    def get_variable_valueref(self, name):
+        ''' returns the value reference of a variable, KeyError if it is unknown '''
+        if name not in self.refs:
+            raise KeyError('"{}" is not a variable of the surrogate model.'.format(name))
+        return self.refs[name]
+
+    def get_variable_data_type(self, name):
+        ''' returns the data type of a variable (0: real) '''
+        return 0
+
+    def set(self, names, values):
+        ''' set inputs by name, inputs which are not inputs of the model are ignored '''
+        if isinstance(names, str):
+            names, values = [names], [values]
+        for n, v in zip(names, values):
+            if n not in self.refs:
+                # Placeholder of an ignored input
+                self.refs[n] = len(self.names)
+                self.names.append(n)
+                self.values = np.append(self.values, np.nan)
+            self.values[self.refs[n]] = v
+
+    def get(self, names):
+        ''' get variables by name '''
+        if isinstance(names, str):
+            names = [names]
+        return self.values[[self.get_variable_valueref(n) for n in names]]
+
+    def set_real(self, refs, values):
+        ''' set variables by value reference '''
+        self.values[refs] = values
+
+    def get_real(self, refs):
+        ''' get variables by value reference '''
+        return self.values[refs]
+
+    def setup_experiment(self, start_time=0, **kwargs):
+        ''' set the start time and the initial states '''
+        self.time = start_time
+        self.values[:self.n_states] = self.model.get_states(start_time)
+        self.update()
+
+    def initialize(self):
+        ''' initialize the model (no operation) '''
+        pass
+
+    def do_step(self, current_t, step_size):
+        ''' advance the model by a step '''
+        n = self.n_states
+        inputs = None
+        if self.model.input_names:
+            start = n + self.n_replay
+            inputs = self.values[start:start+len(self.model.input_names)]
+        self.values[:n] = self.model.step(self.values[:n], current_t, step_size, inputs)
+        self.time = current_t + step_size
+        self.update()
+        return 0
+
+    def terminate(self):
+        ''' terminate the model (no operation) '''
+        pass
+
+    def get_capability_flags(self):
+        ''' returns the capabilities of the handler '''
+        return {'canGetAndSetFMUstate': True, 'canSerializeFMUstate': True}
+
+    def get_fmu_state(self):
+        ''' returns a copy of the values and time '''
+        return (self.values.copy(), self.time)
+
+    def set_fmu_state(self, state):
+        ''' restore the values and time, see get_fmu_state '''
+        self.values = state[0].copy()
+        self.time = state[1]
+
+    def free_fmu_state(self, state):
+        ''' release a state (no operation) '''
+        pass
+
+    def serialize_fmu_state(self, state):
+        ''' serialize a state to bytes '''
+        return pickle.dumps(state)
+
+    def deserialize_fmu_state(self, state):
+        ''' deserialize a state, see serialize_fmu_state '''
+        return pickle.loads(state)
@@ -0,0 +1,371 @@
+"""
+FMI-MLC scenario sweeps.
+"""
+
+import os
+import sys
+import json
+import time
+import itertools
+import functools
+import importlib.util
+import tempfile
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+try:
+    root = os.path.dirname(os.path.realpath(__file__))
+except:
+    root = os.getcwd()
+sys.path.append(root)
+from fmi_gym import fmi_gym
+from fmi_gym_cache import file_hash, hash_object, normalize
+
+def merge_parameter(parameter, update):
+    '''
+    Merge parameter updates. Dictionaries (e.g. "fmu_param") are merged, all
+    other values are replaced.
+
+    Inputs
+    ------
+    parameter (dict): Parameter.
+    update (dict): Parameter updates.
+
+    Returns
+    -------
+    parameter (dict): Merged parameter (copy).
+    '''
+    parameter = dict(parameter)
+    for k, v in update.items():
+        if isinstance(v, dict) and isinstance(parameter.get(k), dict):
+            v = merge_parameter(parameter[k], v)
+        parameter[k] = v
+    return parameter
+
+def expand_scenarios(matrix):
+    '''
+    Expand a scenario matrix to the list of all combinations, e.g.
+
+        matrix = {'weather': {'sf': {'fmu_param': {'weaFil': 'sf.mos'}},
+                              'ny': {'fmu_param': {'weaFil': 'ny.mos'}}},
+                  'fmu_param': {'base': {}, 'pv': {'fmu_param': {'PV_size': 10}}},
+                  'controller': {'off': {}, 'rule': {'controller': rule_controller}}}
+
+    results in 2 x 2 x 2 = 8 scenarios.
+
+    Inputs
+    ------
+    matrix (dict): Axes of the matrix. Each axis maps labels to parameter updates of
+                   fmi_gym, see merge_parameter. A list of updates is labeled by its
+                   index. The update "controller" sets the controller of the scenario,
+                   see run_scenario.
+
+    Returns
+    -------
+    scenarios (list): Scenarios as dictionaries of 'labels' (label per axis) and
+                      'update' (merged parameter updates).
+    '''
+    axes = []
+    for axis, values in matrix.items():
+        if isinstance(values, (list, tuple)):
+            values = dict(enumerate(values))
+        axes.append([(axis, label, update) for label, update in values.items()])
+    scenarios = []
+    for combination in itertools.product(*axes):
+        update = {}
+        for _, _, u in combination:
+            update = merge_parameter(update, u)
+        scenarios.append({'labels': {axis: label for axis, label, _ in combination},
+                          'update': update})
+    return scenarios
+
+def get_scenario_key(parameter, controller=None):
+    '''
+    Returns the key of a scenario, the hash of its parameter, controller (including
+    the attributes of controller instances), and the content of the FMU file (if it
+    exists), see normalize. Lambdas and closures cannot be keyed and raise ValueError.
+
+    Inputs
+    ------
+    parameter (dict): Parameter of fmi_gym.
+    controller (fun): Controller, default None.
+
+    Returns
+    -------
+    key (str): Scenario hash.
+    '''
+    fmu = parameter.get('fmu_path')
+    fmu = file_hash(fmu) if isinstance(fmu, str) and os.path.isfile(fmu) else None
+    try:
+        return hash_object([normalize(parameter), normalize(controller), fmu])[:32]
+    except ValueError as e:
+        print('ERROR: The scenario cannot be keyed ({}).'.format(e))
+        raise e
+
+def get_available_memory():
+    ''' returns the available memory in bytes, or None if unknown '''
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        return None
+
+def get_max_workers(memory_per_run=None):
+    '''
+    Returns the number of parallel runs, limited by the cpu count and the
+    available memory.
+
+    Inputs
+    ------
+    memory_per_run (float): Memory of a run in bytes, default None (no limit).
+
+    Returns
+    -------
+    workers (int): Number of workers (at least 1).
+    '''
+    workers = os.cpu_count() or 1
+    memory = get_available_memory() if memory_per_run else None
+    if memory:
+        workers = min(workers, int(memory // memory_per_run))
+    return max(workers, 1)
+
+def write_atomic(path, write):
+    '''
+    Write a file atomically, readers and interrupted runs never see partial files.
+
+    Inputs
+    ------
+    path (str): Path of the file.
+    write (fun): Function which writes to a temporary path, write(tmp).
+    '''
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def write_json(obj, path):
+    ''' write an object to a JSON file '''
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2)
+
+def run_scenario(parameter, controller=None, pyfmi=None, cache=None):
+    '''
+    Run an episode of a scenario. Without controller, the actions are zero (or
+    held by the inputs and schedules of the parameter) and the episode is simulated
+    with fmi_gym.rollout.
+
+    Inputs
+    ------
+    parameter (dict): Parameter of fmi_gym.
+    controller (fun): Controller, action = controller(observation, info), default None.
+    pyfmi (class): FMU handler of fmi_gym, default None (PyFMI).
+    cache (disk_cache): Cache of episode results, keyed by the scenario (see
+                        get_scenario_key) and the FMU handler, default None. The FMU
+                        and controller must be deterministic.
+
+    Returns
+    -------
+    data (pd.DataFrame): Recorded data of the episode.
+    '''
+    if cache is not None:
+        key = hash_object([get_scenario_key(parameter, controller), normalize(pyfmi)])
+        data = cache.get(key)
+        if data is not None:
+            return data
+    parameter = merge_parameter(parameter, {'store_data': True, 'store_all_data': False})
+    env = fmi_gym(parameter, pyfmi=pyfmi)
+    try:
+        observation, info = env.reset()
+        if controller is None:
+            env.rollout()
+        else:
+            done = False
+            while not done:
+                observation, _, done, info = env.step(controller(observation, info))
+        data = env.data.copy()
+    finally:
+        env.close()
+    if cache is not None:
+        cache.put(key, data)
+    return data
+
+def sweep_worker(path, key, parameter, controller, pyfmi, labels):
+    '''
+    Run a scenario in a worker process and write its result, see sweep.run.
+
+    Returns
+    -------
+    result (dict): Key, status, wall time, and error message (if failed).
+    '''
+    st = time.time()
+    try:
+        data = run_scenario(parameter, controller=controller, pyfmi=pyfmi)
+        if 'time' not in data.columns:
+            data.insert(0, 'time', data.index.values)
+        data = data.reset_index(drop=True)
+        data.columns = [str(c) for c in data.columns]
+        write_atomic(os.path.join(path, key + '.parquet'), data.to_parquet)
+        meta = {'key': key, 'labels': {a: str(l) for a, l in labels.items()},
+                'rows': len(data), 'wall_time': time.time() - st}
+        # The metadata marks the scenario as done
+        write_atomic(os.path.join(path, key + '.json'), functools.partial(write_json, meta))
+        return {'key': key, 'status': 'done', 'wall_time': meta['wall_time'], 'error': None}
+    except Exception:
+        return {'key': key, 'status': 'failed', 'wall_time': time.time() - st,
+                'error': traceback.format_exc()}
+
+class sweep(object):
+    '''Scenario sweep of fmi_gym episodes over a process pool with a result store.'''
+
+    def __init__(self, path, parameter, matrix, pyfmi=None, max_workers=None,
+                 memory_per_run=1e9, start_method=None):
+        '''
+        Setup the sweep. Each scenario of the matrix (see expand_scenarios) is run
+        as an episode (see run_scenario), and its recorded data is written to
+        path/<key>.parquet, with metadata in path/<key>.json. The key is the hash of
+        the scenario (see get_scenario_key). Scenarios with results are skipped, so
+        that an interrupted sweep continues where it stopped.
+
+        Inputs
+        ------
+        path (str): Directory of the results, created if missing.
+        parameter (dict): Base parameter of fmi_gym.
+        matrix (dict): Scenario matrix, see expand_scenarios.
+        pyfmi (class): FMU handler of fmi_gym, default None (PyFMI).
+        max_workers (int): Maximum number of parallel runs, default None (cpu count).
+        memory_per_run (float): Memory of a run in bytes, used to limit the number of
+                                parallel runs by the available memory, default 1e9.
+        start_method (str): Start method of multiprocessing, default None (platform default).
+        '''
+        if importlib.util.find_spec('pyarrow') is None:
+            print('ERROR: The sweep requires the "pyarrow" package.')
+            raise ImportError('No module named "pyarrow".')
+        self.path = os.path.abspath(path)
+        self.parameter = parameter
+        self.pyfmi = pyfmi
+        self.max_workers = max_workers
+        self.memory_per_run = memory_per_run
+        self.start_method = start_method
+        os.makedirs(self.path, exist_ok=True)
+
+        self.scenarios = []
+        for scenario in expand_scenarios(matrix):
+            update = dict(scenario['update'])
+            controller = update.pop('controller', None)
+            p = merge_parameter(parameter, update)
+            self.scenarios.append({'key': get_scenario_key(p, controller),
+                                   'labels': scenario['labels'],
+                                   'parameter': p, 'controller': controller})
+        keys = [s['key'] for s in self.scenarios]
+        if len(set(keys)) < len(keys):
+            print('WARNING: The scenario matrix contains identical scenarios.')
+
+    def is_done(self, key):
+        ''' check if the scenario has results '''
+        return os.path.exists(os.path.join(self.path, key + '.json'))
+
+    def get_workers(self, n):
+        ''' returns the number of workers for n scenarios '''
+        workers = get_max_workers(self.memory_per_run)
+        if self.max_workers:
+            workers = min(workers, self.max_workers)
+        return max(min(workers, n), 1)
+
+    def run(self, log=print):
+        '''
+        Run all scenarios without results. On interruption (KeyboardInterrupt),
+        pending scenarios are cancelled and completed results are kept.
+
+        Inputs
+        ------
+        log (fun): Function to log the progress, default print.
+
+        Returns
+        -------
+        results (pd.DataFrame): Status ('done', 'skipped', or 'failed'), wall time,
+                                and error of each scenario, indexed by key.
+        '''
+        results = {}
+        pending = []
+        for s in self.scenarios:
+            if s['key'] in results:
+                continue
+            if self.is_done(s['key']):
+                results[s['key']] = {'key': s['key'], 'status': 'skipped',
+                                     'wall_time': 0, 'error': None}
+            else:
+                results[s['key']] = None
+                pending.append(s)
+        if pending:
+            workers = self.get_workers(len(pending))
+            log('INFO: Running {} scenarios ({} skipped) with {} workers.'.format( \
+                len(pending), len(results) - len(pending), workers))
+            executor = ProcessPoolExecutor(max_workers=workers,
+                                           mp_context=mp.get_context(self.start_method))
+            try:
+                futures = [executor.submit(sweep_worker, self.path, s['key'], s['parameter'],
+                                           s['controller'], self.pyfmi, s['labels']) \
+                           for s in pending]
+                for i, future in enumerate(as_completed(futures)):
+                    result = future.result()
+                    results[result['key']] = result
+                    if result['status'] == 'failed':
+                        print('ERROR: Scenario {} failed:\n{}'.format(result['key'],
+                                                                      result['error']))
+                    log('INFO: Completed {}/{} scenarios.'.format(i + 1, len(pending)))
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            executor.shutdown()
+        return pd.DataFrame([r for r in results.values() if r is not None]).set_index('key')
+
+    def get_results(self):
+        '''
+        Returns the overview of the scenarios.
+
+        Returns
+        -------
+        results (pd.DataFrame): Labels, done flag, rows, and wall time of each
+                                scenario, indexed by key.
+        '''
+        rows = []
+        for s in self.scenarios:
+            row = {'key': s['key']}
+            row.update(s['labels'])
+            row['done'] = self.is_done(s['key'])
+            if row['done']:
+                with open(os.path.join(self.path, s['key'] + '.json'), 'r') as f:
+                    meta = json.load(f)
+                row['rows'] = meta['rows']
+                row['wall_time'] = meta['wall_time']
+            rows.append(row)
+        return pd.DataFrame(rows).set_index('key')
+
+    def load(self, key):
+        '''
+        Load the result of a scenario.
+
+        Inputs
+        ------
+        key (str): Key of the scenario, see get_results.
+
+        Returns
+        -------
+        data (pd.DataFrame): Recorded data, indexed by time.
+        '''
+        data = pd.read_parquet(os.path.join(self.path, key + '.parquet'))
+        data.index = data['time'].values
+        return data
@@ -0,0 +1,451 @@
+"""
+FMI-MLC vectorized environments.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import traceback
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+import gym
+import numpy as np
+
+try:
+    root = os.path.dirname(os.path.realpath(__file__))
+except:
+    root = os.getcwd()
+sys.path.append(root)
+from fmi_gym import fmi_gym
+from fmi_gym_parameter import get_default_parameter
+
+def attach_shared_memory(name):
+    '''
+    Attach to an existing shared memory segment. The segment is owned (and
+    unlinked) by the creating process, tracking is therefore disabled where
+    supported (Python >= 3.13). Older versions register the segment with the
+    resource tracker shared by the process tree, which has no effect.
+
+    Inputs
+    ------
+    name (str): Name of the shared memory segment.
+
+    Returns
+    -------
+    shm (shared_memory.SharedMemory): Shared memory segment.
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+class shared_buffers(object):
+    '''Named NumPy arrays in shared memory.'''
+
+    def __init__(self, specs, names=None):
+        '''
+        Create or attach the shared arrays.
+
+        Inputs
+        ------
+        specs (dict): Shape (tuple) and dtype (str) per array.
+        names (dict): Names of existing shared memory segments per array, default None.
+                      None creates new segments which are owned by this object.
+        '''
+        self.specs = specs
+        self.owner = names is None
+        self.shm = {}
+        self.arrays = {}
+        for k, (shape, dtype) in specs.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            if self.owner:
+                self.shm[k] = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                self.shm[k] = attach_shared_memory(names[k])
+            self.arrays[k] = np.ndarray(shape, dtype=dtype, buffer=self.shm[k].buf)
+            if self.owner:
+                self.arrays[k][...] = 0
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    @property
+    def names(self):
+        ''' names of the shared memory segments '''
+        return {k: v.name for k, v in self.shm.items()}
+
+    def close(self):
+        ''' release the shared memory (and unlink if owner) '''
+        self.arrays = {}
+        for shm in self.shm.values():
+            shm.close()
+            if self.owner:
+                shm.unlink()
+        self.shm = {}
+
+def vec_command(env, index, cmd, buffers, auto_reset):
+    '''
+    Execute a command of a vectorized environment.
+
+    Inputs
+    ------
+    env (fmi_gym): Environment.
+    index (int): Index of the environment.
+    cmd (str): Command, 'step' or 'reset'.
+    buffers (dict): Action, observation, terminal_observation, reward, and done arrays.
+    auto_reset (bool): Reset the environment when done.
+    '''
+    if cmd == 'step':
+        state, reward, done, _ = env.step(buffers['action'][index].copy())
+        buffers['reward'][index] = reward
+        buffers['done'][index] = done
+        if done and auto_reset:
+            buffers['terminal_observation'][index] = state
+            state, _ = env.reset()
+        buffers['observation'][index] = state
+    elif cmd == 'reset':
+        state, _ = env.reset()
+        buffers['observation'][index] = state
+        buffers['done'][index] = False
+    else:
+        raise ValueError('Unknown command "{}".'.format(cmd))
+
+def vec_worker(index, parameter, pyfmi, specs, names, pipe, auto_reset):
+    '''
+    Worker process of fmi_gym_vec. Commands are received from the pipe while
+    all data is exchanged through the shared buffers. Exceptions of a command
+    are sent back as ('error', traceback) and the worker waits for the next
+    command, e.g. a reset.
+
+    Inputs
+    ------
+    index (int): Index of the environment.
+    parameter (dict): Parameter of the fmi_gym.
+    pyfmi (class): FMU handler of the fmi_gym.
+    specs (dict): Specification of the shared buffers.
+    names (dict): Names of the shared buffers.
+    pipe (mp.Connection): Command pipe.
+    auto_reset (bool): Reset the environment when done.
+    '''
+    buffers = shared_buffers(specs, names=names)
+    env = None
+    try:
+        env = fmi_gym(parameter, pyfmi=pyfmi)
+        while True:
+            cmd = pipe.recv()
+            if cmd == 'close':
+                pipe.send(('ok', None))
+                break
+            try:
+                vec_command(env, index, cmd, buffers, auto_reset)
+            except Exception:
+                pipe.send(('error', traceback.format_exc()))
+                continue
+            pipe.send(('ok', None))
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        pipe.send(('error', traceback.format_exc()))
+    finally:
+        if env:
+            env.close()
+        buffers.close()
+        pipe.close()
+
+class vec_env_base(object):
+    '''Base class of the vectorized fmi_gym environments'''
+
+    def __init__(self, parameter, n_envs=None, auto_reset=True):
+        '''
+        Setup the vectorized environment.
+
+        Inputs
+        ------
+        parameter (dict or list): Parameter of fmi_gym, or list with parameter per environment.
+        n_envs (int): Number of environments if parameter is a dict, default None (cpu count).
+        auto_reset (bool): Reset environments when done, default True. The final observation
+                           is then returned in info['terminal_observation'].
+        '''
+        if isinstance(parameter, dict):
+            n_envs = n_envs if n_envs else os.cpu_count()
+            parameter = [parameter.copy() for _ in range(n_envs)]
+        self.parameters = parameter
+        self.n_envs = len(parameter)
+        self.auto_reset = auto_reset
+        self.waiting = []
+        self.closed = False
+
+        # Spaces (of a single environment)
+        p = get_default_parameter()
+        p.update(parameter[0])
+        self.precision = np.dtype(p['precision'])
+        self.action_space = gym.spaces.Box(low=p['action_min'],
+                                           high=p['action_max'],
+                                           shape=(len(p['action_names']), ),
+                                           dtype=self.precision)
+        self.observation_space = gym.spaces.Box(low=p['observation_min'],
+                                                high=p['observation_max'],
+                                                shape=(len(p['observation_names']), ),
+                                                dtype=self.precision)
+
+        # Buffer specification
+        n_act = len(p['action_names'])
+        n_obs = len(p['observation_names'])
+        self.specs = {'action': ((self.n_envs, n_act), 'float64'),
+                      'observation': ((self.n_envs, n_obs), 'float64'),
+                      'terminal_observation': ((self.n_envs, n_obs), 'float64'),
+                      'reward': ((self.n_envs, ), 'float64'),
+                      'done': ((self.n_envs, ), 'bool')}
+        self.buffers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_indices(self, indices):
+        ''' parse environment indices '''
+        if indices is None:
+            return list(range(self.n_envs))
+        return [int(i) for i in np.atleast_1d(indices)]
+
+    def send(self, cmd, indices):
+        ''' start command of environments '''
+        raise NotImplementedError
+
+    def receive(self, indices):
+        ''' wait for command of environments to finish '''
+        raise NotImplementedError
+
+    def reset(self, indices=None):
+        '''
+        Reset environments.
+
+        Inputs
+        ------
+        indices (list): Environments to reset, default None (all).
+
+        Returns
+        -------
+        observations (np.array): Observations of the environments.
+        '''
+        indices = self.get_indices(indices)
+        self.send('reset', indices)
+        self.receive(indices)
+        return self.buffers['observation'][indices].copy()
+
+    def step_async(self, actions, indices=None):
+        '''
+        Start a step of environments without waiting for the results.
+
+        Inputs
+        ------
+        actions (np.array): Actions of the environments, with one row per index.
+        indices (list): Environments to step, default None (all).
+        '''
+        indices = self.get_indices(indices)
+        self.buffers['action'][indices] = np.reshape(actions, (len(indices), -1))
+        self.send('step', indices)
+
+    def step_wait(self, indices=None):
+        '''
+        Wait for the step of environments started with step_async.
+
+        Inputs
+        ------
+        indices (list): Environments to wait for, default None (all).
+
+        Returns
+        -------
+        observations (np.array): Observations of the environments.
+        rewards (np.array): Rewards of the environments.
+        dones (np.array): Done flags of the environments.
+        infos (list): Info dictionary of the environments.
+        '''
+        indices = self.get_indices(indices)
+        self.receive(indices)
+        dones = self.buffers['done'][indices].copy()
+        infos = [{} for _ in indices]
+        if self.auto_reset:
+            for j, i in enumerate(indices):
+                if dones[j]:
+                    infos[j]['terminal_observation'] = \
+                        self.buffers['terminal_observation'][i].copy()
+        return self.buffers['observation'][indices].copy(), \
+            self.buffers['reward'][indices].copy(), dones, infos
+
+    def step(self, actions, indices=None):
+        '''
+        Step environments, see step_async and step_wait.
+        '''
+        self.step_async(actions, indices=indices)
+        return self.step_wait(indices=indices)
+
+    def close(self):
+        ''' close environments '''
+        raise NotImplementedError
+
+class fmi_gym_vec(vec_env_base):
+    '''Vectorized fmi_gym with one subprocess per environment'''
+
+    def __init__(self, parameter, n_envs=None, pyfmi=None, auto_reset=True, start_method=None):
+        '''
+        Setup the vectorized environment. Actions, observations, rewards, and
+        done flags are exchanged through shared memory with the workers.
+
+        Inputs
+        ------
+        parameter (dict or list): Parameter of fmi_gym, or list with parameter per environment.
+        n_envs (int): Number of environments if parameter is a dict, default None (cpu count).
+        pyfmi (class): Specifies FMU handler, default None. Must be picklable.
+        auto_reset (bool): Reset environments when done, default True. The final observation
+                           is then returned in info['terminal_observation'].
+        start_method (str): Start method of multiprocessing, default None (platform default).
+        '''
+        super(fmi_gym_vec, self).__init__(parameter, n_envs=n_envs, auto_reset=auto_reset)
+        self.buffers = shared_buffers(self.specs)
+
+        # Workers
+        ctx = mp.get_context(start_method)
+        self.pipes = []
+        self.processes = []
+        for i in range(self.n_envs):
+            pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(target=vec_worker,
+                                  args=(i, self.parameters[i], pyfmi, self.specs,
+                                        self.buffers.names, child_pipe, auto_reset),
+                                  daemon=True)
+            process.start()
+            child_pipe.close()
+            self.pipes.append(pipe)
+            self.processes.append(process)
+
+    def send(self, cmd, indices):
+        ''' send command to workers '''
+        for i in indices:
+            if i in self.waiting:
+                raise RuntimeError('Environment {} is still busy, call step_wait.'.format(i))
+            try:
+                self.pipes[i].send(cmd)
+            except (BrokenPipeError, ConnectionResetError, OSError) as e:
+                raise RuntimeError('The worker of environment {} has exited ({}).'.format(
+                    i, type(e).__name__)) from e
+            self.waiting.append(i)
+
+    def receive(self, indices):
+        ''' wait for workers to finish '''
+        errors = []
+        for i in indices:
+            if i not in self.waiting:
+                continue
+            try:
+                status, msg = self.pipes[i].recv()
+            except (EOFError, BrokenPipeError, ConnectionResetError, OSError) as e:
+                status, msg = 'error', 'The worker has exited ({}), exit code {}.'.format(
+                    type(e).__name__, self.processes[i].exitcode)
+            self.waiting.remove(i)
+            if status == 'error':
+                errors.append('Environment {}:\n{}'.format(i, msg))
+        if errors:
+            raise RuntimeError('\n'.join(errors))
+
+    def close(self):
+        ''' stop workers and release shared memory, also if workers have exited '''
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            try:
+                self.receive(list(self.waiting))
+            except RuntimeError as e:
+                print(e)
+            for pipe, process in zip(self.pipes, self.processes):
+                try:
+                    if process.is_alive():
+                        pipe.send('close')
+                        pipe.recv()
+                except (EOFError, BrokenPipeError, ConnectionResetError, OSError):
+                    pass
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+                pipe.close()
+        finally:
+            self.buffers.close()
+
+class fmi_gym_vec_thread(vec_env_base):
+    '''Vectorized fmi_gym with one thread per environment'''
+
+    def __init__(self, parameter, n_envs=None, pyfmi=None, auto_reset=True, work_dir=None):
+        '''
+        Setup the vectorized environment. All environments run in this process and
+        FMU calls are executed concurrently in a thread pool. Each environment loads
+        its FMU in a separate working directory (parameter "fmu_work_dir"). The working
+        directory of the process changes while an FMU is loaded, so FMUs which access
+        files by relative paths during do_step require fmi_gym_vec.
+
+        Inputs
+        ------
+        parameter (dict or list): Parameter of fmi_gym, or list with parameter per environment.
+        n_envs (int): Number of environments if parameter is a dict, default None (cpu count).
+        pyfmi (class): Specifies FMU handler, default None.
+        auto_reset (bool): Reset environments when done, default True. The final observation
+                           is then returned in info['terminal_observation'].
+        work_dir (str): Directory of the working directories, default None (system temp).
+                        The working directories are removed on close.
+        '''
+        super(fmi_gym_vec_thread, self).__init__(parameter, n_envs=n_envs,
+                                                 auto_reset=auto_reset)
+        self.buffers = {k: np.zeros(shape, dtype=dtype) for k, (shape, dtype) \
+            in self.specs.items()}
+        self.work_dirs = []
+        self.envs = []
+        self.futures = {}
+        self.pool = ThreadPoolExecutor(max_workers=self.n_envs)
+        for i in range(self.n_envs):
+            p = self.parameters[i].copy()
+            if not p.get('fmu_work_dir'):
+                p['fmu_work_dir'] = tempfile.mkdtemp(prefix='fmi_gym_{}_'.format(i), dir=work_dir)
+                self.work_dirs.append(p['fmu_work_dir'])
+            self.envs.append(fmi_gym(p, pyfmi=pyfmi))
+
+    def send(self, cmd, indices):
+        ''' submit command to thread pool '''
+        for i in indices:
+            if i in self.waiting:
+                raise RuntimeError('Environment {} is still busy, call step_wait.'.format(i))
+            self.futures[i] = self.pool.submit(vec_command, self.envs[i], i, cmd,
+                                               self.buffers, self.auto_reset)
+            self.waiting.append(i)
+
+    def receive(self, indices):
+        ''' wait for threads to finish '''
+        errors = []
+        for i in indices:
+            if i not in self.waiting:
+                continue
+            e = self.futures.pop(i).exception()
+            self.waiting.remove(i)
+            if e:
+                errors.append('Environment {}:\n{}'.format(i, \
+                    ''.join(traceback.format_exception(type(e), e, e.__traceback__))))
+        if errors:
+            raise RuntimeError('\n'.join(errors))
+
+    def close(self):
+        ''' close environments and remove working directories '''
+        if self.closed:
+            return
+        try:
+            self.receive(list(self.waiting))
+        except RuntimeError as e:
+            print(e)
+        self.pool.shutdown()
+        for env in self.envs:
+            env.close()
+        for d in self.work_dirs:
+            shutil.rmtree(d, ignore_errors=True)
+        self.closed = True
@@ -0,0 +1,1039 @@
+"""
+FMI-MLC fmi_gym test module.
+"""
+
+import os
+import sys
+import pickle
+import subprocess
+import time
+import asyncio
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import zipfile
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.join(root, '..'))
+
+from fmi_mlc import fmi_gym
+from fmi_mlc import data_store, episode_store, extract_fmu, step_schedule, disk_cache
+from fmi_mlc import fmi_gym_vec, fmi_gym_vec_thread
+from fmi_mlc import mock_fmu, get_mock_parameter
+from fmi_mlc import rc_model, rc_fmu
+from fmi_mlc import state_feed, state_reader, step_profiler
+from fmi_mlc import sweep, expand_scenarios, run_scenario, run_sharded, get_scenario_key
+
+class dummy_fmu(object):
+    '''Minimal FMU handler with first order dynamics'''
+
+    def __init__(self, path, log_level=0, kind='cs'):
+        self.values = {'u1': 0.0, 'u2': 0.0, 'y1': 20.0, 'y2': 1.0, 'r1': 0.0, 'p': 1.0}
+        self.time = 0
+
+    def set(self, names, values):
+        if isinstance(names, str):
+            names, values = [names], [values]
+        for n, v in zip(names, values):
+            self.values[n] = float(v)
+
+    def get(self, names):
+        if isinstance(names, str):
+            names = [names]
+        return np.array([self.values[n] for n in names])
+
+    def setup_experiment(self, start_time=0, **kwargs):
+        self.time = start_time
+
+    def initialize(self):
+        pass
+
+    def do_step(self, current_t, step_size):
+        v = self.values
+        v['y1'] += 1e-3 * step_size * (v['u1'] - 0.1 * (v['y1'] - 10))
+        v['y2'] = v['y2'] * 0.9 + v['u2'] * v['p']
+        v['r1'] = -abs(v['y1'] - 21)
+        self.time = current_t + step_size
+        return 0
+
+    def terminate(self):
+        pass
+
+class dummy_fmu_refs(dummy_fmu):
+    '''Dummy FMU handler with value references'''
+
+    def __init__(self, *args, **kwargs):
+        super(dummy_fmu_refs, self).__init__(*args, **kwargs)
+        self.names = list(self.values.keys())
+        self.n_set = 0
+
+    def get_variable_valueref(self, name):
+        return self.names.index(name)
+
+    def get_variable_data_type(self, name):
+        return 0
+
+    def set_real(self, refs, values):
+        self.n_set += len(refs)
+        self.set([self.names[r] for r in refs], values)
+
+    def get_real(self, refs):
+        return self.get([self.names[r] for r in refs])
+
+class dummy_fmu_state(dummy_fmu_refs):
+    '''Dummy FMU handler with FMU state'''
+
+    def __init__(self, *args, **kwargs):
+        super(dummy_fmu_state, self).__init__(*args, **kwargs)
+        self.n_step = 0
+
+    def do_step(self, current_t, step_size):
+        self.n_step += 1
+        return super(dummy_fmu_state, self).do_step(current_t, step_size)
+
+    def get_fmu_state(self):
+        return (self.values.copy(), self.time)
+
+    def set_fmu_state(self, state):
+        self.values = state[0].copy()
+        self.time = state[1]
+
+    def reset(self):
+        self.__init__(None)
+
+    def serialize_fmu_state(self, state):
+        return pickle.dumps(state)
+
+    def deserialize_fmu_state(self, state):
+        return pickle.loads(state)
+
+class failing_fmu(dummy_fmu):
+    '''Dummy FMU handler which fails after the first hour'''
+
+    def do_step(self, current_t, step_size):
+        if current_t >= 60*60:
+            raise RuntimeError('Simulation failed.')
+        return super(failing_fmu, self).do_step(current_t, step_size)
+
+class array_preprocessor(object):
+    '''Preprocessor with the array protocol'''
+
+    def __init__(self, parameter):
+        self.input_names = ['time', 'u1']
+        self.output_names = ['u1', 'hour']
+
+    def do_calc_array(self, inputs, outputs, init):
+        outputs[0] = 2 * inputs[1]
+        outputs[1] = inputs[0] / 3600 % 24
+
+class array_postprocessor(object):
+    '''Postprocessor with the array protocol'''
+
+    def __init__(self, parameter):
+        self.input_names = ['y1', 'y2']
+        self.output_names = ['y_sum']
+
+    def do_calc_array(self, inputs, outputs, init):
+        outputs[0] = inputs.sum()
+
+class array_stateprocessor(object):
+    '''Stateprocessor with the array protocol'''
+
+    def __init__(self, parameter):
+        self.input_names = ['y_sum', 'hour']
+        self.output_names = ['y_sum', 'hour']
+
+    def do_calc_array(self, inputs, outputs, init):
+        outputs[:] = inputs
+
+class feedback_preprocessor(object):
+    '''Preprocessor with the array protocol which feeds back an output'''
+
+    def __init__(self, parameter):
+        self.input_names = ['u1', 'y1']
+        self.output_names = ['u2']
+
+    def do_calc_array(self, inputs, outputs, init):
+        outputs[0] = inputs[0] + 0.5 * (21 - inputs[1])
+
+class gain_preprocessor(object):
+    '''Preprocessor with the array protocol and a setting'''
+
+    def __init__(self, parameter, gain=1):
+        self.gain = gain
+        self.input_names = ['u1']
+        self.output_names = ['u1']
+
+    def do_calc_array(self, inputs, outputs, init):
+        outputs[0] = self.gain * inputs[0]
+
+class frame_preprocessor(object):
+    '''Preprocessor with pd.DataFrame'''
+
+    def __init__(self, parameter):
+        pass
+
+    def do_calc(self, data, init):
+        data['u1'] = 2 * data['u1']
+        data['hour'] = data['time'] / 3600 % 24
+        return data
+
+def hourly_schedule(time):
+    ''' step schedule with a fixed step size '''
+    return 60*60
+
+def constant_controller(observation, info):
+    ''' controller with constant actions '''
+    return np.array([0.5, -0.5])
+
+class gain_controller(object):
+    ''' controller with actions proportional to the first observation '''
+
+    def __init__(self, gain):
+        self.gain = gain
+
+    def __call__(self, observation, info):
+        return np.array([self.gain, -self.gain]) * observation[0] / 20
+
+def read_feed(name, n):
+    ''' read a state feed n times and return the number of inconsistent states '''
+    reader = state_reader(name)
+    errors = 0
+    for _ in range(n):
+        res = reader.read()
+        errors += not np.all(res['state'] == res['step'])
+    reader.close()
+    return errors
+
+def get_parameter(**kwargs):
+    parameter = {
+        'fmu_path': 'dummy.fmu',
+        'action_names': ['u1', 'u2'],
+        'observation_names': ['y1', 'y2'],
+        'reward_names': ['r1'],
+        'fmu_final_time': 24*60*60,
+    }
+    parameter.update(kwargs)
+    return parameter
+
+def run_episode(env):
+    states = [env.reset()[0]]
+    rewards = []
+    done = False
+    k = 0
+    while not done:
+        state, reward, done, _ = env.step([np.cos(k), 0.1*k])
+        states.append(state)
+        rewards.append(reward)
+        k += 1
+    return np.array(states), np.array(rewards)
+
+def test_data_store():
+    """
+    Test appending rows of changing columns and dtypes.
+    """
+    store = data_store(capacity=2)
+    frames = [pd.DataFrame({'time': [0], 'a': [1]}, index=[0]),
+              pd.DataFrame({'time': [60], 'a': [1.5], 'b': ['x']}, index=[60]),
+              pd.DataFrame({'time': [120], 'b': ['y']}, index=[120])]
+    for frame in frames:
+        store.append(frame)
+    pd.testing.assert_frame_equal(store.to_frame(), pd.concat(frames), check_dtype=False)
+    store.keep_last()
+    assert store.to_frame().index.tolist() == [120]
+
+def test_episode_store(tmp_path):
+    """
+    Test that spilled episodes are read back from disk.
+    """
+    frames = [pd.DataFrame({'time': [0, 60*k], 'a': [1.5, k], 'b': ['x', 'y']},
+                           index=[0, 60*k]) for k in range(5)]
+    store = episode_store(max_episodes=2, path=str(tmp_path))
+    for frame in frames:
+        store.append(frame)
+    assert len(store) == 5 and len(store.memory) == 2
+    assert len(os.listdir(tmp_path)) == 3
+    for frame, res in zip(frames, store):
+        pd.testing.assert_frame_equal(frame, res)
+    pd.testing.assert_frame_equal(store[-4], frames[1])
+    env = fmi_gym(get_parameter(store_data=True, store_all_data=True,
+                                store_all_data_max=1), pyfmi=dummy_fmu)
+    for _ in range(3):
+        run_episode(env)
+    assert len(env.data_all) == 3
+    pd.testing.assert_frame_equal(env.data_all[0], env.data)
+
+def test_store_data():
+    """
+    Test that the recorded data matches the episode.
+    """
+    env = fmi_gym(get_parameter(store_data=True, fmu_warmup_time=2*60*60),
+                  pyfmi=dummy_fmu)
+    states, rewards = run_episode(env)
+    data = env.data
+    assert len(data) == len(states)
+    assert np.allclose(data['reward'].values[1:], rewards)
+    assert np.allclose(data[['y1', 'y2']].values, states)
+    assert data.index[-1] == 24*60*60
+
+def test_numpy_step():
+    """
+    Test that the NumPy step matches the pd.DataFrame step.
+    """
+    results = []
+    for numpy_step in [False, True]:
+        env = fmi_gym(get_parameter(store_data=True, numpy_step=numpy_step),
+                      pyfmi=dummy_fmu)
+        results.append(run_episode(env) + (env.data, ))
+    assert np.array_equal(results[0][0], results[1][0])
+    assert np.array_equal(results[0][1], results[1][1])
+    pd.testing.assert_frame_equal(results[0][2], results[1][2], check_like=True)
+
+def test_compact_data():
+    """
+    Test that the compact mode records the precision and integer time.
+    """
+    env = fmi_gym(get_parameter(store_data=True), pyfmi=dummy_fmu)
+    states, rewards = run_episode(env)
+    data = env.data
+    results = []
+    for numpy_step in [False, True]:
+        env = fmi_gym(get_parameter(store_data=True, numpy_step=numpy_step,
+                                    precision='float32', compact_data=True),
+                      pyfmi=dummy_fmu)
+        results.append(run_episode(env) + (env.data, ))
+        assert results[-1][0].dtype == np.float32
+        assert env.data['time'].dtype == np.int64
+        assert (env.data.drop(columns='time').dtypes == np.float32).all()
+        assert np.allclose(results[-1][0], states, rtol=1e-6)
+        assert np.allclose(results[-1][2].values, data.values, rtol=1e-6)
+    assert np.array_equal(results[0][0], results[1][0])
+    assert np.array_equal(results[0][1], results[1][1])
+    pd.testing.assert_frame_equal(results[0][2], results[1][2], check_like=True)
+
+def test_array_processor():
+    """
+    Test that processors with the array protocol match the pd.DataFrame protocol.
+    """
+    parameter = get_parameter(store_data=True, hidden_input_names=['hour'])
+    env = fmi_gym(dict(parameter, preprocessor=frame_preprocessor), pyfmi=dummy_fmu)
+    states, rewards = run_episode(env)
+    data = env.data
+    results = []
+    for numpy_step in [False, True]:
+        env = fmi_gym(dict(parameter, numpy_step=numpy_step,
+                           preprocessor=array_preprocessor,
+                           postprocessor=array_postprocessor,
+                           stateprocessor=array_stateprocessor), pyfmi=dummy_fmu)
+        assert env.numpy_step == numpy_step
+        results.append(run_episode(env) + (env.data, ))
+        res = results[-1]
+        assert np.array_equal(res[1], rewards)
+        assert np.allclose(res[0][:, 0], states.sum(axis=1))
+        assert np.allclose(res[0][1:, 1], data['hour'].values[1:])
+        assert np.allclose(res[2]['y_sum'], data['y1'] + data['y2'])
+    assert np.array_equal(results[0][0][1:], results[1][0][1:])
+    pd.testing.assert_frame_equal(results[0][2], results[1][2], check_like=True,
+                                  check_dtype=False)
+
+def test_profile(capsys):
+    """
+    Test the phases and summary of the step profiler.
+    """
+    for numpy_step in [False, True]:
+        env = fmi_gym(get_parameter(numpy_step=numpy_step, profile=True,
+                                    profile_log_interval=10, profile_allocations=True),
+                      pyfmi=dummy_fmu)
+        _, rewards = run_episode(env)
+        summary = env.profiler.summary()
+        for phase in ['set_inputs', 'do_step', 'get_outputs', 'reward', 'store']:
+            assert summary.loc[phase, 'count'] == len(rewards)
+        assert summary.loc['step', 'count'] == len(rewards)
+        assert summary.loc['step', 'total'] >= summary.loc['do_step', 'total']
+        assert (summary[['mean', 'p50', 'p99']] >= 0).all().all()
+        assert 'allocations' in summary.columns
+        assert capsys.readouterr().out.count('fmi_gym profile of') == 2
+    env = fmi_gym(get_parameter(), pyfmi=dummy_fmu)
+    assert env.profiler is None
+
+    # The memory of the profiler is bounded
+    profiler = step_profiler(max_samples=100)
+    for _ in range(1000):
+        profiler.stop('a', profiler.start())
+    summary = profiler.summary()
+    assert len(profiler.times['a']['samples']) == 100
+    assert summary.loc['a', 'count'] == 1000
+    assert summary.loc['a', 'min'] <= summary.loc['a', 'p50'] <= summary.loc['a', 'max']
+
+def test_output_sampling(tmp_path):
+    """
+    Test the sampling of hidden and record-only outputs.
+    """
+    kwargs = {'n_outputs': 3, 'observation_names': ['y0'], 'hidden_observation_names': ['y1'],
+              'record_names': ['y2'], 'fmu_step_size': 60*60, 'store_data': True}
+    sampling = {'y1': 3*60*60, 'y2': 6*60*60}
+    handler = partial(mock_fmu, n_outputs=3)
+    reference = fmi_gym(get_mock_parameter(**kwargs), pyfmi=handler)
+    run_episode(reference)
+    for numpy_step in [False, True]:
+        env = fmi_gym(get_mock_parameter(output_sampling=sampling, numpy_step=numpy_step,
+                                         **kwargs), pyfmi=handler)
+        run_episode(env)
+        hours = (env.data['time'] / 3600).astype(int)
+        assert env.data['y1'].notna().equals(hours % 3 == 0)
+        assert env.data['y2'].notna().equals(hours % 6 == 0)
+        assert np.allclose(env.data['y0'], reference.data['y0'])
+        assert np.allclose(env.data['y2'].dropna(), reference.data['y2'][hours % 6 == 0])
+
+    # Sampled outputs take little space in a Parquet sink
+    pytest.importorskip('pyarrow')
+    names = ['y{}'.format(i) for i in range(1, 20)]
+    sizes = []
+    for sampling in [{}, {n: 24*60*60 for n in names}]:
+        sink = str(tmp_path / 'sink_{}'.format(len(sampling)))
+        env = fmi_gym(get_mock_parameter(n_outputs=20, observation_names=['y0'],
+                                         record_names=names, fmu_step_size=5*60,
+                                         store_data=True, store_sink=sink,
+                                         output_sampling=sampling),
+                      pyfmi=partial(mock_fmu, n_outputs=20))
+        env.reset()
+        env.rollout()
+        env.close()
+        data = pd.read_parquet(sink)
+        assert len(data) == 24*12 + 1
+        sizes.append(sum(os.path.getsize(os.path.join(sink, f)) for f in os.listdir(sink)))
+    assert data[names].notna().sum().tolist() == [2]*len(names)
+    assert sizes[1] < 0.5 * sizes[0]
+
+def test_info_data():
+    """
+    Test the info formats of step and reset.
+    """
+    infos = {}
+    for mode in [None, 'dict', 'json', 'lazy']:
+        for numpy_step in [False, True]:
+            env = fmi_gym(get_parameter(info_data=mode, numpy_step=numpy_step),
+                          pyfmi=dummy_fmu)
+            _, info_reset = env.reset()
+            info = env.step([0.5, 2.0])[3]
+            infos[(mode, numpy_step)] = (info_reset, info)
+    assert infos[(None, False)] == ({}, {})
+    expected = infos[('json', False)]
+    assert infos[('lazy', False)][1]['data'] == expected[1]['data']
+    assert infos[('lazy', True)][1]['data'] == expected[1]['data']
+    assert infos[('lazy', True)][0].get('data') == expected[0]['data']
+    assert infos[('dict', True)][1]['data'] == infos[('dict', False)][1]['data']
+    env.reset()
+    assert dict(env.step([0.5, 2.0])[3]) == expected[1]
+    assert {**env.step([0.5, 2.0])[3]}['data'] is not None
+    assert env.step([0.5, 2.0])[3] != {'data': None}
+    info = pickle.loads(pickle.dumps(env.step([0.5, 2.0])[3]))
+    assert type(info) == dict and info['data'] is not None
+
+    # The reset info holds the data of the reset, also when read after steps
+    env = fmi_gym(get_parameter(store_data=True), pyfmi=dummy_fmu)
+    info_reset = env.reset()[1]
+    data = env.data.to_json()
+    env.step([0.5, 2.0])
+    assert info_reset['data'] == data
+
+def test_value_references():
+    """
+    Test that value references give the same results and skip unchanged inputs.
+    """
+    results = []
+    for numpy_step in [False, True]:
+        for pyfmi in [dummy_fmu, dummy_fmu_refs]:
+            env = fmi_gym(get_parameter(numpy_step=numpy_step), pyfmi=pyfmi)
+            results.append(run_episode(env))
+            assert np.array_equal(results[0][0], results[-1][0])
+            assert np.array_equal(results[0][1], results[-1][1])
+        env.reset()
+        for _ in range(3):
+            env.step([1, 2])
+        assert env.fmu.n_set == 2
+
+def test_vec_env():
+    """
+    Test that the vectorized environments match a single environment.
+    """
+    parameter = get_parameter(fmu_final_time=4*60*60)
+    env = fmi_gym(parameter, pyfmi=dummy_fmu)
+    states, rewards = run_episode(env)
+    for vec in [fmi_gym_vec, fmi_gym_vec_thread]:
+        with vec(parameter, n_envs=2, pyfmi=dummy_fmu) as vec_env:
+            assert np.array_equal(vec_env.reset(), [states[0]]*2)
+            for k in range(len(rewards)):
+                vec_env.step_async([[np.cos(k), 0.1*k]]*2)
+                obs, rew, done, info = vec_env.step_wait()
+                assert np.array_equal(rew, [rewards[k]]*2)
+            assert done.all()
+            assert np.array_equal(info[1]['terminal_observation'], states[-1])
+            assert np.array_equal(obs, [states[0]]*2)
+    work_dirs = [e.parameter['fmu_work_dir'] for e in vec_env.envs]
+    assert len(set(work_dirs)) == 2
+    assert not any(os.path.exists(d) for d in work_dirs)
+
+    # Errors of a worker are raised and the worker continues
+    vec_env = fmi_gym_vec(parameter, n_envs=2, pyfmi=failing_fmu)
+    vec_env.reset()
+    vec_env.step([[0, 0]]*2)
+    with pytest.raises(RuntimeError, match='Simulation failed'):
+        vec_env.step([[0, 0]]*2)
+    assert np.array_equal(vec_env.reset(), [states[0]]*2)
+
+    # Exited workers are reported and the shared memory is released
+    vec_env.processes[1].terminate()
+    vec_env.processes[1].join()
+    with pytest.raises(RuntimeError, match='nvironment 1'):
+        vec_env.step([[0, 0]]*2)
+    names = list(vec_env.buffers.names.values())
+    vec_env.close()
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+def test_async_step():
+    """
+    Test concurrent async steps, timeouts, and cancellation.
+    """
+    env = fmi_gym(get_parameter(fmu_final_time=4*60*60), pyfmi=dummy_fmu)
+    states, rewards = run_episode(env)
+
+    async def run(envs):
+        res = await asyncio.gather(*[e.areset() for e in envs])
+        states_async = [[r[0]] for r in res]
+        rewards_async = [[] for _ in envs]
+        for k in range(len(rewards)):
+            res = await asyncio.gather(*[e.astep([np.cos(k), 0.1*k]) for e in envs])
+            for i, r in enumerate(res):
+                states_async[i].append(r[0])
+                rewards_async[i].append(r[1])
+        return states_async, rewards_async
+    envs = [fmi_gym(get_parameter(fmu_final_time=4*60*60), pyfmi=dummy_fmu) \
+        for _ in range(2)]
+    states_async, rewards_async = asyncio.run(run(envs))
+    for i in range(2):
+        assert np.array_equal(states_async[i], states)
+        assert np.array_equal(rewards_async[i], rewards)
+
+    async def run_timeout(env, env_queued, executor):
+        await env.areset(executor=executor)
+        await env_queued.areset(executor=executor)
+        try:
+            await env.astep([0, 0], timeout=0.01, executor=executor)
+        except asyncio.TimeoutError:
+            pass
+        queued = asyncio.ensure_future(env_queued.astep([0, 0], executor=executor))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await env.astep([0, 0], executor=executor)
+        return env.fmu_time, env_queued.fmu_time
+    handler = partial(mock_fmu, step_cost=0.2)
+    envs = [fmi_gym(get_mock_parameter(), pyfmi=handler) for _ in range(2)]
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        fmu_time, fmu_time_queued = asyncio.run(run_timeout(*envs, executor))
+    assert fmu_time == 2*60*60
+    assert fmu_time_queued == 0
+
+def test_fmu_snapshot():
+    """
+    Test that resets from the snapshot match resets with warmup.
+    """
+    parameter = get_parameter(store_data=True, store_warmup=True,
+                              fmu_warmup_time=2*60*60, numpy_step=True)
+    env = fmi_gym(parameter, pyfmi=dummy_fmu_state)
+    states, rewards = run_episode(env)
+    data = env.data
+    env_snap = fmi_gym(dict(parameter, fmu_snapshot=True), pyfmi=dummy_fmu_state)
+    for _ in range(2):
+        fmu = env_snap.fmu
+        states_snap, rewards_snap = run_episode(env_snap)
+        assert np.array_equal(states, states_snap)
+        assert np.array_equal(rewards, rewards_snap)
+        pd.testing.assert_frame_equal(data, env_snap.data)
+    assert env_snap.fmu is fmu
+    assert fmu.n_step == 2 + 2*len(rewards)
+
+    # Array processors start from the row of the reset
+    parameter['preprocessor'] = feedback_preprocessor
+    states, rewards = run_episode(fmi_gym(parameter, pyfmi=dummy_fmu_state))
+    assert np.isfinite(states).all()
+    env_snap = fmi_gym(dict(parameter, fmu_snapshot=True), pyfmi=dummy_fmu_state)
+    for _ in range(2):
+        states_snap, rewards_snap = run_episode(env_snap)
+        assert np.array_equal(states, states_snap)
+        assert np.array_equal(rewards, rewards_snap)
+
+def get_warmup_parameter(path, **kwargs):
+    ''' returns the parameter of test_fmu_warmup_cache '''
+    return get_parameter(store_data=True, fmu_warmup_time=2*60*60,
+                         fmu_path=os.path.join(path, 'dummy.fmu'),
+                         fmu_warmup_cache=os.path.join(path, 'cache'), **kwargs)
+
+def test_fmu_warmup_cache(tmp_path, monkeypatch):
+    """
+    Test that the warmup cache is shared across instances.
+    """
+    (tmp_path / 'dummy.fmu').write_bytes(b'dummy')
+    parameter = get_warmup_parameter(str(tmp_path))
+    results = []
+    for _ in range(2):
+        env = fmi_gym(parameter, pyfmi=dummy_fmu_state)
+        results.append(run_episode(env) + (env.data, env.fmu.n_step))
+    assert np.array_equal(results[0][0], results[1][0])
+    assert np.array_equal(results[0][1], results[1][1])
+    pd.testing.assert_frame_equal(results[0][2], results[1][2])
+    assert results[0][3] - results[1][3] == 2
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+
+    # Settings which change the state after warmup are part of the key
+    env = fmi_gym(dict(parameter, fmu_tolerance=1e-4), pyfmi=dummy_fmu_state)
+    env.reset()
+    assert len(os.listdir(tmp_path / 'cache')) == 2
+
+    # Processor settings are part of the key and processors are never restored
+    parameter['preprocessor'] = partial(gain_preprocessor, gain=2)
+    env = fmi_gym(parameter, pyfmi=dummy_fmu_state)
+    env.reset()
+    assert len(os.listdir(tmp_path / 'cache')) == 3
+    env = fmi_gym(parameter, pyfmi=dummy_fmu_state)
+    preprocessor = env.preprocessor
+    preprocessor.gain = 3
+    env.reset()
+    assert len(os.listdir(tmp_path / 'cache')) == 4
+    assert env.preprocessor is preprocessor and env.preprocessor.gain == 3
+    env = fmi_gym(parameter, pyfmi=dummy_fmu_state)
+    env.reset()
+    assert env.fmu.n_step == 0 and env.preprocessor.gain == 2
+
+    # Functions in the parameter are keyed across processes
+    parameter = get_warmup_parameter(str(tmp_path), fmu_step_schedule=hourly_schedule,
+                                     preprocessor=partial(gain_preprocessor, gain=2))
+    script = 'import sys; sys.path[:0] = [{!r}]; import test_fmi_gym as t; ' \
+        'print(t.fmi_gym(t.get_warmup_parameter({!r}, fmu_step_schedule=t.hourly_schedule, ' \
+        'preprocessor=t.partial(t.gain_preprocessor, gain=2)), ' \
+        'pyfmi=t.dummy_fmu_state).get_warmup_key())'.format(root, str(tmp_path))
+    res = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True)
+    key = fmi_gym(parameter, pyfmi=dummy_fmu_state).get_warmup_key()
+    assert res.stdout.decode().strip() == key
+    with pytest.raises(ValueError):
+        fmi_gym(dict(parameter, fmu_step_schedule=lambda t: 60*60),
+                pyfmi=dummy_fmu_state).get_config_key()
+
+    # Relative paths are resolved on initialization
+    monkeypatch.chdir(tmp_path)
+    env = fmi_gym(dict(parameter, fmu_path='dummy.fmu', fmu_warmup_cache='relative',
+                       fmu_work_dir='work'), pyfmi=dummy_fmu_state)
+    monkeypatch.chdir(tmp_path / 'cache')
+    env.reset()
+    assert len(os.listdir(tmp_path / 'relative')) == 1
+    assert os.path.isdir(tmp_path / 'work')
+    assert env.get_fmu_key()[0] == fmi_gym(parameter, pyfmi=dummy_fmu_state).get_fmu_key()[0]
+
+    # Handlers without FMU file
+    parameter = get_mock_parameter(fmu_warmup_time=2*60*60,
+                                   fmu_warmup_cache=str(tmp_path / 'mock'))
+    states = [fmi_gym(parameter, pyfmi=mock_fmu).reset()[0] for _ in range(2)]
+    assert np.array_equal(states[0], states[1])
+    assert len(os.listdir(tmp_path / 'mock')) == 1
+
+def test_fmu_reuse_instance(tmp_path):
+    """
+    Test that a reused FMU instance matches a reloaded FMU.
+    """
+    env = fmi_gym(get_parameter(), pyfmi=dummy_fmu_state)
+    results = run_episode(env)
+    env_reuse = fmi_gym(get_parameter(fmu_reuse_instance=True), pyfmi=dummy_fmu_state)
+    run_episode(env_reuse)
+    fmu = env_reuse.fmu
+    results_reuse = run_episode(env_reuse)
+    assert env_reuse.fmu is fmu
+    assert np.array_equal(results[0], results_reuse[0])
+    assert np.array_equal(results[1], results_reuse[1])
+
+    fmu_path = tmp_path / 'dummy.fmu'
+    with zipfile.ZipFile(fmu_path, 'w') as f:
+        f.writestr('modelDescription.xml', '<fmiModelDescription/>')
+    directory = extract_fmu(str(fmu_path))
+    assert extract_fmu(str(fmu_path)) == directory
+    assert os.path.exists(os.path.join(directory, 'modelDescription.xml'))
+
+def test_rollout():
+    """
+    Test that the rollout matches the step.
+    """
+    n = 24
+    actions = np.array([[np.cos(k), 0.1*k] for k in range(n)])
+    for numpy_step in [False, True]:
+        env = fmi_gym(get_parameter(store_data=True, numpy_step=numpy_step),
+                      pyfmi=dummy_fmu)
+        states, rewards = run_episode(env)
+        data = env.data
+        env.reset()
+        time, states_rollout, rewards_rollout = env.rollout(actions)
+        assert np.array_equal(time, np.arange(1, n+1)*60*60)
+        assert np.array_equal(states[1:], states_rollout)
+        assert np.array_equal(rewards, rewards_rollout)
+        pd.testing.assert_frame_equal(data, env.data)
+
+def test_rollout_cache(tmp_path):
+    """
+    Test the episode cache of rollouts and scenarios.
+    """
+    parameter = get_mock_parameter(fmu_step_size=60*60, store_data=True,
+                                   rollout_cache=str(tmp_path / 'rollout'))
+    actions = np.random.RandomState(0).uniform(-1, 1, (24, 2))
+    results = []
+    for _ in range(2):
+        env = fmi_gym(parameter, pyfmi=partial(mock_fmu, step_cost=0.01))
+        env.reset()
+        st = time.perf_counter()
+        res = env.rollout(actions)
+        results.append((time.perf_counter() - st, res, env.data, env.state))
+        env.close()
+    assert len(os.listdir(str(tmp_path / 'rollout'))) == 1
+    assert results[1][0] < 0.1 < results[0][0]
+    for a, b in zip(results[0][1], results[1][1]):
+        assert np.array_equal(a, b)
+    assert results[0][2].equals(results[1][2])
+    assert np.array_equal(results[0][3], results[1][3])
+
+    # Partial episodes and other actions are not restored
+    env = fmi_gym(parameter, pyfmi=mock_fmu)
+    env.reset()
+    assert np.array_equal(env.rollout(actions[:12])[1], results[0][1][1][:12])
+    env.reset()
+    env.rollout(-actions)
+    assert len(os.listdir(str(tmp_path / 'rollout'))) == 2
+
+    # Mappings and processor settings are part of the key
+    for update in [{'hidden_input_names': ['u1']},
+                   {'preprocessor': partial(gain_preprocessor, gain=2)},
+                   {'preprocessor': partial(gain_preprocessor, gain=3)}]:
+        env = fmi_gym(dict(parameter, **update), pyfmi=mock_fmu)
+        env.reset()
+        assert not np.array_equal(env.rollout(actions)[1], results[0][1][1])
+    env.reset()
+    env.preprocessor.gain = 4
+    observations = env.rollout(actions)[1]
+    assert len(os.listdir(str(tmp_path / 'rollout'))) == 6
+    env = fmi_gym(dict(parameter, preprocessor=partial(gain_preprocessor, gain=4)),
+                  pyfmi=mock_fmu)
+    env.reset()
+    assert np.array_equal(env.rollout(actions)[1], observations)
+
+    # Episodes that continue the FMU are simulated
+    states = []
+    for cache in [None] + [str(tmp_path / 'ignore')] * 2:
+        env = fmi_gym(get_mock_parameter(fmu_step_size=60*60, ignore_reset=True,
+                                         rollout_cache=cache), pyfmi=mock_fmu)
+        for _ in range(2):
+            env.reset()
+            env.rollout(actions)
+        env.reset()
+        states.append(env.step(actions[0])[0])
+        env.close()
+    assert not os.path.exists(str(tmp_path / 'ignore')) \
+        or not os.listdir(str(tmp_path / 'ignore'))
+    assert np.array_equal(states[0], states[1])
+    assert np.array_equal(states[0], states[2])
+
+    # Scenario results with controller
+    cache = disk_cache(str(tmp_path / 'scenario'))
+    data = run_scenario(parameter, controller=constant_controller, pyfmi=mock_fmu, cache=cache)
+    assert len(cache.entries()) == 1
+    assert data.equals(run_scenario(parameter, controller=constant_controller,
+                                    pyfmi=mock_fmu, cache=cache))
+
+    # Controller instances are keyed by their attributes, lambdas cannot be keyed
+    data = [run_scenario(parameter, controller=gain_controller(k), pyfmi=mock_fmu,
+                         cache=cache) for k in [0.2, 0.4]]
+    assert len(cache.entries()) == 3
+    assert not data[0].equals(data[1])
+    with pytest.raises(ValueError):
+        get_scenario_key(parameter, controller=lambda observation, info: [0, 0])
+
+def test_step_schedule():
+    """
+    Test variable step sizes and held actions of a step schedule.
+    """
+    schedule = step_schedule([{'hours': (8, 18), 'weekdays': [0, 1, 2, 3, 4],
+                               'step_size': 15*60},
+                              {'hours': (18, 6), 'step_size': 3*60*60, 'action': False}],
+                             default_step_size=60*60)
+    assert schedule(8*60*60) == 15*60
+    assert schedule(17*60*60 + 50*60) == 10*60
+    assert schedule(4*60*60) == 2*60*60
+    assert schedule(5*24*60*60 + 8*60*60) == 60*60
+    assert not schedule.is_action_point(20*60*60)
+    for numpy_step in [False, True]:
+        env = fmi_gym(get_parameter(store_data=True, numpy_step=numpy_step,
+                                    fmu_step_schedule=schedule,
+                                    fmu_final_time=24*60*60 + 30*60),
+                      pyfmi=dummy_fmu)
+        env.reset()
+        time = []
+        done = False
+        while not done:
+            _, reward, done, _ = env.step([1, 0])
+            time.append(env.fmu_time)
+        assert time[:4] == [6*60*60, 7*60*60, 8*60*60, 8*60*60 + 15*60]
+        assert time[-2:] == [17*60*60 + 45*60, 24*60*60 + 30*60]
+        assert env.data.index.tolist()[-4:] == [18*60*60, 21*60*60, 24*60*60,
+                                                24*60*60 + 30*60]
+        assert len(env.data) == 1 + 2 + 2 + 10*4 + 3
+
+def test_store_sink(tmp_path):
+    """
+    Test that the streamed data matches the recorded data.
+    """
+    pytest.importorskip('pyarrow')
+    import pyarrow.ipc
+    parameter = get_parameter(store_data=True, fmu_warmup_time=2*60*60)
+    env = fmi_gym(parameter, pyfmi=dummy_fmu)
+    run_episode(env)
+    data = env.data
+    for path in ['data', 'data.arrow']:
+        for numpy_step in [False, True]:
+            sink = str(tmp_path / '{}_{}'.format(numpy_step, path))
+            env = fmi_gym(dict(parameter, numpy_step=numpy_step, store_sink=sink,
+                               store_sink_chunk=5), pyfmi=dummy_fmu)
+            for _ in range(2):
+                run_episode(env)
+                assert len(env.data) == 0
+            if path.endswith('.arrow'):
+                res = pyarrow.ipc.open_stream(sink).read_pandas()
+            else:
+                res = pd.read_parquet(sink)
+            env.close()
+            assert res['episode'].tolist() == [1]*len(data) + [2]*len(data)
+            res = res[res['episode'] == 2].drop(columns='episode')
+            pd.testing.assert_frame_equal(res.reset_index(drop=True),
+                                          data.reset_index(drop=True),
+                                          check_dtype=False, check_like=True)
+
+def test_mock_fmu():
+    """
+    Test the configurable mock FMU.
+    """
+    parameter = get_mock_parameter(n_inputs=3, n_outputs=17, store_data=True)
+    handler = partial(mock_fmu, n_inputs=3, n_outputs=17)
+    results = []
+    for numpy_step in [False, True]:
+        env = fmi_gym(dict(parameter, numpy_step=numpy_step), pyfmi=handler)
+        env.reset()
+        results.append(env.rollout(np.full((24, 3), 0.5)))
+        assert env.data.shape == (25, 1 + 3 + 17 + 2)
+    assert np.array_equal(results[0][1], results[1][1])
+    assert results[0][1].shape == (24, 17)
+    env = fmi_gym(dict(parameter, fmu_snapshot=True), pyfmi=handler)
+    assert np.array_equal(env.reset()[0], env.reset()[0])
+    assert env.snapshot is not None
+
+def test_rc_surrogate(tmp_path):
+    """
+    Test the calibration of the RC surrogate and its use as FMU handler.
+    """
+    time = np.arange(0, 28*24*60*60 + 1, 60*60)
+    rng = np.random.RandomState(0)
+    data = pd.DataFrame({'time': time,
+                         'T_out': 10 + 8*np.sin(2*np.pi*time/(24*60*60)),
+                         'DNI': np.maximum(0, 800*np.sin(2*np.pi*time/(24*60*60))),
+                         'u': rng.uniform(0, 1, len(time)),
+                         'Electricity': rng.uniform(0, 1e6, len(time))})
+    x = np.empty(len(time))
+    x[0] = 20
+    for k in range(len(time) - 1):
+        x[k+1] = 0.9*x[k] + 0.1*data['T_out'][k] + 1e-3*data['DNI'][k] + 2*data['u'][k] + 0.5
+    data['T_zone'] = x
+    path = str(tmp_path / 'data.csv')
+    data.to_csv(path, index=False)
+    model = rc_model.from_csv(path, input_names=['u'])
+    assert model.state_names == ['T_zone']
+    assert np.isclose(model.a[0], 0.9)
+    assert np.allclose(model.simulate(data)['T_zone'], x)
+    model.save(str(tmp_path / 'model.pkl'))
+
+    parameter = {'fmu_path': str(tmp_path / 'model.pkl'), 'action_names': ['u'],
+                 'observation_names': ['T_zone', 'T_out', 'Electricity'],
+                 'fmu_final_time': 24*60*60, 'numpy_step': True}
+    env = fmi_gym(parameter, pyfmi=rc_fmu)
+    env.reset()
+    _, obs, _ = env.rollout(data[['u']].values[:24])
+    assert np.allclose(obs[:, 0], x[1:25])
+    assert np.allclose(obs[:, 1:], data[['T_out', 'Electricity']].values[1:25])
+
+    # Inputs which are not inputs of the model are ignored, unknown outputs raise
+    env = fmi_gym(dict(parameter, action_names=['u', 'v']), pyfmi=rc_fmu)
+    env.reset()
+    _, obs, _ = env.rollout(np.column_stack([data['u'].values[:24], np.ones(24)]))
+    assert np.allclose(obs[:, 0], x[1:25])
+    env = fmi_gym(dict(parameter, observation_names=['T_zone', 'T_outdoor']), pyfmi=rc_fmu)
+    with pytest.raises(KeyError):
+        env.reset()
+
+def test_sweep(tmp_path):
+    """
+    Test the scenario sweep, including the skipping of completed scenarios.
+    """
+    pytest.importorskip('pyarrow')
+    matrix = {'fmu_param': {'a': {'fmu_param': {'k': 1}}, 'b': {'fmu_param': {'k': 2}}},
+              'days': [{'fmu_final_time': 24*60*60}, {'fmu_final_time': 2*24*60*60}],
+              'controller': {'off': {}, 'const': {'controller': constant_controller}}}
+    assert len(expand_scenarios(matrix)) == 8
+    parameter = get_mock_parameter(fmu_step_size=60*60, fmu_param={'k': 0})
+    runner = sweep(str(tmp_path), parameter, matrix, pyfmi=mock_fmu, max_workers=2)
+    results = runner.run(log=lambda x: None)
+    assert (results['status'] == 'done').all() and len(results) == 8
+    overview = runner.get_results()
+    assert overview['done'].all()
+    assert sorted(overview['rows'].unique()) == [25, 49]
+    key = overview.query('days == 0 and controller == "const"').index[0]
+    data = runner.load(key)
+    assert np.allclose(data['u0'].iloc[1:], 0.5)
+
+    # Completed scenarios are skipped
+    os.remove(os.path.join(str(tmp_path), key + '.json'))
+    runner = sweep(str(tmp_path), parameter, matrix, pyfmi=mock_fmu, max_workers=2)
+    results = runner.run(log=lambda x: None)
+    assert (results['status'] == 'skipped').sum() == 7
+    assert results.loc[key, 'status'] == 'done'
+
+def test_run_sharded():
+    """
+    Test the sharded run against a sequential run.
+    """
+    parameter = get_mock_parameter(fmu_step_size=60*60, fmu_final_time=4*24*60*60)
+    reference = run_scenario(parameter, controller=constant_controller, pyfmi=mock_fmu)
+    data, seams = run_sharded(parameter, n_shards=4, overlap=24*60*60,
+                              controller=constant_controller, pyfmi=mock_fmu, max_workers=2)
+    assert np.array_equal(data.index.values, reference.index.values)
+    assert list(seams.index) == [24*60*60, 2*24*60*60, 3*24*60*60]
+    assert seams[['y0', 'y1']].max().max() < 1e-2
+    assert np.allclose(data[['y0', 'y1']], reference[['y0', 'y1']], atol=1e-2)
+
+def test_state_feed():
+    """
+    Test the shared memory state feed.
+    """
+    name = 'fmi_gym_test_{}'.format(os.getpid())
+    env = fmi_gym(get_mock_parameter(state_feed=name), pyfmi=mock_fmu)
+    env.reset()
+    reader = state_reader(name)
+    assert reader.names == ['y0', 'y1']
+    assert reader.read()['step'] == 0
+    state, reward, _, _ = env.step([0.5, 0.5])
+    res = reader.read()
+    assert res['step'] == 1 and res['episode'] == 1 and res['time'] == 60*60
+    assert np.array_equal(res['state'], state) and res['reward'] == reward
+    env.rollout()
+    assert reader.read()['step'] == 24
+    reader.close()
+    env.close()
+
+    # Consistent reads from another process while publishing
+    feed = state_feed(name, ['x{}'.format(i) for i in range(1000)])
+    with mp.get_context('spawn').Pool(1) as pool:
+        result = pool.apply_async(read_feed, (name, 20000))
+        while not result.ready():
+            feed.publish(0, np.full(1000, feed.step + 1))
+        assert result.get() == 0
+    feed.close()
+
+def test_checkpoint(tmp_path):
+    """
+    Test periodic checkpoints and resume, with FMU state and with replay.
+    """
+    for handler, numpy_step in [(mock_fmu, False), (mock_fmu, True), (dummy_fmu, False)]:
+        path = str(tmp_path / 'checkpoint.pkl')
+        parameter = get_mock_parameter(fmu_final_time=2*24*60*60, store_data=True,
+                                       numpy_step=numpy_step, checkpoint_path=path,
+                                       checkpoint_interval=8*60*60)
+        if handler is dummy_fmu:
+            parameter.update(get_parameter(fmu_final_time=2*24*60*60))
+        reference = fmi_gym(parameter, pyfmi=handler)
+        states, rewards = run_episode(reference)
+
+        # Crash after 30 hours (last checkpoint after 24 hours)
+        env = fmi_gym(parameter, pyfmi=handler)
+        env.reset()
+        for k in range(30):
+            env.step([np.cos(k), 0.1*k])
+        env = fmi_gym(parameter, pyfmi=handler)
+        state, _ = env.resume()
+        assert env.fmu_time == 24*60*60 and env.episode == 1
+        assert np.allclose(state, states[24])
+        done = False
+        k = 24
+        while not done:
+            state, reward, done, _ = env.step([np.cos(k), 0.1*k])
+            k += 1
+        assert np.allclose(state, states[-1]) and np.isclose(reward, rewards[-1])
+        assert np.allclose(env.data.values, reference.data.values)
+
+    # Checkpoints only write the steps since the last checkpoint
+    env = fmi_gym(parameter, pyfmi=handler)
+    env.reset()
+    sizes = []
+    for k in range(48):
+        env.step([np.cos(k), 0.1*k])
+        if env.fmu_time % (8*60*60) == 0:
+            sizes.append((os.path.getsize(path), os.path.getsize(path + '.log')))
+    sizes = np.array(sizes)
+    assert len(sizes) == 6 and (sizes[:, 0] == sizes[0, 0]).all()
+    assert np.diff(sizes[:, 1]).max() < 2 * sizes[0, 1]
+
+    # A checkpoint of another configuration is rejected without changing the parameter
+    env = fmi_gym(dict(parameter, fmu_param={'p': 2}, fmu_start_time=60*60), pyfmi=handler)
+    with pytest.raises(ValueError):
+        env.resume()
+    assert env.parameter['fmu_start_time'] == 60*60
+
+def get_checkpoint_parameter(path):
+    ''' returns the parameter of test_checkpoint_hash_seed '''
+    return get_mock_parameter(n_inputs=3, n_outputs=4, action_names=['u1'],
+                              observation_names=['y3', 'y0', 'y2', 'y1'],
+                              preprocessor=feedback_preprocessor, numpy_step=True,
+                              fmu_final_time=2*24*60*60, store_data=True,
+                              checkpoint_path=path, checkpoint_interval=8*60*60)
+
+def run_checkpoint_episode(path, steps=None):
+    ''' run an episode with checkpoints, stop after steps '''
+    env = fmi_gym(get_checkpoint_parameter(path),
+                  pyfmi=partial(mock_fmu, n_inputs=3, n_outputs=4))
+    env.reset()
+    done = False
+    k = 0
+    while not done and k != steps:
+        _, reward, done, _ = env.step([np.cos(k)])
+        k += 1
+    return env, reward
+
+def test_checkpoint_hash_seed(tmp_path):
+    """
+    Test resuming checkpoints written by processes with other hash seeds.
+    """
+    path = str(tmp_path / 'checkpoint.pkl')
+    reference, reward = run_checkpoint_episode(str(tmp_path / 'reference.pkl'))
+    assert np.isfinite(reference.data.values[1:]).all()
+    for seed in ['1', '2', '3']:
+        script = 'import sys; sys.path[:0] = [{!r}]; import test_fmi_gym as t; ' \
+            't.run_checkpoint_episode({!r}, 30)'.format(root, path)
+        subprocess.run([sys.executable, '-c', script], check=True, capture_output=True,
+                       env=dict(os.environ, PYTHONHASHSEED=seed))
+        env = fmi_gym(get_checkpoint_parameter(path),
+                      pyfmi=partial(mock_fmu, n_inputs=3, n_outputs=4))
+        env.resume()
+        assert env.fmu_time == 24*60*60
+        done = False
+        k = 24
+        while not done:
+            _, r, done, _ = env.step([np.cos(k)])
+            k += 1
+        assert r == reward
+        assert np.array_equal(env.data.values, reference.data.values, equal_nan=True)